@@ -8,9 +8,265 @@ from matplotlib.figure import Figure
 from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as FigureCanvas
 import re
 import os
+import json
 import sys
 import time
+import shutil
+import tempfile
+import itertools
+from collections import deque
 import numpy as np
+from QZKP_export import stream_export, ExportCancelled
+from QZKP_results import MatchHistogram
+from QZKP_tune import tuned_workers
+
+class ConsoleBuffer:
+    """
+    Console model shared by the simulation thread and the UI. Lines go to a
+    bounded ring buffer and to a spool file holding the full log; the UI takes
+    the pending text in coalesced batches from a timer.
+    """
+    def __init__(self, max_lines=2000):
+        self.lock = threading.Lock()
+        self.lines = deque(maxlen=max_lines)
+        self.pending = []
+        self.pending_lines = 0
+        self.reset = False
+        self.spool = tempfile.TemporaryFile('w+', encoding='utf-8')
+
+    def write(self, text):
+        with self.lock:
+            self.spool.write(text)
+            lines = text.splitlines(keepends=True)
+            self.lines.extend(lines)
+            if self.reset:
+                return
+            self.pending.append(text)
+            self.pending_lines += len(lines)
+            if self.pending_lines > self.lines.maxlen:
+                # Too much to append: the widget is rebuilt from the ring buffer instead
+                self.pending = []
+                self.pending_lines = 0
+                self.reset = True
+
+    def take(self):
+        """
+        Text to show since the last call: (text, replace_widget_content).
+        """
+        with self.lock:
+            if self.reset:
+                text, replace = ''.join(self.lines), True
+            else:
+                text, replace = ''.join(self.pending), False
+            self.pending = []
+            self.pending_lines = 0
+            self.reset = False
+        return text, replace
+
+    def snapshot(self):
+        with self.lock:
+            return ''.join(self.lines)
+
+    def clear(self):
+        with self.lock:
+            self.lines.clear()
+            self.pending = []
+            self.pending_lines = 0
+            self.reset = True
+            self.spool.seek(0)
+            self.spool.truncate()
+
+    def save(self, pathname):
+        with self.lock:
+            self.spool.flush()
+            self.spool.seek(0)
+            with open(pathname, 'w', encoding='utf-8') as f:
+                shutil.copyfileobj(self.spool, f)
+            self.spool.seek(0, os.SEEK_END)
+
+class SimulationJob:
+    """
+    One run of a script in the queue. Its state and progress are written by its
+    reader thread and read by the UI timer; finished iterative runs keep their
+    results in memory for overlay plots.
+    """
+    ids = itertools.count(1)
+
+    def __init__(self, label, command, is_iterative):
+        self.id = next(SimulationJob.ids)
+        self.label = label
+        self.command = command
+        self.is_iterative = is_iterative
+        self.state = 'queued'   # queued, running, done, failed, cancelled
+        self.percent = 0.0
+        self.status = ''
+        self.process = None
+        self.cancelled = False
+        self.start_time = None
+        self.end_time = None
+        self.results_file = None
+        self.results = None   # DataFrame with Iteration, Decision (if any) and Percentages
+
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.time()) - self.start_time
+
+def suffixed(name, suffix):
+    '''
+    name with suffix before its extension, keeping a CSV and its .hist.json sidecar paired.
+    '''
+    for ext in ('.hist.json', '.csv.gz'):
+        if name.endswith(ext):
+            return name[:-len(ext)] + suffix + ext
+    root, ext = os.path.splitext(name)
+    return root + suffix + ext
+
+class JobQueue:
+    """
+    Runs queued jobs as subprocesses, at most `workers` at a time. Each job runs
+    in its own working directory, so concurrent runs with the same file names do
+    not mix; its files are moved to the current directory when it finishes.
+    Job output goes to the shared console prefixed by the job number, and
+    on_finished(job) is called from the job's thread.
+    """
+    def __init__(self, console, on_finished, workers=2):
+        self.console = console
+        self.on_finished = on_finished
+        self.workers = workers
+        self.jobs = []
+        self.lock = threading.Lock()
+
+    def submit(self, job):
+        with self.lock:
+            self.jobs.append(job)
+        self._start_ready()
+
+    def set_workers(self, workers):
+        self.workers = max(1, workers)
+        self._start_ready()
+
+    def cancel(self, job):
+        with self.lock:
+            job.cancelled = True
+            if job.state == 'queued':
+                job.state = 'cancelled'
+            process = job.process
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.cancel(job)
+
+    def remove_finished(self):
+        with self.lock:
+            removed = [job for job in self.jobs if job.state not in ('queued', 'running')]
+            self.jobs = [job for job in self.jobs if job.state in ('queued', 'running')]
+        return removed
+
+    def counts(self):
+        with self.lock:
+            return (sum(job.state == 'running' for job in self.jobs),
+                    sum(job.state == 'queued' for job in self.jobs))
+
+    def _start_ready(self):
+        with self.lock:
+            running = sum(job.state == 'running' for job in self.jobs)
+            ready = [job for job in self.jobs if job.state == 'queued'][:max(0, self.workers - running)]
+            for job in ready:
+                job.state = 'running'
+                job.start_time = time.time()
+        for job in ready:
+            thread = threading.Thread(target=self._run, args=(job,))
+            thread.daemon = True
+            thread.start()
+
+    def _run(self, job):
+        prefix = f"[{job.id}] "
+        workdir = tempfile.mkdtemp(prefix=f"qzkp_job{job.id}_", dir='.')
+        proc_env = os.environ.copy()
+        proc_env["PYTHONUNBUFFERED"] = "1"
+        proc_env["QZKP_PROGRESS"] = "json"
+        kwargs = {'env': proc_env, 'cwd': workdir}
+        if sys.platform != "win32":
+            kwargs['close_fds'] = True
+        try:
+            process = subprocess.Popen(job.command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True, **kwargs)
+        except OSError as e:
+            self.console.write(f"{prefix}Error: {e}\n")
+            self._finish(job, workdir, 'failed')
+            return
+        with self.lock:
+            job.process = process
+            cancelled = job.cancelled
+        if cancelled:
+            process.terminate()
+
+        for line in iter(process.stdout.readline, ''):
+            if line.startswith('{'):
+                try:
+                    if self._handle_event(job, json.loads(line)):
+                        continue
+                except (ValueError, KeyError, TypeError):
+                    pass
+            self.console.write(prefix + line)
+            progress_match = re.search(r'(\d+\.\d+)%', line)
+            if progress_match:
+                job.percent = float(progress_match.group(1))
+        process.wait()
+
+        stderr_output = process.stderr.read()
+        if stderr_output and not job.cancelled:
+            self.console.write(f"\n{prefix}--- ERRORS ---\n{stderr_output}")
+        if job.cancelled:
+            state = 'cancelled'
+        elif process.returncode != 0:
+            state = 'failed'
+        else:
+            state = 'done'
+        self._finish(job, workdir, state)
+
+    def _handle_event(self, job, event):
+        '''
+        Apply a JSON progress event (see QZKP_progress) to the job; False for
+        any other JSON line, which goes to the console.
+        '''
+        if not isinstance(event, dict) or event.get('event') not in ('progress', 'done'):
+            return False
+        eta = f"{event['eta']:.0f}s" if event['eta'] is not None else "--"
+        job.percent = event['percent']
+        job.status = f"{event['iter_per_s']:.1f} it/s, {event['qubits_per_s']:.0f} qubits/s, ETA {eta}"
+        return True
+
+    def _finish(self, job, workdir, state):
+        try:
+            if state == 'done':
+                # Jobs with the same settings write the same names: the job id keeps them apart,
+                # and a counter keeps them from replacing the outputs of an earlier session
+                names = os.listdir(workdir)
+                suffix, n = f"_job{job.id}", 1
+                while any(os.path.exists(suffixed(name, suffix)) for name in names):
+                    n += 1
+                    suffix = f"_job{job.id}-{n}"
+                for name in names:
+                    target = suffixed(name, suffix)
+                    os.replace(os.path.join(workdir, name), target)
+                    if target.endswith('.csv'):
+                        job.results_file = target
+                if job.is_iterative and job.results_file:
+                    job.results = pd.read_csv(job.results_file, usecols=lambda c: c in ('Iteration', 'Decision', 'Percentages'))
+                job.percent = 100.0
+        except Exception as e:
+            self.console.write(f"[{job.id}] Error collecting results: {e}\n")
+            state = 'failed'
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        with self.lock:
+            job.state = state
+            job.end_time = time.time()
+        self.on_finished(job)
+        self._start_ready()
 
 class MainFrame(wx.Frame):
     """
@@ -26,11 +282,21 @@ class MainFrame(wx.Frame):
             "3. Damping Noise (Iterative)": "QZKP_noise_damping.py",
             "4. Flip Noise (Iterative)": "QZKP_noise_flip.py"
         }
-        self.start_time = 0
         self.latest_results_file = None
+        self.export_cancel = threading.Event()
 
         self.update_timer = wx.Timer(self)
         self.Bind(wx.EVT_TIMER, self.on_update_timer, self.update_timer)
+        self.update_timer.Start(250)
+
+        self.console = ConsoleBuffer()
+        self.job_queue = JobQueue(self.console, lambda job: wx.CallAfter(self._on_job_finished, job),
+                                  workers=tuned_workers() or max(1, (os.cpu_count() or 2) // 2))
+        self.job_rows = {}
+        self.console_lines_shown = 0
+        self.console_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_console_timer, self.console_timer)
+        self.console_timer.Start(100)
 
         self.CreateStatusBar()
         self.SetStatusText("Ready")
@@ -43,6 +309,7 @@ class MainFrame(wx.Frame):
         main_sizer.Add(output_panel, 3, wx.EXPAND | wx.ALL, 10)
         main_panel.SetSizer(main_sizer)
         
+        self.Bind(wx.EVT_CLOSE, self.on_close)
         self.on_script_select(None)
         self.Centre()
         self.Show()
@@ -78,7 +345,7 @@ class MainFrame(wx.Frame):
         progress_labels_sizer.Add(self.time_label, 0, wx.ALIGN_CENTER_VERTICAL)
         top_sizer.Add(progress_labels_sizer, 0, wx.EXPAND | wx.TOP, 5 | wx.LEFT | wx.RIGHT, 2)
         
-        self.run_button = wx.Button(self.control_panel, label="▶ Run Simulation")
+        self.run_button = wx.Button(self.control_panel, label="▶ Queue Simulation")
         self.progress_bar = wx.Gauge(self.control_panel, range=100, style=wx.GA_HORIZONTAL)
         top_sizer.Add(self.run_button, 0, wx.EXPAND | wx.TOP, 5)
         top_sizer.Add(self.progress_bar, 0, wx.EXPAND | wx.TOP, 5)
@@ -97,18 +364,27 @@ class MainFrame(wx.Frame):
         self.plot_format_choice.SetSelection(0)
         save_plot_button = wx.Button(parent, label="Save Plot...")
         data_format_label = wx.StaticText(parent, label="Data Format:")
-        self.data_format_choice = wx.Choice(parent, choices=['CSV (*.csv)', 'JSON (*.json)', 'Excel (*.xlsx)'])
+        self.data_format_choice = wx.Choice(parent, choices=['CSV (*.csv)', 'CSV-gzip (*.csv.gz)', 'JSON (*.json)', 'Excel (*.xlsx)', 'Parquet (*.parquet)'])
         self.data_format_choice.SetSelection(0)
-        save_data_button = wx.Button(parent, label="Save Data...")
+        self.save_data_button = wx.Button(parent, label="Save Data...")
         grid_sizer.Add(plot_format_label, 0, wx.ALIGN_CENTER_VERTICAL|wx.LEFT, 5)
         grid_sizer.Add(self.plot_format_choice, 1, wx.EXPAND)
         grid_sizer.Add(save_plot_button, 0)
         grid_sizer.Add(data_format_label, 0, wx.ALIGN_CENTER_VERTICAL|wx.LEFT, 5)
         grid_sizer.Add(self.data_format_choice, 1, wx.EXPAND)
-        grid_sizer.Add(save_data_button, 0)
+        grid_sizer.Add(self.save_data_button, 0)
         sizer.Add(grid_sizer, 1, wx.EXPAND | wx.ALL, 5)
+        self.export_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        self.export_gauge = wx.Gauge(parent, range=100, style=wx.GA_HORIZONTAL)
+        self.cancel_export_button = wx.Button(parent, label="Cancel")
+        self.export_sizer.Add(self.export_gauge, 1, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
+        self.export_sizer.Add(self.cancel_export_button, 0)
+        sizer.Add(self.export_sizer, 0, wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, 5)
+        sizer.Hide(self.export_sizer, recursive=True)
+        self.save_box_sizer = sizer
         self.Bind(wx.EVT_BUTTON, self.on_save_plot, save_plot_button)
-        self.Bind(wx.EVT_BUTTON, self.on_save_data, save_data_button)
+        self.Bind(wx.EVT_BUTTON, self.on_save_data, self.save_data_button)
+        self.Bind(wx.EVT_BUTTON, self.on_cancel_export, self.cancel_export_button)
 
     def _create_param_panels(self, parent):
         self.param_panels = {}
@@ -228,9 +504,84 @@ class MainFrame(wx.Frame):
         self.output_book.AddPage(plot_page, "plot")
         self.output_book.AddPage(console_page, "console")
         sizer.Add(self.output_book, 1, wx.EXPAND)
+        sizer.Add(self._create_queue_panel(output_panel), 0, wx.EXPAND | wx.TOP, 10)
         output_panel.SetSizer(sizer)
         return output_panel
 
+    def _create_queue_panel(self, parent):
+        queue_box = wx.StaticBox(parent, label="Run Queue")
+        sizer = wx.StaticBoxSizer(queue_box, wx.VERTICAL)
+        header_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        workers_label = wx.StaticText(queue_box, label="Concurrent jobs:")
+        self.workers_ctrl = wx.SpinCtrl(queue_box, min=1, max=max(1, os.cpu_count() or 1), initial=self.job_queue.workers)
+        clear_button = wx.Button(queue_box, label="Clear Finished")
+        header_sizer.Add(workers_label, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
+        header_sizer.Add(self.workers_ctrl, 0, wx.ALIGN_CENTER_VERTICAL)
+        header_sizer.AddStretchSpacer(prop=1)
+        header_sizer.Add(clear_button, 0)
+        sizer.Add(header_sizer, 0, wx.EXPAND | wx.ALL, 5)
+
+        # One row per job: label, progress, state, overlay checkbox, cancel button
+        self.jobs_window = wx.ScrolledWindow(queue_box, size=(-1, 150), style=wx.VSCROLL)
+        self.jobs_window.SetScrollRate(0, 10)
+        self.jobs_sizer = wx.FlexGridSizer(0, 5, 4, 8)
+        self.jobs_sizer.AddGrowableCol(1, 1)
+        self.jobs_window.SetSizer(self.jobs_sizer)
+        sizer.Add(self.jobs_window, 1, wx.EXPAND | wx.ALL, 5)
+
+        self.Bind(wx.EVT_SPINCTRL, lambda event: self.job_queue.set_workers(self.workers_ctrl.GetValue()), self.workers_ctrl)
+        self.Bind(wx.EVT_BUTTON, self.on_clear_finished, clear_button)
+        return sizer
+
+    def _add_job_row(self, job):
+        window = self.jobs_window
+        label = wx.StaticText(window, label=f"#{job.id}  {job.label}")
+        gauge = wx.Gauge(window, range=100, style=wx.GA_HORIZONTAL)
+        state = wx.StaticText(window, label="queued")
+        plot_check = wx.CheckBox(window, label="Plot")
+        plot_check.Disable()
+        cancel_button = wx.Button(window, label="Cancel", style=wx.BU_EXACTFIT)
+        for widget in (label, gauge, state, plot_check, cancel_button):
+            self.jobs_sizer.Add(widget, 0, wx.EXPAND if widget is gauge else wx.ALIGN_CENTER_VERTICAL)
+        plot_check.Bind(wx.EVT_CHECKBOX, self.on_overlay_change)
+        cancel_button.Bind(wx.EVT_BUTTON, lambda event: self.job_queue.cancel(job))
+        self.job_rows[job.id] = (job, (label, gauge, state, plot_check, cancel_button))
+        window.FitInside()
+        window.Layout()
+        window.Scroll(0, window.GetVirtualSize()[1])
+
+    def _refresh_job_rows(self):
+        for job, (label, gauge, state, plot_check, cancel_button) in self.job_rows.values():
+            gauge.SetValue(int(job.percent))
+            if job.state == 'running':
+                state.SetLabel(f"{job.percent:.1f}%  {job.elapsed():.0f}s")
+            elif job.state == 'queued':
+                state.SetLabel("queued")
+            else:
+                state.SetLabel(f"{job.state}  {job.elapsed():.0f}s")
+            state.SetToolTip(job.status)
+            cancel_button.Enable(job.state in ('queued', 'running'))
+            plot_check.Enable(job.results is not None)
+
+    def _checked_jobs(self):
+        return [job for job, widgets in self.job_rows.values() if widgets[3].IsChecked() and job.results is not None]
+
+    def on_clear_finished(self, event):
+        for job in self.job_queue.remove_finished():
+            _, widgets = self.job_rows.pop(job.id)
+            for widget in widgets:
+                widget.Destroy()
+        self.jobs_window.FitInside()
+        self.jobs_window.Layout()
+        self.on_overlay_change(None)
+
+    def on_overlay_change(self, event):
+        checked = self._checked_jobs()
+        if checked:
+            self.plot_overlay(checked)
+        elif self.latest_results_file and os.path.exists(self.latest_results_file):
+            self.plot_data(self.latest_results_file)
+
     def _create_plot_page(self, parent):
         plot_panel = wx.Panel(parent)
         sizer = wx.BoxSizer(wx.VERTICAL)
@@ -258,12 +609,29 @@ class MainFrame(wx.Frame):
         sizer.Add(save_log_button, 0, wx.ALL | wx.ALIGN_RIGHT, 5)
         self.Bind(wx.EVT_BUTTON, self.on_save_console, save_log_button)
         console_panel.SetSizer(sizer)
-        self.console_output.AppendText("Welcome to the Quantum Simulator.\nSelect a script and press 'Run'.\n")
+        self.console.write("Welcome to the Quantum Simulator.\nSelect a script and press 'Run'.\n")
         return console_panel
 
+    def on_console_timer(self, event):
+        text, replace = self.console.take()
+        if replace:
+            self.console_output.SetValue(text)
+            self.console_lines_shown = text.count('\n')
+        elif text:
+            self.console_lines_shown += text.count('\n')
+            if self.console_lines_shown > 2 * self.console.lines.maxlen:
+                # Trim the widget back to the ring buffer
+                self.console_output.SetValue(self.console.snapshot())
+                self.console_lines_shown = self.console.lines.maxlen
+            else:
+                self.console_output.AppendText(text)
+
+    def log(self, text):
+        self.console.write(text)
+        self.on_console_timer(None)
+
     def on_plot_type_change(self, event):
-        if self.latest_results_file:
-            self.plot_data(self.latest_results_file)
+        self.on_overlay_change(None)
 
     def on_save_plot(self, event):
         selection = self.plot_format_choice.GetStringSelection()
@@ -289,152 +657,184 @@ class MainFrame(wx.Frame):
         with wx.FileDialog(self, "Save data as...", wildcard=wildcard, style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as fileDialog:
             if fileDialog.ShowModal() == wx.ID_CANCEL: return
             pathname = fileDialog.GetPath()
-            try:
-                df = pd.read_csv(self.latest_results_file)
-                if file_ext == 'csv':
-                    df.to_csv(pathname, index=False)
-                elif file_ext == 'json':
-                    df.to_json(pathname, orient='records', indent=4)
-                elif file_ext == 'xlsx':
-                    df.to_excel(pathname, index=False)
-                self.SetStatusText(f"Data saved to: {pathname}")
-            except Exception as e:
-                self.SetStatusText(f"Error saving data: {e}")
-                wx.MessageBox(f"Could not save data to '{pathname}'.\nError: {e}", "Error", wx.OK | wx.ICON_ERROR)
+        self.export_cancel.clear()
+        self.save_data_button.Disable()
+        self.export_gauge.SetValue(0)
+        self.save_box_sizer.Show(self.export_sizer, recursive=True)
+        self.control_panel.Layout()
+        self.SetStatusText(f"Saving data to: {pathname}...")
+        thread = threading.Thread(target=self._run_export_thread, args=(self.latest_results_file, pathname, file_ext))
+        thread.daemon = True
+        thread.start()
+
+    def _run_export_thread(self, results_file, pathname, file_ext):
+        last_percent = [-1]
+        def progress(done, total):
+            percent = int(100 * done / total) if total else 100
+            if percent != last_percent[0]:
+                last_percent[0] = percent
+                wx.CallAfter(self.export_gauge.SetValue, percent)
+        try:
+            rows = stream_export(results_file, pathname, file_ext, progress=progress, cancelled=self.export_cancel.is_set)
+            wx.CallAfter(self._on_export_finished, f"Data saved to: {pathname} ({rows} rows)")
+        except ExportCancelled:
+            wx.CallAfter(self._on_export_finished, "Data export cancelled.")
+        except Exception as e:
+            wx.CallAfter(self._on_export_finished, f"Error saving data: {e}")
+            wx.CallAfter(wx.MessageBox, f"Could not save data to '{pathname}'.\nError: {e}", "Error", wx.OK | wx.ICON_ERROR)
+
+    def _on_export_finished(self, status):
+        self.save_box_sizer.Hide(self.export_sizer, recursive=True)
+        self.control_panel.Layout()
+        self.save_data_button.Enable()
+        self.SetStatusText(status)
+
+    def on_cancel_export(self, event):
+        self.export_cancel.set()
     
     def on_save_console(self, event):
         with wx.FileDialog(self, "Save console log as...", wildcard="Text files (*.txt)|*.txt", style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as fileDialog:
             if fileDialog.ShowModal() == wx.ID_CANCEL: return
             pathname = fileDialog.GetPath()
             try:
-                content = self.console_output.GetValue()
-                with open(pathname, 'w', encoding='utf-8') as f:
-                    f.write(content)
+                self.console.save(pathname)
                 self.SetStatusText(f"Console log saved to: {pathname}")
             except Exception as e:
                 self.SetStatusText(f"Error saving log: {e}")
                 wx.MessageBox(f"Could not save log to '{pathname}'.\nError: {e}", "Error", wx.OK | wx.ICON_ERROR)
 
     def on_update_timer(self, event):
-        if self.start_time > 0:
-            elapsed_seconds = time.time() - self.start_time
-            self.time_label.SetLabel(f"Elapsed: {elapsed_seconds:.1f}s")
+        self._refresh_job_rows()
+        running, queued = self.job_queue.counts()
+        active = [job for job, _ in self.job_rows.values() if job.state == 'running']
+        if active:
+            percent = sum(job.percent for job in active) / len(active)
+            self.progress_bar.SetValue(int(percent))
+            self.percent_label.SetLabel(f"{percent:.1f}%")
+            self.time_label.SetLabel(f"{running} running, {queued} queued")
+            if len(active) == 1 and active[0].status:
+                self.SetStatusText(f"Running job #{active[0].id}... {active[0].status}")
+            else:
+                self.SetStatusText(f"Running {running} jobs...")
+        elif self.time_label.GetLabel().endswith("queued"):
+            self.time_label.SetLabel("")
+            self.percent_label.SetLabel("")
+            self.progress_bar.SetValue(0)
+
+    def _build_command(self, script_name):
+        """
+        Command line and queue label of the selected script with the current parameters.
+        Raises ValueError for invalid parameters.
+        """
+        script_file = self.scripts[script_name]
+        active_controls = self.panel_controls[script_name]
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        full_script_path = os.path.join(script_dir, script_file)
+        command = [sys.executable, "-u", full_script_path]
+        key_length = active_controls['key'].GetValue()
+        if not key_length.isdigit() or int(key_length) == 0: raise ValueError("Key length must be a positive integer")
+        command.append(key_length)
+        label = f"{script_name.split(' (')[0][3:]}: key {key_length}"
+        if "Iterative" in script_name:
+            num_iter = active_controls['iter'].GetValue()
+            if not num_iter.isdigit() or int(num_iter) == 0: raise ValueError("No. of iterations must be a positive integer")
+            command.append(num_iter)
+            label += f", {num_iter} it."
+            if "Damping" in script_name:
+                command.append(f"{active_controls['gamma'].GetValue() / 100:.4f}")
+                command.append(f"{active_controls['lam'].GetValue() / 100:.4f}")
+                command.append(str(active_controls['attacker'].GetValue()))
+                label += f", gamma {command[-3]}, lambda {command[-2]}"
+            elif "Flip" in script_name:
+                command.append(f"{active_controls['pbit'].GetValue() / 100:.4f}")
+                command.append(f"{active_controls['pphase'].GetValue() / 100:.4f}")
+                command.append(str(active_controls['attacker'].GetValue()))
+                label += f", pbit {command[-3]}, pphase {command[-2]}"
+            if 'attacker' in active_controls and not active_controls['attacker'].GetValue():
+                label += ", no attacker"
+        elif "Basic" in script_name:
+            command.append("v")
+        return command, label
 
     def on_run_simulation(self, event):
-        self.run_button.Disable()
-        self.run_button.SetLabel("Running...")
-        self.SetStatusText("Running simulation...")
-        self.progress_bar.SetValue(0)
-        self.percent_label.SetLabel("0.0%")
-        self.time_label.SetLabel("Elapsed: 0.0s")
-        self.control_panel.Layout()
-        
-        self.console_output.Clear()
-        self.console_output.AppendText("Starting simulation...\n\n")
-        
-        self.start_time = time.time()
-        self.update_timer.Start(100)
-        
-        thread = threading.Thread(target=self._run_simulation_thread)
-        thread.daemon = True
-        thread.start()
-
-    def _run_simulation_thread(self):
         script_name = self.script_selector.GetStringSelection()
-        script_file = self.scripts[script_name]
-        active_controls = self.panel_controls[script_name]
         try:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            full_script_path = os.path.join(script_dir, script_file)
-            command = [sys.executable, "-u", full_script_path]
-            key_length = active_controls['key'].GetValue()
-            if not key_length.isdigit() or int(key_length) == 0: raise ValueError("Key length must be a positive integer")
-            command.append(key_length)
-            is_iterative = "Iterative" in script_name
-            if is_iterative:
-                num_iter = active_controls['iter'].GetValue()
-                if not num_iter.isdigit() or int(num_iter) == 0: raise ValueError("No. of iterations must be a positive integer")
-                command.append(num_iter)
-                if "Damping" in script_name:
-                    command.append(f"{active_controls['gamma'].GetValue() / 100:.4f}")
-                    command.append(f"{active_controls['lam'].GetValue() / 100:.4f}")
-                    command.append(str(active_controls['attacker'].GetValue()))
-                elif "Flip" in script_name:
-                    command.append(f"{active_controls['pbit'].GetValue() / 100:.4f}")
-                    command.append(f"{active_controls['pphase'].GetValue() / 100:.4f}")
-                    command.append(str(active_controls['attacker'].GetValue()))
-            elif "Basic" in script_name:
-                command.append("v")
+            command, label = self._build_command(script_name)
         except (ValueError, KeyError) as e:
-            wx.CallAfter(self.update_timer.Stop)
-            wx.CallAfter(self.SetStatusText, f"Parameter error: {e}")
-            wx.CallAfter(self.console_output.AppendText, f"Error: {e}\n")
-            wx.CallAfter(self.run_button.Enable)
-            wx.CallAfter(self.run_button.SetLabel, "▶ Run Simulation")
+            self.SetStatusText(f"Parameter error: {e}")
+            self.log(f"Error: {e}\n")
             return
-        
-        proc_env = os.environ.copy()
-        proc_env["PYTHONUNBUFFERED"] = "1"
-        
-        kwargs = {'env': proc_env}
-        if sys.platform != "win32":
-            kwargs['close_fds'] = True
-        
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True, **kwargs)
-        
-        for line in iter(process.stdout.readline, ''):
-            wx.CallAfter(self.console_output.AppendText, line)
-            
-            progress_match = re.search(r'(\d+\.\d+)%', line)
-            if progress_match:
-                percent_str = progress_match.group(1)
-                wx.CallAfter(self.progress_bar.SetValue, int(float(percent_str)))
-                wx.CallAfter(self.percent_label.SetLabel, f"{percent_str}%")
-        
-        process.wait()
-        
-        wx.CallAfter(self.update_timer.Stop)
-        total_time = time.time() - self.start_time
-        
-        stderr_output = process.stderr.read()
-        if stderr_output:
-            wx.CallAfter(self.console_output.AppendText, f"\n--- ERRORS ---\n{stderr_output}")
-        
-        wx.CallAfter(self.SetStatusText, "Simulation finished. Ready.")
-        wx.CallAfter(self.run_button.Enable)
-        wx.CallAfter(self.run_button.SetLabel, "▶ Run Simulation")
-        
-        if is_iterative:
-            wx.CallAfter(self.progress_bar.SetValue, 100)
-            wx.CallAfter(self.percent_label.SetLabel, "100.0%")
-            wx.CallAfter(self.time_label.SetLabel, f"Total time: {total_time:.1f}s")
-            wx.CallAfter(self.find_and_plot_results)
+        job = SimulationJob(label, command, "Iterative" in script_name)
+        self._add_job_row(job)
+        self.job_queue.submit(job)
+        self.log(f"[{job.id}] Queued {label}\n")
+        self.SetStatusText(f"Job #{job.id} queued.")
+
+    def _on_job_finished(self, job):
+        self._refresh_job_rows()
+        self.on_console_timer(None)
+        if self.job_queue.counts() == (0, 0):
+            self.progress_bar.SetValue(100 if job.state == 'done' else 0)
+            self.percent_label.SetLabel("100.0%" if job.state == 'done' else "")
+            self.time_label.SetLabel(f"Total time: {job.elapsed():.1f}s")
+        if job.state != 'done':
+            self.log(f"[{job.id}] {job.state.capitalize()} after {job.elapsed():.1f}s\n")
+            self.SetStatusText(f"Job #{job.id} {job.state}.")
+            return
+        self.log(f"[{job.id}] Finished in {job.elapsed():.1f}s\n")
+        self.SetStatusText(f"Job #{job.id} finished.")
+        if job.results is not None:
+            self.latest_results_file = job.results_file
+            if not self._checked_jobs():
+                self.log(f"Plotting results from: {job.results_file}\n")
+                try:
+                    self.plot_data(job.results_file)
+                except Exception as e:
+                    self.log(f"Error plotting results: {e}\n")
+                    self.SetStatusText(f"Error plotting: {e}")
+
+    def on_close(self, event):
+        self.job_queue.cancel_all()
+        event.Skip()
+
+    def plot_overlay(self, jobs):
+        """
+        Results of several finished jobs on one figure, from their in-memory results.
+        """
+        self.ax.clear()
+        plot_type = self.plot_type_choice.GetStringSelection()
+        colors = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+        for k, job in enumerate(jobs):
+            df, color = job.results, colors[k % len(colors)]
+            if 'Decision' in df.columns:
+                groups = [(f"#{job.id} honest", df['Decision'] == 0, 'o', '-'), (f"#{job.id} dishonest", df['Decision'] == 1, 'x', '--')]
+            else:
+                groups = [(f"#{job.id}", np.ones(len(df), dtype=bool), 'o', '-')]
+            for label, mask, marker, linestyle in groups:
+                if plot_type == "Scatter Plot":
+                    self.ax.scatter(df['Iteration'][mask], df['Percentages'][mask], label=label, color=color, marker=marker, alpha=0.6, s=15)
+                else:
+                    percs, counts = np.unique(df['Percentages'][mask], return_counts=True)
+                    self.ax.plot(percs, counts, label=label, color=color, linestyle=linestyle, marker=marker, markersize=4)
+        if plot_type == "Scatter Plot":
+            self.ax.set_title('Success Rate per Iteration')
+            self.ax.set_xlabel('Iteration')
+            self.ax.set_ylabel('Success Rate (%)')
         else:
-             wx.CallAfter(self.progress_bar.SetValue, 0)
-             wx.CallAfter(self.percent_label.SetLabel, "")
-             wx.CallAfter(self.time_label.SetLabel, "")
-
-    def find_and_plot_results(self):
-        try:
-            files = [f for f in os.listdir('.') if f.endswith('.csv')]
-            if not files:
-                self.console_output.AppendText("No results CSV file found.\n")
-                return
-            latest_file = max(files, key=os.path.getctime)
-            self.latest_results_file = latest_file
-            self.console_output.AppendText(f"Plotting results from: {latest_file}\n")
-            self.plot_data(latest_file)
-        except Exception as e:
-            self.console_output.AppendText(f"Error plotting results: {e}\n")
-            self.SetStatusText(f"Error plotting: {e}")
+            self.ax.set_title('Frequency of Success Rates')
+            self.ax.set_xlabel('Success Rate (%)')
+            self.ax.set_ylabel('Frequency')
+        self.ax.legend(fontsize='small')
+        self.ax.grid(True, linestyle='--', alpha=0.6)
+        self.canvas.draw()
 
     def plot_data(self, csv_file):
-        df = pd.read_csv(csv_file)
         self.ax.clear()
 
         plot_type = self.plot_type_choice.GetStringSelection()
 
         if plot_type == "Scatter Plot":
+            df = pd.read_csv(csv_file)
             if 'Decision' in df.columns:
                 honest_df = df[df['Decision'] == 0]
                 dishonest_df = df[df['Decision'] == 1]
@@ -451,25 +851,29 @@ class MainFrame(wx.Frame):
             self.ax.set_ylim(min_y, max_y)
 
         elif plot_type == "Bar Chart":
-            if 'Decision' in df.columns:
-                honest_data = df[df['Decision'] == 0]['Percentages']
-                dishonest_data = df[df['Decision'] == 1]['Percentages']
-                
-                honest_counts = honest_data.value_counts()
-                dishonest_counts = dishonest_data.value_counts()
-
-                all_percs = sorted(list(set(honest_counts.index) | set(dishonest_counts.index)))
-                
-                honest_heights = [honest_counts.get(p, 0) for p in all_percs]
-                dishonest_heights = [dishonest_counts.get(p, 0) for p in all_percs]
-                 
-                self.ax.bar(all_percs, honest_heights, color='#3498db', label='Honest', width=0.4)
-                self.ax.bar(all_percs, dishonest_heights, bottom=honest_heights, color='#e74c3c', label='Dishonest', width=0.4)
+            histogram = MatchHistogram.load(csv_file)
+            if histogram is not None:
+                percs, groups = histogram.table()
+            else:
+                # No up-to-date histogram sidecar: count the rows
+                df = pd.read_csv(csv_file)
+                labels = df['Decision'] if 'Decision' in df.columns else pd.Series(1, index=df.index)
+                table = pd.crosstab(df['Percentages'], labels)
+                percs, groups = table.index.to_numpy(), {label: table[label].to_numpy() for label in table.columns}
+
+            if 0 in groups:
+                honest_heights = groups[0]
+                dishonest_heights = groups.get(1, np.zeros(len(percs), dtype=int))
+                shown = (honest_heights + dishonest_heights) > 0
+
+                self.ax.bar(percs[shown], honest_heights[shown], color='#3498db', label='Honest', width=0.4)
+                self.ax.bar(percs[shown], dishonest_heights[shown], bottom=honest_heights[shown], color='#e74c3c', label='Dishonest', width=0.4)
 
                 self.ax.legend()
             else:
-                counts = df['Percentages'].value_counts()
-                self.ax.bar(counts.index, counts.values, color='#e74c3c', width=0.4)
+                counts = sum(groups.values())
+                shown = counts > 0
+                self.ax.bar(percs[shown], counts[shown], color='#e74c3c', width=0.4)
             self.ax.set_title('Frequency of Success Rates')
             self.ax.set_xlabel('Success Rate (%)')
             self.ax.set_ylabel('Frequency')
@@ -0,0 +1,181 @@
+from QZKP_results import MatchHistogram
+from scipy.stats import beta
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+#----------------------------------------
+# Reading results
+#----------------------------------------
+# Match percentages only take key_length + 1 distinct values, so a result file
+# is reduced chunk by chunk to one histogram (values, counts) per group: the
+# Decision of the iterative scripts, the Strategy of QZKP_attacks.py, or a
+# single dishonest group for QZKP_attack_ideal.py. All statistics below work
+# on these histograms, so memory does not grow with the number of iterations.
+# When the run left an up-to-date histogram sidecar, it is used directly.
+HONEST, DISHONEST = 0, 1
+
+def _merge(groups, keys, percentages):
+    # A round that lost every qubit (QZKP_loss) has no percentage and is skipped, as in the sidecar
+    scored = ~np.isnan(percentages)
+    keys, percentages = keys[scored], percentages[scored]
+    for key in np.unique(keys):
+        values, counts = np.unique(percentages[keys == key], return_counts=True)
+        groups.setdefault(key.item() if hasattr(key, 'item') else key, []).append((values, counts))
+
+def _collapse(parts):
+    values = np.concatenate([v for v, _ in parts])
+    counts = np.concatenate([c for _, c in parts])
+    values, inverse = np.unique(values, return_inverse=True)
+    return values, np.bincount(inverse, weights=counts).astype(np.int64)
+
+def load_histograms(path, chunksize=1 << 20):
+    '''
+    Histograms {group: (values, counts)} of a results file: CSV (read in chunks)
+    or .npy (memory-mapped; a plain array of percentages or a structured array
+    with 'Decision' and 'Percentages' fields), or its histogram sidecar.
+    '''
+    sidecar = None if path.endswith('.npy') else MatchHistogram.load(path)
+    if sidecar:
+        return {group: sidecar.histogram(group) for group in sidecar.groups}
+    groups = {}
+    if path.endswith('.npy'):
+        data = np.load(path, mmap_mode='r')
+        for start in range(0, len(data), chunksize):
+            chunk = data[start:start + chunksize]
+            if chunk.dtype.names:
+                _merge(groups, np.asarray(chunk['Decision']), np.asarray(chunk['Percentages']))
+            else:
+                _merge(groups, np.full(len(chunk), DISHONEST), np.asarray(chunk))
+    else:
+        columns = pd.read_csv(path, nrows=0).columns
+        key = 'Decision' if 'Decision' in columns else 'Strategy' if 'Strategy' in columns else None
+        usecols = ['Percentages'] + ([key] if key else [])
+        for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize, float_precision='round_trip'):
+            percentages = chunk['Percentages'].to_numpy(dtype=float)
+            keys = chunk[key].to_numpy() if key else np.full(len(chunk), DISHONEST)
+            _merge(groups, keys, percentages)
+    return {key: _collapse(parts) for key, parts in groups.items()}
+
+#----------------------------------------
+# Acceptance rates and intervals
+#----------------------------------------
+def accepted(values, counts, thresholds):
+    '''
+    Number of iterations with a match percentage >= each threshold.
+    '''
+    above = np.concatenate([np.cumsum(counts[::-1])[::-1], [0]])
+    return above[np.searchsorted(values, np.asarray(thresholds, dtype=float), side='left')]
+
+def clopper_pearson(k, n, alpha):
+    '''
+    Exact binomial interval for k successes out of n.
+    '''
+    k, n = np.asarray(k, dtype=float), np.asarray(n, dtype=float)
+    with np.errstate(invalid='ignore'):
+        low = np.where(k > 0, beta.ppf(alpha / 2, k, n - k + 1), 0.0)
+        high = np.where(k < n, beta.ppf(1 - alpha / 2, k + 1, n - k), 1.0)
+    return low, high
+
+def hoeffding(k, n, alpha):
+    '''
+    Distribution-free finite-sample interval: p +- sqrt(ln(2/alpha) / 2n).
+    '''
+    p = np.asarray(k, dtype=float) / n
+    eps = np.sqrt(np.log(2 / alpha) / (2 * np.asarray(n, dtype=float)))
+    return np.clip(p - eps, 0, 1), np.clip(p + eps, 0, 1)
+
+def bootstrap(k, n, alpha, resamples=10000, rng=None):
+    '''
+    Percentile bootstrap interval of a rate. Resampling n Bernoulli outcomes
+    with k successes is drawing Binomial(n, k/n), so no per-iteration data is needed.
+    '''
+    rng = rng or np.random.default_rng()
+    k = np.asarray(k)
+    draws = rng.binomial(n, k[..., None] / n, size=k.shape + (resamples,)) / n
+    return np.quantile(draws, alpha / 2, axis=-1), np.quantile(draws, 1 - alpha / 2, axis=-1)
+
+def gap_intervals(k0, n0, k1, n1, alpha, resamples=10000, rng=None):
+    '''
+    Intervals of the gap rate0 - rate1 between two independent groups, per method.
+    '''
+    rng = rng or np.random.default_rng()
+    k0, k1 = np.asarray(k0), np.asarray(k1)
+    low0, high0 = clopper_pearson(k0, n0, alpha / 2)
+    low1, high1 = clopper_pearson(k1, n1, alpha / 2)
+    gap = k0 / n0 - k1 / n1
+    eps = np.sqrt(np.log(2 / alpha) * (1 / n0 + 1 / n1) / 2)
+    draws = (rng.binomial(n0, k0[..., None] / n0, size=k0.shape + (resamples,)) / n0
+             - rng.binomial(n1, k1[..., None] / n1, size=k1.shape + (resamples,)) / n1)
+    return {
+        'clopper-pearson': (low0 - high1, high0 - low1),
+        'hoeffding': (np.clip(gap - eps, -1, 1), np.clip(gap + eps, -1, 1)),
+        'bootstrap': (np.quantile(draws, alpha / 2, axis=-1), np.quantile(draws, 1 - alpha / 2, axis=-1)),
+    }
+
+def mean_interval(values, counts, alpha, resamples=10000, rng=None):
+    '''
+    Mean match percentage and its bootstrap interval, resampling the histogram multinomially.
+    '''
+    rng = rng or np.random.default_rng()
+    n = counts.sum()
+    draws = rng.multinomial(n, counts / n, size=resamples) @ values / n
+    return values @ counts / n, np.quantile(draws, alpha / 2), np.quantile(draws, 1 - alpha / 2)
+
+#----------------------------------------
+# Summary
+#----------------------------------------
+METHODS = ('clopper-pearson', 'hoeffding', 'bootstrap')
+
+def summarize(histograms, thresholds, confidence=0.95, resamples=10000, rng=None):
+    '''
+    Acceptance rate intervals of every group (and of the honest - dishonest gap
+    when both are present) for every threshold, plus bootstrap intervals of the
+    mean match percentage. Returns (rates, means) DataFrames.
+    '''
+    rng = rng or np.random.default_rng()
+    alpha = 1 - confidence
+    thresholds = np.asarray(thresholds, dtype=float)
+    rows, means, k = [], [], {}
+    for group, (values, counts) in histograms.items():
+        n = counts.sum()
+        k[group] = accepted(values, counts, thresholds)
+        intervals = {
+            'clopper-pearson': clopper_pearson(k[group], n, alpha),
+            'hoeffding': hoeffding(k[group], n, alpha),
+            'bootstrap': bootstrap(k[group], n, alpha, resamples, rng),
+        }
+        for method in METHODS:
+            low, high = intervals[method]
+            for j, threshold in enumerate(thresholds):
+                rows.append((group, threshold, method, n, k[group][j] / n, low[j], high[j]))
+        means.append((group, n, *mean_interval(values, counts, alpha, resamples, rng)))
+    if HONEST in histograms and DISHONEST in histograms:
+        n0, n1 = histograms[HONEST][1].sum(), histograms[DISHONEST][1].sum()
+        intervals = gap_intervals(k[HONEST], n0, k[DISHONEST], n1, alpha, resamples, rng)
+        for method in METHODS:
+            low, high = intervals[method]
+            for j, threshold in enumerate(thresholds):
+                rate = k[HONEST][j] / n0 - k[DISHONEST][j] / n1
+                rows.append(('gap', threshold, method, n0 + n1, rate, low[j], high[j]))
+    rates = pd.DataFrame(rows, columns=['Group', 'Threshold', 'Method', 'Iterations', 'Rate', 'Low', 'High'])
+    means = pd.DataFrame(means, columns=['Group', 'Iterations', 'Mean', 'Low', 'High'])
+    return rates, means
+
+#----------------------------------------
+# Execution
+#----------------------------------------
+if __name__=='__main__':
+
+    path = sys.argv[1]
+    thresholds = [float(t) for t in sys.argv[2].split(',')] if len(sys.argv) > 2 else [100.0]
+    confidence = float(sys.argv[3]) if len(sys.argv) > 3 else 0.95
+    resamples = int(sys.argv[4]) if len(sys.argv) > 4 else 10000
+
+    histograms = load_histograms(path)
+    rates, means = summarize(histograms, thresholds, confidence, resamples)
+    print(f'{os.path.basename(path)}: {confidence:.0%} intervals\n')
+    print(means.to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+    print()
+    print(rates.to_string(index=False, float_format=lambda x: f'{x:.4f}'))
@@ -5,8 +5,12 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
-import time
 import sys
+from QZKP_progress import Progress
+from QZKP_metrics import QUBITS, SIMULATOR_CALLS
+from QZKP_engine import quantum_random_bits, block_rounds, pipelined_rounds, attack_template_rounds, measure_in_basis, grouped_run
+from QZKP_tune import tuned_settings
+from QZKP_results import MatchHistogram, RowWriter, run_description
 
 
 #----------------------------------------
@@ -23,6 +27,8 @@ def quantum_random_binary_string(length):
         qcoin.measure(0,0)
         exec = sim.run(qcoin, shots=1).result()
         string.append(int(list(exec.get_counts(qcoin).keys())[0]))
+    SIMULATOR_CALLS.inc(length)
+    QUBITS.inc(length)
     return string
 
 
@@ -81,6 +87,8 @@ def measurements(psi, b):
         exec = sim.run(psi[i], shots=1).result()
         result = int(list(exec.get_counts(psi[i]).keys())[0])
         results.append(result)
+    SIMULATOR_CALLS.inc(len(psi))
+    QUBITS.inc(len(psi))
     return results
 
 def equal_entries_percentage(list1, list2):
@@ -100,18 +108,6 @@ def random_binary_string(length):
     '''
     return [random.choice([0, 1]) for _ in range(length)]
 
-def loading_bar(iteration, total, start_time, prefix='Progress:', length=50, fill='█', print_end='\r'):
-    """
-    Progress bar.
-    """
-    percent = 100 * (iteration / total)
-    filled_length = int(length * iteration // total)
-    bar = fill * filled_length + '-' * (length - filled_length)
-    elapsed_time = time.time() - start_time
-    print(f'\r{prefix} |{bar}| {percent:.1f}% Elapsed: {elapsed_time:.1f}s', end=print_end)
-    if iteration == total:
-        print()
-
 #----------------------------------------
 # Protocol execution
 #----------------------------------------
@@ -119,46 +115,102 @@ if __name__=='__main__':
     
     key_length = int(sys.argv[1])
     num_iter = int(sys.argv[2])
+    mode, batch = tuned_settings('attack_ideal', key_length, sys.argv[3] if len(sys.argv) > 3 else None) # Tuned profile without a mode
     sim = AerSimulator()
+    csv_file = f'iter_attack_data_{key_length}_{num_iter}.csv'
     
     percentages = []
 
-    start_time = time.time()
-
-    b = quantum_random_binary_string(key_length)
-    a = quantum_random_binary_string(key_length)
-
-    a_xor_b = tuple(i ^ j for i,j in zip(a,b))
-
-    iter=1
-    for i in range(num_iter):
+    progress = Progress(num_iter, key_length)
+    histogram = MatchHistogram(key_length, run_description('attack_ideal', True, '-')) # Every round is against the attacker (decision 1)
+
+    if mode == 'block':
+        # Keys streamed in blocks through every stage: memory independent of key_length
+        decisions, percentages = block_rounds('attack_ideal', key_length, num_iter, progress=progress.update, batch=batch)
+        percentages = percentages.tolist()
+        histogram.add(1, percentages)
+    elif mode == 'pipeline':
+        # Batches prepared, simulated and written by overlapping threads; rows reach the CSV as they finish
+        b = quantum_random_bits(sim, key_length)
+        a = quantum_random_bits(sim, key_length)
+        writer = RowWriter(csv_file)
+        def write_batch(start, decisions, equal_percentages):
+            end = start + len(decisions)
+            writer.write({'Iteration': range(start + 1, end + 1), 'Percentages': equal_percentages})
+            histogram.add(1, equal_percentages)
+            progress.update(end)
+        try:
+            pipelined_rounds('attack_ideal', a, b, num_iter, sim=sim, consume=write_batch, batch=batch)
+        finally:
+            writer.close()
+    else:
+        b = quantum_random_binary_string(key_length)
+        a = quantum_random_binary_string(key_length)
+
+        a_xor_b = tuple(i ^ j for i,j in zip(a,b))
+
+        if mode == 'template':
+            # One parameterized circuit for the key, all iterations bound in batched Aer jobs
+            tsim = AerSimulator(method='matrix_product_state')
+            challenges = quantum_random_bits(sim, (num_iter, key_length))
+            percentages = attack_template_rounds(tsim, a, b, challenges, batch=batch or 1024,
+                                                 progress=progress.update).tolist()
+            histogram.add(1, percentages)
+        elif mode == 'grouped':
+            # Per-qubit circuits only depend on a few bits: one run per distinct circuit and stage
+            def eve_qubit(signature):
+                a_i, b_i, c_i, r_i = signature
+                challenge_state = challenge_gen(psi_gen((a_i,), (b_i,)), (c_i,), (b_i,))
+                return measure_in_basis(challenge_state[0], r_i)
+
+            def bob_qubit(signature):
+                e_i, r_i, a_i = signature
+                return measure_in_basis(psi_gen((e_i,), (r_i,))[0], a_i)
+
+            for i in range(num_iter):
+                c = quantum_random_bits(sim, key_length).tolist()
+                r = random_binary_string(key_length)
+                measure_results = grouped_run(sim, list(zip(a, b, c, r)), eve_qubit)
+                attack_estimation = tuple(i ^ j for i,j in zip(a_xor_b, measure_results))
+                r = random_binary_string(key_length)
+                results = grouped_run(sim, list(zip(attack_estimation, r, a)), bob_qubit)
+                c_aprox = tuple(i ^j for i,j in zip(b, results))
+                percentages.append(equal_entries_percentage(c, c_aprox))
+                histogram.add(1, percentages[-1])
+                progress.update(i + 1)
+        else:
+            iter=1
+            for i in range(num_iter):
     
-        # 2. Preparation of the challenge (Bob)
-        psi = psi_gen(a, b) # |psi> state generation from a and b
+                # 2. Preparation of the challenge (Bob)
+                psi = psi_gen(a, b) # |psi> state generation from a and b
 
-        c = tuple(quantum_random_binary_string(key_length)) # Random generation for c
-        challenge_state = challenge_gen(psi, c, b) # Challenge setup
+                c = tuple(quantum_random_binary_string(key_length)) # Random generation for c
+                challenge_state = challenge_gen(psi, c, b) # Challenge setup
 
-        # 3. Eve (which has access to a XOR b) meassures the challenge state randomly and generates the attakc estimation
-        r = random_binary_string(key_length)
-        measure_results = measurements(challenge_state, r)
-        attack_estimation = tuple(i ^ j for i,j in zip(a_xor_b, measure_results))
+                # 3. Eve (which has access to a XOR b) meassures the challenge state randomly and generates the attakc estimation
+                r = random_binary_string(key_length)
+                measure_results = measurements(challenge_state, r)
+                attack_estimation = tuple(i ^ j for i,j in zip(a_xor_b, measure_results))
         
-        # 4. Eve generates the attack state encoding the attack estimaiton with ranodm bassis
-        r = random_binary_string(key_length)
-        attack_state = psi_gen(attack_estimation, r)
+                # 4. Eve generates the attack state encoding the attack estimaiton with ranodm bassis
+                r = random_binary_string(key_length)
+                attack_state = psi_gen(attack_estimation, r)
         
-        # 5. Eve sends the attack state to Bob and he measures and count matches
-        results = measurements(attack_state, a)
-        c_aprox = tuple(i ^j for i,j in zip(b, results))
-        equal_percentage = equal_entries_percentage(c, c_aprox)
-        percentages.append(equal_percentage)
-        loading_bar(iter, num_iter, start_time)
-        iter +=1
+                # 5. Eve sends the attack state to Bob and he measures and count matches
+                results = measurements(attack_state, a)
+                c_aprox = tuple(i ^j for i,j in zip(b, results))
+                equal_percentage = equal_entries_percentage(c, c_aprox)
+                percentages.append(equal_percentage)
+                histogram.add(1, equal_percentage)
+                progress.update(iter)
+                iter +=1
 
     #----------------------------------------
     # Data
     #----------------------------------------
-    iters = range(1,num_iter + 1)
-    results = pd.DataFrame({'Iteration': iters, 'Percentages': percentages})
-    results.to_csv(f'iter_attack_data_{key_length}_{num_iter}.csv', index=False)
+    if mode != 'pipeline': # Already written batch by batch
+        iters = range(1,num_iter + 1)
+        results = pd.DataFrame({'Iteration': iters, 'Percentages': percentages})
+        results.to_csv(csv_file, index=False)
+    histogram.save(csv_file)
@@ -0,0 +1,287 @@
+from qiskit import QuantumCircuit, transpile
+from qiskit_aer import AerSimulator
+from qiskit_aer.noise import NoiseModel, phase_amplitude_damping_error
+from QZKP_progress import Progress
+from QZKP_engine import quantum_random_bits, grouped_run, match_percentages
+from QZKP_results import MatchHistogram, run_description
+import numpy as np
+import pandas as pd
+import sys
+
+#----------------------------------------
+# Per-qubit circuits
+#----------------------------------------
+Z_BASIS, X_BASIS, BREIDBART = 0, 1, 2   # Bases Eve can measure or encode in
+NONE = -1                               # Qubit not intercepted
+HONEST, FORWARD, RESEND = 0, 1, 2       # What reaches Bob
+
+def challenge_qubit(a_i, b_i, c_i):
+    '''
+    Single qubit of the challenge state sent by Bob.
+    '''
+    qubit = QuantumCircuit(1, 1)
+    if a_i == 1:
+        qubit.x(0)
+    if b_i == 1:
+        qubit.h(0)
+    if c_i == 1:
+        if b_i == 0:
+            qubit.x(0)
+        else:
+            qubit.z(0)
+    return qubit
+
+def to_basis(qubit, basis):
+    '''
+    Rotate a qubit so that a Z measurement reads it in the given basis.
+    '''
+    if basis == X_BASIS:
+        qubit.h(0)
+    elif basis == BREIDBART:
+        qubit.ry(-np.pi / 4, 0)
+    return qubit
+
+def prepare(bit, basis):
+    '''
+    Encode a bit in the given basis.
+    '''
+    qubit = QuantumCircuit(1, 1)
+    if bit == 1:
+        qubit.x(0)
+    if basis == X_BASIS:
+        qubit.h(0)
+    elif basis == BREIDBART:
+        qubit.ry(np.pi / 4, 0)
+    return qubit
+
+def eve_qubit(signature):
+    '''
+    Eve measures a challenge qubit in her basis. Signature: (a_i, b_i, c_i, basis).
+    '''
+    a_i, b_i, c_i, basis = signature
+    qubit = to_basis(challenge_qubit(a_i, b_i, c_i), basis)
+    qubit.measure(0, 0)
+    return qubit
+
+def bob_qubit(signature):
+    '''
+    Bob measures with a the qubit he receives. Signature: (kind, x, y, z, a_i), with
+    (x, y, z) = (a_i, b_i, c_i) for HONEST and FORWARD and (bit, basis, 0) for RESEND.
+    '''
+    kind, x, y, z, a_i = signature
+    if kind == RESEND:
+        qubit = prepare(x, y)
+    else:
+        qubit = challenge_qubit(x, y, z)
+        if kind == HONEST:
+            if y == 1:
+                qubit.z(0)
+            if x ^ y == 1:
+                qubit.h(0)
+            if x == 1:
+                qubit.z(0)
+    qubit = to_basis(qubit, a_i)
+    qubit.measure(0, 0)
+    return qubit
+
+#----------------------------------------
+# Strategies
+#----------------------------------------
+# A strategy factory takes the key length, an optional parameter and a random
+# generator, and returns a plan: plan(a, b, c) -> (eve_basis, kind, resend_basis),
+# three (rows, key_length) arrays for the challenge rows c. Intercepted qubits are
+# resent as a XOR b XOR (Eve's outcome); qubits resent without interception carry
+# a random bit.
+
+def _untouched(c):
+    return np.full(c.shape, NONE)
+
+def honest(n, param, rng):
+    '''
+    Honest Alice, as a reference.
+    '''
+    def plan(a, b, c):
+        return _untouched(c), np.full(c.shape, HONEST), np.zeros(c.shape, dtype=int)
+    return plan
+
+def random_guess(n, param, rng):
+    '''
+    Eve does not touch the challenge and sends random bits.
+    '''
+    def plan(a, b, c):
+        return _untouched(c), np.full(c.shape, RESEND), np.zeros(c.shape, dtype=int)
+    return plan
+
+def intercept(n, param, rng):
+    '''
+    Attack of QZKP_attack_ideal.py: measure in a random basis, resend in another.
+    '''
+    def plan(a, b, c):
+        return rng.integers(0, 2, c.shape), np.full(c.shape, RESEND), rng.integers(0, 2, c.shape)
+    return plan
+
+def partial_interception(n, param, rng):
+    '''
+    Intercept-resend on a fraction param (default 0.5) of the qubits, forward the rest.
+    '''
+    fraction = 0.5 if param is None else param
+    def plan(a, b, c):
+        hit = rng.random(c.shape) < fraction
+        eve_basis = np.where(hit, rng.integers(0, 2, c.shape), NONE)
+        return eve_basis, np.where(hit, RESEND, FORWARD), rng.integers(0, 2, c.shape)
+    return plan
+
+def breidbart(n, param, rng):
+    '''
+    Measure and resend in the Breidbart basis, halfway between Z and X.
+    '''
+    def plan(a, b, c):
+        return np.full(c.shape, BREIDBART), np.full(c.shape, RESEND), np.full(c.shape, BREIDBART)
+    return plan
+
+def fixed_z(n, param, rng):
+    '''
+    Measure and resend always in the Z basis.
+    '''
+    def plan(a, b, c):
+        return np.full(c.shape, Z_BASIS), np.full(c.shape, RESEND), np.full(c.shape, Z_BASIS)
+    return plan
+
+def fixed_x(n, param, rng):
+    '''
+    Measure and resend always in the X basis.
+    '''
+    def plan(a, b, c):
+        return np.full(c.shape, X_BASIS), np.full(c.shape, RESEND), np.full(c.shape, X_BASIS)
+    return plan
+
+def partial_key(n, param, rng):
+    '''
+    Eve also knows (a_i, b_i) on a fixed fraction param (default 0.5) of the
+    positions, where she answers like Alice; elsewhere she intercepts.
+    '''
+    fraction = 0.5 if param is None else param
+    known = rng.random(n) < fraction
+    def plan(a, b, c):
+        eve_basis = np.where(known, NONE, rng.integers(0, 2, c.shape))
+        kind = np.broadcast_to(np.where(known, HONEST, RESEND), c.shape)
+        return eve_basis, kind, rng.integers(0, 2, c.shape)
+    return plan
+
+STRATEGIES = {
+    'honest': honest,
+    'random': random_guess,
+    'intercept': intercept,
+    'partial': partial_interception,
+    'breidbart': breidbart,
+    'fixed_z': fixed_z,
+    'fixed_x': fixed_x,
+    'partial_key': partial_key,
+}
+
+def make_strategies(specs, key_length, rng):
+    '''
+    Plans from specs like 'intercept' or 'partial:0.25', labelled by their spec.
+    '''
+    plans = {}
+    for spec in specs:
+        name, _, param = spec.partition(':')
+        if name not in STRATEGIES:
+            raise ValueError(f'Unknown strategy {name!r}. Available: {", ".join(STRATEGIES)}')
+        plans[spec] = STRATEGIES[name](key_length, float(param) if param else None, rng)
+    return plans
+
+#----------------------------------------
+# Batched evaluation
+#----------------------------------------
+def evaluate_strategies(sim, a, b, c, plans, rng, noisy=False):
+    '''
+    Match percentages of every strategy over the shared challenge rows c.
+
+    All strategies and rows go through two grouped simulator calls: one for
+    Eve's measurements and one for Bob's. With noisy=True each distinct
+    circuit is transpiled for sim, as in the noisy scripts.
+    '''
+    a = np.asarray(a, dtype=np.uint8)
+    b = np.asarray(b, dtype=np.uint8)
+    c = np.asarray(c, dtype=np.uint8)
+    rows, n = c.shape
+    A, B = np.broadcast_to(a, c.shape), np.broadcast_to(b, c.shape)
+    finish = (lambda qubit: transpile(qubit, sim)) if noisy else (lambda qubit: qubit)
+    names = list(plans)
+    eve_basis, kind, resend_basis = (np.stack(x) for x in zip(*(plans[name](a, b, c) for name in names)))
+
+    # Eve's measurements for every strategy at once
+    measured = eve_basis >= 0
+    tile = lambda x: np.broadcast_to(x, eve_basis.shape)
+    eve_signatures = np.stack([tile(A)[measured], tile(B)[measured], tile(c)[measured], eve_basis[measured]], axis=1)
+    outcomes = np.zeros(eve_basis.shape, dtype=np.uint8)
+    if measured.any():
+        outcomes[measured] = grouped_run(sim, eve_signatures, lambda s: finish(eve_qubit(s)))
+    estimation = np.where(measured, tile(A ^ B) ^ outcomes, rng.integers(0, 2, eve_basis.shape))
+
+    # Bob's measurements for every strategy at once
+    resend = kind == RESEND
+    bob_signatures = np.stack([
+        kind,
+        np.where(resend, estimation, tile(A)),
+        np.where(resend, resend_basis, tile(B)),
+        np.where(resend, 0, tile(c)),
+        tile(A),
+    ], axis=-1).reshape(-1, 5)
+    results = grouped_run(sim, bob_signatures, lambda s: finish(bob_qubit(s))).reshape(kind.shape)
+    return {name: match_percentages(c, b ^ results[k]) for k, name in enumerate(names)}
+
+#----------------------------------------
+# Protocol execution
+#----------------------------------------
+if __name__=='__main__':
+
+    key_length = int(sys.argv[1])
+    num_iter = int(sys.argv[2])
+    threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 100.0 # Minimum match percentage accepted by Bob
+    specs = sys.argv[4].split(',') if len(sys.argv) > 4 else list(STRATEGIES)
+    noisy = len(sys.argv) > 6
+    if noisy:
+        gamma = float(sys.argv[5]) # Probability of amplitude damping
+        lam = float(sys.argv[6]) # Probability of phase damping
+        noise_model = NoiseModel()
+        noise_model.add_all_qubit_quantum_error(phase_amplitude_damping_error(gamma, lam), ['h', 'measure'])
+        sim = AerSimulator(noise_model=noise_model)
+    else:
+        sim = AerSimulator()
+    rng = np.random.default_rng()
+
+    b = quantum_random_bits(sim, key_length)
+    a = quantum_random_bits(sim, key_length)
+    plans = make_strategies(specs, key_length, rng)
+    progress = Progress(num_iter, key_length * len(plans))
+
+    # Rows of iterations per batch, so that each grouped call stays around 2^20 qubits
+    batch = max(1, (1 << 20) // (key_length * len(plans)))
+    percentages = {spec: [] for spec in plans}
+    histogram = MatchHistogram(key_length, run_description('attacks', True, (gamma, lam) if noisy else '-', ','.join(plans)))
+    for start in range(0, num_iter, batch):
+        rows = min(batch, num_iter - start)
+        c = quantum_random_bits(sim, (rows, key_length)) # Challenges shared by all strategies
+        for spec, values in evaluate_strategies(sim, a, b, c, plans, rng, noisy).items():
+            percentages[spec].extend(values.tolist())
+            histogram.add(spec, values)
+        progress.update(start + rows)
+
+    #----------------------------------------
+    # Data
+    #----------------------------------------
+    results = pd.DataFrame({
+        'Iteration': np.tile(np.arange(1, num_iter + 1), len(plans)),
+        'Strategy': np.repeat(list(plans), num_iter),
+        'Percentages': np.concatenate([percentages[spec] for spec in plans]),
+    })
+    summary = results.groupby('Strategy', sort=False)['Percentages'].agg(['mean', 'std', 'min', 'max'])
+    summary['accepted'] = results.groupby('Strategy', sort=False)['Percentages'].apply(lambda p: (p >= threshold).mean())
+    print(f'\nAcceptance threshold: {threshold}%\n')
+    print(summary.to_string(float_format=lambda x: f'{x:.4f}'))
+    suffix = f'_{gamma}_{lam}' if noisy else ''
+    csv_file = f'iter_attack_library_data_{key_length}_{num_iter}{suffix}.csv'
+    results.to_csv(csv_file, index=False)
+    histogram.save(csv_file)
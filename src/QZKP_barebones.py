@@ -1,5 +1,6 @@
 from qiskit import QuantumCircuit
 from qiskit_aer import AerSimulator
+from QZKP_engine import quantum_random_bits, measure_in_basis, grouped_run
 import sys
 
 #----------------------------------------
@@ -89,29 +90,44 @@ if __name__ == '__main__':
     
     sim = AerSimulator()
     key_length = int(sys.argv[1])
-    b = tuple(quantum_random_binary_string(key_length))
-    a = tuple(quantum_random_binary_string(key_length))
-    verbose = False
-    if len(sys.argv) == 3:
-        if str(sys.argv[2]) == 'v':
-            verbose = True
-
-    # 2. Preparation of the challenge (Bob)
-    psi = psi_gen(a, b) # |psi> state generation from a and b
-
-    c = tuple(quantum_random_binary_string(key_length)) # Random generation for c
-    challenge_state = challenge_gen(psi, c, b) # Challenge setup
-
-    # After this, Bob sends the modified qubits to Alice 
-
-    # 3.  Alice modification's
-
-    proof_state = alice_mod(challenge_state, a, b)
-
-    # Alice send the proof state to Bob.
-
-    # 6. Bob retrieves c.
-    b_xor_c = measurements(proof_state, a)
+    options = sys.argv[2:]
+    unknown = [option for option in options if option not in ('v', 'grouped')]
+    if unknown:
+        raise SystemExit(f'Unknown option {unknown[0]!r}. Expected any of: v, grouped')
+    verbose = 'v' in options
+    grouped = 'grouped' in options
+    if grouped:
+        random_string = lambda length: quantum_random_bits(sim, length).tolist()
+    else:
+        random_string = quantum_random_binary_string
+    b = tuple(random_string(key_length))
+    a = tuple(random_string(key_length))
+
+    c = tuple(random_string(key_length)) # Random generation for c
+
+    if grouped:
+        # Each qubit's circuit only depends on (a_i, b_i, c_i): one run per distinct circuit
+        def proof_qubit(signature):
+            a_i, b_i, c_i = signature
+            psi = psi_gen((a_i,), (b_i,))
+            proof_state = alice_mod(challenge_gen(psi, (c_i,), (b_i,)), (a_i,), (b_i,))
+            return measure_in_basis(proof_state[0], a_i)
+        b_xor_c = grouped_run(sim, list(zip(a, b, c)), proof_qubit).tolist()
+    else:
+        # 2. Preparation of the challenge (Bob)
+        psi = psi_gen(a, b) # |psi> state generation from a and b
+        challenge_state = challenge_gen(psi, c, b) # Challenge setup
+
+        # After this, Bob sends the modified qubits to Alice 
+
+        # 3.  Alice modification's
+
+        proof_state = alice_mod(challenge_state, a, b)
+
+        # Alice send the proof state to Bob.
+
+        # 6. Bob retrieves c.
+        b_xor_c = measurements(proof_state, a)
     c_aprox = tuple(i ^j for i,j in zip(b, b_xor_c))
     equal_percentage = equal_entries_percentage(c, c_aprox)
 
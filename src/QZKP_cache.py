@@ -0,0 +1,219 @@
+from QZKP_results import PROTOCOLS, MatchHistogram, output_name, parse_points, run_description
+from QZKP_metrics import Counter
+from importlib import metadata
+import numpy as np
+import pandas as pd
+import hashlib
+import ast
+import json
+import time
+import sys
+import os
+
+#----------------------------------------
+# Run cache
+#----------------------------------------
+# Seeded runs are deterministic, so their results are stored on disk under a
+# hash of everything that determines them: script, key length, noise, attacker,
+# seed and engine version (the source of every module of the repository the
+# cached computation imports, directly or not, and the Qiskit Aer version). The
+# number of iterations is not part of the key: a run is computed in chunks of
+# rows, chunk j seeded with (seed, j), so the first iterations of a longer run
+# are those of a shorter one and a cached run is extended by the missing chunks
+# only. Entries are evicted least recently used first when the cache exceeds
+# its size (QZKP_CACHE_MB, 1024 by default), in QZKP_CACHE_DIR or ~/.cache/qzkp.
+
+CHUNK_QUBITS = 1 << 16   # Qubits per chunk: rows = CHUNK_QUBITS // key_length
+LOOKUPS = Counter('qzkp_run_cache_total', 'Run cache lookups by result')
+
+def local_imports(module, directory=None):
+    '''
+    Modules of the repository that module imports, directly or not, itself
+    included, sorted: every import statement counts, also those inside functions.
+    '''
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    found, pending = set(), [module]
+    while pending:
+        name = pending.pop()
+        path = os.path.join(directory, name + '.py')
+        if name in found or not os.path.exists(path):
+            continue
+        found.add(name)
+        with open(path, 'rb') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending += [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                pending.append(node.module)
+    return sorted(found)
+
+def engine_version():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for name in local_imports('QZKP_cache', directory):
+        with open(os.path.join(directory, name + '.py'), 'rb') as f:
+            digest.update(name.encode() + b'\0' + f.read())
+    return f'{digest.hexdigest()[:16]}-aer{metadata.version("qiskit-aer")}'
+
+def chunk_rows(key_length):
+    return max(1, CHUNK_QUBITS // key_length)
+
+class RunCache:
+    '''
+    Results of seeded runs, one entry (<key>.npz with decisions and percentages,
+    <key>.json with the configuration) per configuration.
+    '''
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or os.environ.get('QZKP_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'qzkp'))
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.environ.get('QZKP_CACHE_MB', 1024)) * 2**20)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, config):
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def get(self, key):
+        '''
+        (decisions, percentages) of an entry, or None. A hit marks it as recently used.
+        '''
+        try:
+            with np.load(self._path(key, '.npz')) as data:
+                decisions, percentages = data['decisions'], data['percentages']
+        except (OSError, KeyError, ValueError):
+            return None
+        os.utime(self._path(key, '.npz'))
+        return decisions, percentages
+
+    def put(self, key, config, decisions, percentages):
+        # Written to a temporary file and renamed, so concurrent readers never see half an entry
+        temporary = self._path(key, f'.{os.getpid()}.tmp.npz')
+        np.savez(temporary, decisions=decisions.astype(np.uint8), percentages=percentages)
+        os.replace(temporary, self._path(key, '.npz'))
+        with open(self._path(key, '.json'), 'w') as f:
+            json.dump(dict(config, iterations=len(percentages)), f)
+        self.evict()
+
+    def entries(self):
+        '''
+        (last use, bytes, key) of every entry, least recently used first.
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz') and '.tmp' not in name:
+                key = name[:-4]
+                try:
+                    stat = os.stat(self._path(key, '.npz'))
+                    size = stat.st_size + os.path.getsize(self._path(key, '.json'))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, size, key))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
+
+    def remove(self, key):
+        for ext in ('.npz', '.json'):
+            try:
+                os.remove(self._path(key, ext))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for _, _, key in self.entries():
+            self.remove(key)
+
+def run_config(protocol, key_length, noise, attack, seed):
+    return {'protocol': protocol, 'key_length': int(key_length), 'noise': [float(p) for p in noise],
+            'attack': bool(attack), 'seed': int(seed), 'chunk_rows': chunk_rows(key_length),
+            'engine': engine_version()}
+
+def cached_run(protocol, key_length, num_iter, noise=(0.0, 0.0), attack=True, seed=0, cache=None, progress=None):
+    '''
+    Decisions and match percentages of a seeded grouped run, from the cache when
+    possible. Returns (decisions, percentages, result), result being 'hit',
+    'partial' (a shorter run was extended) or 'miss'. Noise must be fixed.
+    progress, if given, is called with the number of iterations available.
+    '''
+    if protocol not in PROTOCOLS:
+        raise ValueError(f'Unknown protocol {protocol!r}. Expected one of: {", ".join(PROTOCOLS)}')
+    cache = cache or RunCache()
+    config = run_config(protocol, key_length, noise, attack, seed)
+    key = cache.key(config)
+    cached = cache.get(key)
+    decisions, percentages = cached if cached is not None else (np.zeros(0, dtype=np.uint8), np.zeros(0))
+    if len(percentages) >= num_iter:
+        LOOKUPS.inc(result='hit')
+        if progress:
+            progress(num_iter)
+        return decisions[:num_iter], percentages[:num_iter], 'hit'
+    result = 'partial' if len(percentages) else 'miss'
+    LOOKUPS.inc(result=result)
+
+    from QZKP_engine import cached_simulator, quantum_random_bits, run_protocol
+    sim = cached_simulator(protocol, tuple(noise))
+    np.random.seed(seed)
+    b = quantum_random_bits(sim, key_length)
+    a = quantum_random_bits(sim, key_length)
+    rows = config['chunk_rows']
+    parts_d, parts_p = [decisions], [percentages]
+    done = len(percentages)   # Always a whole number of chunks
+    while done < num_iter:
+        np.random.seed(np.random.SeedSequence([seed, done // rows]).generate_state(1)[0])
+        dec, perc = run_protocol(protocol, a, b, rows, tuple(noise), attack, sim)
+        parts_d.append(dec.astype(np.uint8))
+        parts_p.append(perc)
+        done += rows
+        if progress:
+            progress(min(done, num_iter))
+    decisions, percentages = np.concatenate(parts_d), np.concatenate(parts_p)
+    cache.put(key, config, decisions, percentages)
+    return decisions[:num_iter], percentages[:num_iter], result
+
+#----------------------------------------
+# Execution
+#----------------------------------------
+if __name__=='__main__':
+
+    command = sys.argv[1]
+    if command == 'run':
+        # run <script> <key_length> <num_iter> <noise_point> <attacker> <seed>
+        from QZKP_progress import Progress
+        protocol = sys.argv[2]
+        key_length = int(sys.argv[3])
+        num_iter = int(sys.argv[4])
+        noise = parse_points(sys.argv[5] if len(sys.argv) > 5 else '-')[0]
+        attack = (sys.argv[6] if len(sys.argv) > 6 else 'True') == 'True'
+        seed = int(sys.argv[7]) if len(sys.argv) > 7 else 0
+        start = time.perf_counter()
+        try:
+            decisions, percentages, result = cached_run(protocol, key_length, num_iter, noise, attack, seed,
+                                                        progress=Progress(num_iter, key_length).update)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        results = pd.DataFrame({'Iteration': range(1, num_iter + 1), 'Decision': decisions, 'Percentages': percentages})
+        if protocol == 'attack_ideal':
+            results = results.drop(columns='Decision')
+        csv_file = output_name(protocol, key_length, num_iter, noise, attack)
+        results.to_csv(csv_file, index=False)
+        histogram = MatchHistogram(key_length, run_description(protocol, attack, noise))
+        histogram.add(decisions if protocol != 'attack_ideal' else 1, percentages)
+        histogram.save(csv_file)
+        print(f'Cache {result} ({time.perf_counter() - start:.2f}s): saved {csv_file}')
+    elif command == 'stats':
+        cache = RunCache()
+        entries = cache.entries()
+        print(f'{cache.directory}: {len(entries)} entries, {sum(size for _, size, _ in entries) / 2**20:.1f} of {cache.max_bytes / 2**20:.0f} MB')
+    elif command == 'clear':
+        RunCache().clear()
+    else:
+        raise SystemExit(f'Unknown command {command!r}. Expected run, stats or clear.')
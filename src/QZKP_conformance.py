@@ -0,0 +1,329 @@
+from QZKP_engine import (protocol_simulator, simulate_matches, honest_template_rounds, attack_template_rounds,
+                         honest_qubit, intercept_qubit, resend_qubit, pipelined_rounds, scheduled_matches,
+                         noise_schedule, detection_probability, early_rounds, required_matches)
+from QZKP_inversion import outcome_probability
+from QZKP_noise import parse_noise, compile_noise, noise_model, composite_matches, PATHS
+from qiskit_aer import AerSimulator
+from scipy.stats import chisquare, chi2_contingency
+from concurrent.futures import ProcessPoolExecutor
+import importlib
+import itertools
+import random
+import numpy as np
+import pandas as pd
+import time
+import sys
+import os
+
+#----------------------------------------
+# Conformance suite
+#----------------------------------------
+# Every backend is checked against the exact distribution of its rounds:
+# given the key, challenges and decisions, the matches of a round are a sum of
+# independent per-qubit Bernoulli variables whose probabilities come from the
+# per-qubit circuits (QZKP_inversion), so a chi-square goodness-of-fit test
+# applies to every backend, the per-qubit reference path of the scripts
+# included. Backends that take the challenges run on the same ones as the
+# reference; those that draw their own are checked as described below.
+# A composite noise specification (QZKP_noise) has no script: its reference is
+# Aer sampling of the per-qubit circuits with the equivalent noise model, which
+# checks the compiled outcome tables its exact distribution comes from.
+# Backends on the reference's challenges are also compared with the reference
+# path directly: a 2x2 chi-square test of their per-qubit match rates, whose
+# power comes from every qubit of the reference rounds (100 rounds of 8 qubits
+# catch a bias of 8 percentage points 9 times in 10). Fast backends run every
+# challenge row `repeat` times for more power. The reference path transpiles
+# every qubit and dominates the run time, so cases run in parallel processes;
+# QUICK_CASES are cheap enough to run as an ordinary test (tests/test_conformance.py).
+SCRIPTS = {'attack_ideal': 'QZKP_attack_ideal', 'damping': 'QZKP_noise_damping', 'flip': 'QZKP_noise_flip'}
+CASES = [
+    ('attack_ideal', (0.0, 0.0), 'attack'),
+    ('damping', (0.0, 0.0), 'honest'),
+    ('damping', (0.1, 0.05), 'honest'),
+    ('damping', (0.1, 0.05), 'attack'),
+    ('damping', (0.1, 0.05), 'guess'),
+    ('flip', (0.05, 0.05), 'honest'),
+    ('flip', (0.05, 0.05), 'attack'),
+    ('flip', (0.05, 0.05), 'guess'),
+    ('composite', 'h:damping=0.1/0.05+depolarizing=0.02;x,z:flip=0.02/0.01;measure:readout=0.02/0.03', 'honest'),
+    ('composite', 'h:damping=0.1/0.05+depolarizing=0.02;x,z:flip=0.02/0.01;measure:readout=0.02/0.03', 'attack'),
+]
+QUICK_CASES = [CASES[0], CASES[2], CASES[7], CASES[8]]   # No slow reference rounds of flip noise
+KEY_A = np.array([0, 1, 0, 1, 0, 1, 0, 1])   # Every (a_i, b_i) pair twice
+KEY_B = np.array([0, 0, 1, 1, 0, 0, 1, 1])
+BLOCK = 3           # Key positions per block of the block and early-decision backends
+LOSS = (0.9, 0.8)   # (transmission, efficiency) of the loss backend
+THRESHOLD = 75      # Match percentage of the early-decision backend (6 of 8)
+
+#----------------------------------------
+# Exact distribution
+#----------------------------------------
+def correct_probabilities(protocol, noise, kind, a, b, c):
+    '''
+    Probability that Bob recovers each challenge bit, an array shaped like c.
+    '''
+    if kind == 'guess':
+        return np.full(c.shape, 0.5)
+    if protocol == 'composite':
+        tables = {build: compile_noise(parse_noise(noise))[path] for path, (build, _) in PATHS.items()}
+        p1_of = lambda build, signature: tables[build][np.ravel_multi_index(signature, (2,) * len(signature))]
+    else:
+        p1_of = lambda build, signature: outcome_probability(protocol, build, signature, noise)
+    table = {}
+    for a_i, b_i, c_i in itertools.product((0, 1), repeat=3):
+        if kind == 'honest':
+            p1 = p1_of(honest_qubit, (a_i, b_i, c_i))
+            table[a_i, b_i, c_i] = 1 - p1 if b_i ^ c_i == 0 else p1
+        else:
+            # Eve's bases r and s are uniform
+            p = 0.0
+            for r, s in itertools.product((0, 1), repeat=2):
+                m1 = p1_of(intercept_qubit, (a_i, b_i, c_i, r))
+                for m, pm in ((0, 1 - m1), (1, m1)):
+                    o1 = p1_of(resend_qubit, (a_i ^ b_i ^ m, s, a_i))
+                    p += pm * (o1 if b_i ^ c_i == 1 else 1 - o1) / 4
+            table[a_i, b_i, c_i] = p
+    A, B = np.broadcast_to(a, c.shape), np.broadcast_to(b, c.shape)
+    return np.vectorize(lambda x, y, z: table[x, y, z])(A, B, c)
+
+def expected_counts(probabilities):
+    '''
+    Expected number of rounds with each match count (0..n), summing the
+    Poisson-binomial distribution of every row of probabilities.
+    '''
+    total = np.zeros(probabilities.shape[1] + 1)
+    for row in probabilities:
+        pmf = np.ones(1)
+        for p in row:
+            pmf = np.convolve(pmf, [1 - p, p])
+        total += pmf
+    return total
+
+def goodness_of_fit(matches, expected):
+    '''
+    Chi-square p-value of observed match counts against expected counts, with
+    sparse bins pooled; 0 if a count with probability zero was observed.
+    '''
+    observed = np.bincount(matches, minlength=len(expected)).astype(float)
+    if observed[expected < 1e-9].sum() > 0:
+        return 0.0
+    obs, exp, bins = [], [], [[0.0, 0.0]]
+    for o, e in zip(observed, expected):
+        bins[-1][0] += o
+        bins[-1][1] += e
+        if bins[-1][1] >= 5:
+            bins.append([0.0, 0.0])
+    if len(bins) > 1 and bins[-1][1] < 5:
+        o, e = bins.pop()
+        bins[-1][0] += o
+        bins[-1][1] += e
+    obs, exp = np.array(bins).T
+    if len(obs) < 2:
+        return 1.0
+    return chisquare(obs, exp * obs.sum() / exp.sum()).pvalue
+
+def reference_agreement(matches, reference, n):
+    '''
+    Chi-square p-value of equal per-qubit match rates of a backend's rounds
+    and the reference rounds, n qubits each; 1 if no qubit of either matched
+    or every one did.
+    '''
+    table = np.array([[matches.sum(), len(matches) * n - matches.sum()],
+                      [reference.sum(), len(reference) * n - reference.sum()]])
+    if (table.sum(axis=0) == 0).any():
+        return 1.0
+    return chi2_contingency(table).pvalue
+
+#----------------------------------------
+# Backends
+#----------------------------------------
+def reference_matches(protocol, noise, kind, a, b, c_rows):
+    '''
+    Per-qubit sim.run path of the script, one round per challenge row; for a
+    composite specification, its circuits sampled by Aer with noise_model.
+    '''
+    if protocol == 'composite':
+        sim = AerSimulator(noise_model=noise_model(parse_noise(noise)))
+        return simulate_matches(sim, a, b, c_rows, np.full(len(c_rows), 0 if kind == 'honest' else 1), kind != 'guess')
+    script = importlib.import_module(SCRIPTS[protocol])
+    script.sim = protocol_simulator(protocol, noise)
+    script.pbit, script.pphase = noise
+    a, b, n = a.tolist(), b.tolist(), len(a)
+    matches = []
+    for c in c_rows.tolist():
+        challenge_state = script.challenge_gen(script.psi_gen(a, b), c, b)
+        if kind == 'honest':
+            results = script.measurements(script.alice_mod(challenge_state, a, b), a)
+        elif kind == 'attack':
+            r = script.random_binary_string(n)
+            estimation = [x ^ y ^ m for x, y, m in zip(a, b, script.measurements(challenge_state, r))]
+            results = script.measurements(script.psi_gen(estimation, script.random_binary_string(n)), a)
+        else:
+            results = script.random_binary_string(n)
+        matches.append(sum(c_i == b_i ^ m for c_i, b_i, m in zip(c, b, results)))
+    return np.array(matches)
+
+def grouped_matches(protocol, noise, kind, a, b, c_rows):
+    sim = protocol_simulator(protocol, noise)
+    decisions = np.full(len(c_rows), 0 if kind == 'honest' else 1)
+    pbit, pphase = noise if protocol == 'flip' else (0.0, 0.0)
+    return simulate_matches(sim, a, b, c_rows, decisions, kind != 'guess', pbit, pphase, transpiled=protocol == 'damping')
+
+def block_matches(protocol, noise, kind, a, b, c_rows):
+    '''
+    Matches added up over blocks of key positions, as block_rounds does.
+    '''
+    return sum(grouped_matches(protocol, noise, kind, a[k:k + BLOCK], b[k:k + BLOCK], c_rows[:, k:k + BLOCK])
+               for k in range(0, len(a), BLOCK))
+
+def template_matches(protocol, noise, kind, a, b, c_rows):
+    model = protocol_simulator(protocol, noise).options.noise_model
+    tsim = AerSimulator(method='matrix_product_state', noise_model=model)
+    if kind == 'honest':
+        pbit, pphase = noise if protocol == 'flip' else (0.0, 0.0)
+        percentages = honest_template_rounds(tsim, a, b, c_rows, pbit, pphase)
+    else:
+        percentages = attack_template_rounds(tsim, a, b, c_rows)
+    return np.rint(percentages * len(a) / 100).astype(int)
+
+def composite_backend(protocol, noise, kind, a, b, c_rows):
+    decisions = np.full(len(c_rows), 0 if kind == 'honest' else 1)
+    return composite_matches(noise, a, b, c_rows, decisions, kind != 'guess')
+
+def backends(protocol, kind):
+    '''
+    Fast backends that implement a case: the template path only covers honest
+    rounds of the noisy scripts and the rounds of the ideal attack script, and
+    a composite specification only has its table-sampling backend.
+    '''
+    if protocol == 'composite':
+        return {'composite': composite_backend}
+    available = {'grouped': grouped_matches, 'block': block_matches}
+    if (kind == 'honest' and protocol != 'attack_ideal') or (kind == 'attack' and protocol == 'attack_ideal'):
+        available['template'] = template_matches
+    return available
+
+#----------------------------------------
+# Backends that draw their challenges
+#----------------------------------------
+# pipelined_rounds, scheduled_matches with loss and early_rounds draw the
+# challenges (and, but for loss, the decisions) themselves. The challenge bits
+# are uniform and independent, so the matches of a round are still
+# Poisson-binomial, with the probability of each qubit averaged over its
+# challenge bit; with loss a qubit only matches if detected. Early decision is
+# checked on its acceptances: a round is accepted exactly when the whole key
+# would have reached required_matches. Each returns (observed, expected
+# counts), the observed values being match counts or 0/1 acceptances.
+
+def averaged_probabilities(protocol, noise, kind, a, b):
+    c = np.array([np.zeros_like(a), np.ones_like(a)])
+    return correct_probabilities(protocol, noise, kind, a, b, c).mean(axis=0)
+
+def selected(decisions, kind):
+    return decisions == (0 if kind == 'honest' else 1)
+
+def pipeline_check(protocol, noise, kind, a, b, rounds):
+    sim = protocol_simulator(protocol, noise)
+    decisions, percentages = pipelined_rounds(protocol, a, b, rounds, noise, kind != 'guess', sim,
+                                              batch=max(1, rounds // 8))
+    matches = np.rint(percentages[selected(decisions, kind)] * len(a) / 100).astype(int)
+    return matches, expected_counts(averaged_probabilities(protocol, noise, kind, a, b)[None]) * len(matches)
+
+def loss_check(protocol, noise, kind, a, b, rounds):
+    sim = protocol_simulator(protocol, noise)
+    decisions = np.full(rounds, 0 if kind == 'honest' else 1)
+    matches, _ = scheduled_matches(protocol, a, b, decisions, noise_schedule(noise, rounds), kind != 'guess', sim,
+                                   loss=LOSS)
+    probabilities = averaged_probabilities(protocol, noise, kind, a, b) * detection_probability(LOSS)
+    return np.asarray(matches, dtype=int), expected_counts(probabilities[None]) * rounds
+
+def early_check(protocol, noise, kind, a, b, rounds):
+    sim = protocol_simulator(protocol, noise)
+    decisions, accepted, _, _ = early_rounds(protocol, a, b, rounds, THRESHOLD, noise, kind != 'guess', sim,
+                                             block=BLOCK)
+    accepted = accepted[selected(decisions, kind)].astype(int)
+    pmf = expected_counts(averaged_probabilities(protocol, noise, kind, a, b)[None])
+    p = pmf[required_matches(THRESHOLD, len(a)):].sum()
+    return accepted, np.array([1 - p, p]) * len(accepted)
+
+def checks(protocol):
+    '''
+    Backends that draw their challenges; none for a composite specification,
+    whose sampled rounds take them.
+    '''
+    if protocol == 'composite':
+        return {}
+    return {'pipeline': pipeline_check, 'loss': loss_check, 'early': early_check}
+
+#----------------------------------------
+# Suite
+#----------------------------------------
+def run_case(index, protocol, noise, kind, rounds=100, repeat=100, seed=1, alpha=1e-3):
+    '''
+    Rows of case number index: every backend, the ones that take challenges
+    on the same ones. A row fails if its p-value against the exact
+    distribution or against the reference rounds is below alpha.
+    '''
+    c_rows = np.random.default_rng([seed, index]).integers(0, 2, (rounds, len(KEY_A)), dtype=np.uint8)
+    expected = expected_counts(correct_probabilities(protocol, noise, kind, KEY_A, KEY_B, c_rows))
+    random.seed(seed)
+    np.random.seed(seed)
+    # Aer sampling is cheap enough to check the composite tables with every repeat
+    times = repeat if protocol == 'composite' else 1
+    start = time.perf_counter()
+    reference = reference_matches(protocol, noise, kind, KEY_A, KEY_B, np.tile(c_rows, (times, 1)))
+    results = [('reference', reference, expected * times, time.perf_counter() - start)]
+    for name, backend in backends(protocol, kind).items():
+        np.random.seed(seed)
+        start = time.perf_counter()
+        matches = backend(protocol, noise, kind, KEY_A, KEY_B, np.tile(c_rows, (repeat, 1)))
+        results.append((name, matches, expected * repeat, time.perf_counter() - start))
+    for name, check in checks(protocol).items():
+        np.random.seed(seed)
+        start = time.perf_counter()
+        observed, counts = check(protocol, noise, kind, KEY_A, KEY_B, rounds * repeat)
+        results.append((name, observed, counts, time.perf_counter() - start))
+    compared = {'reference'} | set(backends(protocol, kind))
+    rows = []
+    for name, observed, counts, seconds in results:
+        # Percentages of the highest value: matches over the key, or acceptances
+        scale = 100 / (len(counts) - 1)
+        p_fit = goodness_of_fit(observed, counts)
+        p_ref = reference_agreement(observed, reference, len(KEY_A)) if name in compared - {'reference'} else np.nan
+        passed = p_fit >= alpha and (np.isnan(p_ref) or p_ref >= alpha)
+        rows.append((protocol, noise if isinstance(noise, str) else ':'.join(str(p) for p in noise), kind, name,
+                     len(observed), observed.mean() * scale, counts @ np.arange(len(counts)) / counts.sum() * scale,
+                     p_fit, p_ref, seconds, 'PASS' if passed else 'FAIL'))
+    return rows
+
+def run_suite(rounds=100, repeat=100, seed=1, alpha=1e-3, cases=CASES, workers=None):
+    '''
+    Conformance table of every case and backend, cases spread over `workers` processes.
+    '''
+    workers = workers or os.cpu_count() or 1
+    arguments = [(k, protocol, noise, kind, rounds, repeat, seed, alpha) for k, (protocol, noise, kind) in enumerate(cases)]
+    if workers > 1:
+        with ProcessPoolExecutor(min(workers, len(cases))) as pool:
+            parts = list(pool.map(run_case, *zip(*arguments)))
+    else:
+        parts = [run_case(*args) for args in arguments]
+    return pd.DataFrame([row for part in parts for row in part],
+                        columns=['Script', 'Noise', 'Prover', 'Backend', 'Iterations', 'Mean', 'Expected',
+                                 'Chi2 p', 'Reference p', 'Seconds', 'Result'])
+
+#----------------------------------------
+# Execution
+#----------------------------------------
+if __name__=='__main__':
+
+    # [reference rounds] [repeat] [seed] [alpha]
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    alpha = float(sys.argv[4]) if len(sys.argv) > 4 else 1e-3
+
+    table = run_suite(rounds, repeat, seed, alpha)
+    print(table.to_string(index=False, float_format=lambda x: f'{x:.4g}'))
+    failures = (table['Result'] == 'FAIL').sum()
+    print(f'\n{len(table) - failures} passed, {failures} failed (alpha = {alpha})')
+    sys.exit(1 if failures else 0)
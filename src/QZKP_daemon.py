@@ -0,0 +1,250 @@
+from QZKP_results import PROTOCOLS, MatchHistogram, send_message, receive_message, output_name, parse_points, run_description
+from QZKP_progress import Progress
+from QZKP_metrics import ITERATIONS, QUBITS, Gauge, start_from_environment
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import socketserver
+import threading
+import itertools
+import socket
+import queue
+import sys
+import os
+
+#----------------------------------------
+# Simulation daemon
+#----------------------------------------
+# A long-running process with a pool of warm worker processes (Qiskit imported,
+# simulators, noise models and transpiled circuits cached). Clients submit jobs
+# over a local TCP socket as JSON lines and get the rows streamed back:
+#
+#   client -> {"type": "submit", "protocol", "key_length", "num_iter", "noise", "attack", "seed"}
+#   daemon -> {"type": "queued", "id", "position"}, then {"type": "started"},
+#             {"type": "rows", "decisions", "percentages"}..., {"type": "done"} | {"type": "error"}
+#   client -> {"type": "status"} | {"type": "stop"}
+#
+# At most `workers` jobs run at once; the rest wait in a FIFO queue.
+
+PORT = int(os.environ.get('QZKP_DAEMON_PORT', 47654))
+JOBS = Gauge('qzkp_daemon_jobs', 'Daemon jobs by state')
+ROWS_PER_MESSAGE = 1 << 18   # Qubits per streamed batch of rows
+
+def _work(jobs, events):
+    '''
+    Worker process: runs jobs with simulators cached across jobs.
+    '''
+    from QZKP_engine import protocol_simulator, quantum_random_bits, run_protocol
+    from QZKP_cache import RunCache, cached_run
+    cache = RunCache()
+    sims = {}
+    # Warm-up: Aer start-up and the transpiled circuits shared by every damping job
+    run_protocol('damping', np.array([0, 1, 0, 1]), np.array([0, 0, 1, 1]), 64, (0.1, 0.05))
+    while (job := jobs.get()) is not None:
+        try:
+            events.put((job['id'], {'type': 'started'}))
+            key = (job['protocol'], tuple(job['noise']))
+            batch = max(1, ROWS_PER_MESSAGE // job['key_length'])
+            if job['cache']:
+                # Seed given by the client: the run is repeatable, so it goes through the run cache
+                decisions, percentages, _ = cached_run(job['protocol'], job['key_length'], job['num_iter'],
+                                                       key[1], job['attack'], job['seed'], cache)
+                for start in range(0, job['num_iter'], batch):
+                    events.put((job['id'], {'type': 'rows', 'decisions': decisions[start:start + batch].tolist(),
+                                            'percentages': percentages[start:start + batch].tolist()}))
+                events.put((job['id'], {'type': 'done'}))
+                continue
+            if key not in sims:
+                sims[key] = protocol_simulator(*key)
+            np.random.seed(job['seed'])
+            b = quantum_random_bits(sims[key], job['key_length'])
+            a = quantum_random_bits(sims[key], job['key_length'])
+            for start in range(0, job['num_iter'], batch):
+                rows = min(batch, job['num_iter'] - start)
+                decisions, percentages = run_protocol(job['protocol'], a, b, rows, key[1], job['attack'], sims[key])
+                events.put((job['id'], {'type': 'rows', 'decisions': decisions.tolist(),
+                                        'percentages': percentages.tolist()}))
+            events.put((job['id'], {'type': 'done'}))
+        except Exception as e:
+            events.put((job['id'], {'type': 'error', 'message': f'{type(e).__name__}: {e}'}))
+
+class Daemon:
+    def __init__(self, workers=2):
+        self.jobs = mp.Queue()
+        self.events = mp.Queue()
+        self.processes = [mp.Process(target=_work, args=(self.jobs, self.events), daemon=True)
+                          for _ in range(workers)]
+        for process in self.processes:
+            process.start()
+        self.subscribers = {}
+        self.queued = []
+        self.running = set()
+        self.key_lengths = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        threading.Thread(target=self._route, daemon=True).start()
+
+    def _route(self):
+        while True:
+            job_id, event = self.events.get()
+            with self.lock:
+                if event['type'] == 'started':
+                    self.queued.remove(job_id)
+                    self.running.add(job_id)
+                elif event['type'] in ('done', 'error'):
+                    self.running.discard(job_id)
+                elif event['type'] == 'rows':
+                    ITERATIONS.inc(len(event['percentages']))
+                    QUBITS.inc(len(event['percentages']) * self.key_lengths[job_id])
+                JOBS.set(len(self.running), state='running')
+                JOBS.set(len(self.queued), state='queued')
+                subscriber = self.subscribers.get(job_id)
+            if subscriber:
+                subscriber.put(event)
+
+    def submit(self, spec):
+        '''
+        Queue a job; returns its id, its queue position and the queue its events arrive on.
+        '''
+        if spec['protocol'] not in PROTOCOLS:
+            raise ValueError(f'Unknown protocol {spec["protocol"]!r}. Expected one of: {", ".join(PROTOCOLS)}')
+        events = queue.Queue()
+        with self.lock:
+            job_id = next(self.ids)
+            self.subscribers[job_id] = events
+            self.queued.append(job_id)
+            self.key_lengths[job_id] = int(spec['key_length'])
+            position = len(self.queued)
+        seed = spec.get('seed')
+        self.jobs.put({
+            'id': job_id,
+            'protocol': spec['protocol'],
+            'key_length': int(spec['key_length']),
+            'num_iter': int(spec['num_iter']),
+            'noise': [float(p) for p in spec.get('noise', (0.0, 0.0))],
+            'attack': bool(spec.get('attack', True)),
+            'seed': int(np.random.SeedSequence().entropy % 2**32) if seed is None else int(seed),
+            'cache': seed is not None,
+        })
+        return job_id, position, events
+
+    def forget(self, job_id):
+        with self.lock:
+            self.subscribers.pop(job_id, None)
+
+    def status(self):
+        with self.lock:
+            return {'type': 'status', 'workers': len(self.processes),
+                    'running': len(self.running), 'queued': len(self.queued)}
+
+    def close(self):
+        for _ in self.processes:
+            self.jobs.put(None)
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.daemon
+        try:
+            message = receive_message(self.rfile)
+            if message['type'] == 'status':
+                send_message(self.wfile, daemon.status())
+            elif message['type'] == 'stop':
+                send_message(self.wfile, {'type': 'stopping'})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            elif message['type'] == 'submit':
+                try:
+                    job_id, position, events = daemon.submit(message)
+                except (KeyError, ValueError) as e:
+                    send_message(self.wfile, {'type': 'error', 'message': str(e)})
+                    return
+                send_message(self.wfile, {'type': 'queued', 'id': job_id, 'position': position})
+                try:
+                    while True:
+                        event = events.get()
+                        send_message(self.wfile, event)
+                        if event['type'] in ('done', 'error'):
+                            return
+                finally:
+                    daemon.forget(job_id)
+        except (ConnectionError, OSError, ValueError):
+            pass
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def serve(workers=2, port=PORT):
+    daemon = Daemon(workers)
+    start_from_environment()
+    server = _Server(('127.0.0.1', port), _Handler)
+    server.daemon = daemon
+    print(f'QZKP daemon listening on 127.0.0.1:{port} with {workers} workers')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        daemon.close()
+
+def request(message, port=PORT):
+    '''
+    Send one message to the daemon and yield its replies.
+    '''
+    with socket.create_connection(('127.0.0.1', port)) as connection, connection.makefile('rwb') as f:
+        send_message(f, message)
+        while True:
+            try:
+                reply = receive_message(f)
+            except ConnectionError:
+                return
+            yield reply
+            if reply['type'] in ('done', 'error', 'status', 'stopping'):
+                return
+
+def submit(protocol, key_length, num_iter, noise=(0.0, 0.0), attack=True, seed=None, port=PORT):
+    '''
+    Run a job on the daemon and save its results as the corresponding script would.
+    '''
+    progress = Progress(num_iter, key_length)
+    histogram = MatchHistogram(key_length, run_description(protocol, attack, noise))
+    decisions, percentages = [], []
+    spec = {'type': 'submit', 'protocol': protocol, 'key_length': key_length, 'num_iter': num_iter,
+            'noise': list(noise), 'attack': attack, 'seed': seed}
+    for reply in request(spec, port):
+        if reply['type'] == 'queued' and reply['position'] > 1:
+            print(f'Job {reply["id"]} queued at position {reply["position"]}')
+        elif reply['type'] == 'rows':
+            decisions.extend(reply['decisions'])
+            percentages.extend(reply['percentages'])
+            histogram.add(reply['decisions'], reply['percentages'])
+            progress.update(len(percentages))
+        elif reply['type'] == 'error':
+            raise SystemExit(f'Job failed: {reply["message"]}')
+    results = pd.DataFrame({'Iteration': range(1, num_iter + 1), 'Decision': decisions, 'Percentages': percentages})
+    if protocol == 'attack_ideal':
+        results = results.drop(columns='Decision')
+    csv_file = output_name(protocol, key_length, num_iter, noise, attack)
+    results.to_csv(csv_file, index=False)
+    histogram.save(csv_file)
+    return csv_file
+
+#----------------------------------------
+# Execution
+#----------------------------------------
+if __name__=='__main__':
+
+    command = sys.argv[1]
+    if command == 'serve':
+        serve(int(sys.argv[2]) if len(sys.argv) > 2 else 2)
+    elif command == 'submit':
+        protocol = sys.argv[2]
+        key_length = int(sys.argv[3])
+        num_iter = int(sys.argv[4])
+        noise = parse_points(sys.argv[5] if len(sys.argv) > 5 else '-')[0]
+        attack = (sys.argv[6] if len(sys.argv) > 6 else 'True') == 'True'
+        seed = int(sys.argv[7]) if len(sys.argv) > 7 else None
+        print(f'Saved {submit(protocol, key_length, num_iter, noise, attack, seed)}')
+    elif command in ('status', 'stop'):
+        for reply in request({'type': command}):
+            print(', '.join(f'{k}: {v}' for k, v in reply.items() if k != 'type') or reply['type'])
+    else:
+        raise SystemExit(f'Unknown command {command!r}. Expected serve, submit, status or stop.')
@@ -0,0 +1,263 @@
+from QZKP_engine import protocol_simulator, quantum_random_bits, run_protocol
+from QZKP_results import PROTOCOLS, MatchHistogram, send_message, receive_message, output_name, parse_points, run_description
+from QZKP_progress import Progress
+from QZKP_metrics import Gauge, start_from_environment
+import numpy as np
+import pandas as pd
+import socketserver
+import subprocess
+import threading
+import socket
+import time
+import sys
+import os
+
+#----------------------------------------
+# Distributed runner
+#----------------------------------------
+# A coordinator splits a sweep (noise points x iterations) into work units and
+# serves them over TCP as JSON lines. Workers ask for a unit, simulate it with
+# the grouped backend and send the results back with their next request:
+#
+#   worker -> {"type": "request"}                      first message
+#   worker -> {"type": "result", "id": ..., ...}        result, then next unit
+#   coordinator -> {"type": "unit", ...} | {"type": "wait"} | {"type": "stop"}
+#
+# Units leased to a worker that disconnects or exceeds the lease time go back to
+# the queue; a result for a unit that is already done is ignored. Every unit
+# carries its own seed, so the output does not depend on how units are spread.
+
+LEASE_TIMEOUT = 600     # Seconds before a leased unit is handed out again
+WAIT_INTERVAL = 0.5     # Seconds a worker waits when every unit is leased
+UNITS = Gauge('qzkp_distributed_units', 'Work units by state')
+
+def make_units(protocol, key_length, num_iter, points, attack, unit_size, seed):
+    '''
+    Work units of a sweep. Keys (a, b) are drawn once per noise point.
+    '''
+    units = []
+    for k, noise in enumerate(points):
+        np.random.seed(np.random.SeedSequence([seed, k]).generate_state(1)[0])
+        sim = protocol_simulator(protocol, noise)
+        b = quantum_random_bits(sim, key_length)
+        a = quantum_random_bits(sim, key_length)
+        for j, start in enumerate(range(0, num_iter, unit_size)):
+            units.append({
+                'id': len(units),
+                'point': k,
+                'protocol': protocol,
+                'noise': list(noise),
+                'attack': attack,
+                'a': a.astype(int).tolist(),
+                'b': b.astype(int).tolist(),
+                'start': start,
+                'count': min(unit_size, num_iter - start),
+                'seed': int(np.random.SeedSequence([seed, k, j]).generate_state(1)[0]),
+            })
+    return units
+
+def run_unit(unit, sims):
+    '''
+    Decisions and percentages of a unit. sims caches one simulator per protocol and noise.
+    '''
+    key = (unit['protocol'], tuple(unit['noise']))
+    if key not in sims:
+        sims[key] = protocol_simulator(*key)
+    np.random.seed(unit['seed'])
+    return run_protocol(unit['protocol'], np.array(unit['a']), np.array(unit['b']), unit['count'],
+                        tuple(unit['noise']), unit['attack'], sims[key])
+
+class Coordinator:
+    '''
+    Unit queue with leases, shared by the connection handlers.
+    '''
+    def __init__(self, units, lease_timeout=LEASE_TIMEOUT, progress=None):
+        self.units = {unit['id']: unit for unit in units}
+        self.pending = [unit['id'] for unit in reversed(units)]
+        self.leases = {}
+        self.results = {}
+        self.lease_timeout = lease_timeout
+        self.progress = progress
+        self.iterations = 0
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        if not units:
+            self.finished.set()
+
+    def _count(self):
+        UNITS.set(len(self.pending), state='pending')
+        UNITS.set(len(self.leases), state='leased')
+        UNITS.set(len(self.results), state='done')
+
+    def lease(self, worker):
+        with self.lock:
+            now = time.time()
+            for unit_id, (owner, deadline) in list(self.leases.items()):
+                if deadline < now:
+                    del self.leases[unit_id]
+                    self.pending.append(unit_id)
+            if self.finished.is_set():
+                return {'type': 'stop'}
+            if not self.pending:
+                return {'type': 'wait'}
+            unit_id = self.pending.pop()
+            self.leases[unit_id] = (worker, now + self.lease_timeout)
+            self._count()
+            return dict(self.units[unit_id], type='unit')
+
+    def complete(self, message):
+        with self.lock:
+            unit_id = message['id']
+            self.leases.pop(unit_id, None)
+            if unit_id in self.results:
+                return
+            if unit_id in self.pending:
+                self.pending.remove(unit_id)
+            self.results[unit_id] = (message['decisions'], message['percentages'])
+            self.iterations += len(message['percentages'])
+            if self.progress:
+                self.progress.update(self.iterations)
+            self._count()
+            if len(self.results) == len(self.units):
+                self.finished.set()
+
+    def release(self, worker):
+        with self.lock:
+            for unit_id, (owner, _) in list(self.leases.items()):
+                if owner == worker:
+                    del self.leases[unit_id]
+                    self.pending.append(unit_id)
+
+    def tables(self):
+        '''
+        One results table per noise point, rows in iteration order.
+        '''
+        tables = {}
+        for unit_id in sorted(self.units):
+            unit = self.units[unit_id]
+            decisions, percentages = self.results[unit_id]
+            tables.setdefault(unit['point'], []).append(pd.DataFrame({
+                'Iteration': np.arange(unit['start'] + 1, unit['start'] + unit['count'] + 1),
+                'Decision': decisions,
+                'Percentages': percentages,
+            }))
+        return {point: pd.concat(parts, ignore_index=True) for point, parts in tables.items()}
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        worker = self.client_address
+        try:
+            while True:
+                message = receive_message(self.rfile)
+                if message.get('type') == 'result':
+                    coordinator.complete(message)
+                reply = coordinator.lease(worker)
+                send_message(self.wfile, reply)
+                if reply['type'] == 'stop':
+                    return
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            coordinator.release(worker)
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def serve(coordinator, host, port):
+    '''
+    Start serving units on a background thread; returns the server.
+    '''
+    server = _Server((host, port), _Handler)
+    server.coordinator = coordinator
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def worker(host, port, retry=30):
+    '''
+    Work units from a coordinator until it says stop.
+    '''
+    deadline = time.time() + retry
+    while True:
+        try:
+            connection = socket.create_connection((host, port))
+            break
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(WAIT_INTERVAL)
+    start_from_environment()
+    sims = {}
+    with connection, connection.makefile('rwb') as f:
+        send_message(f, {'type': 'request'})
+        while True:
+            try:
+                message = receive_message(f)
+            except ConnectionError:
+                return   # Coordinator finished or went away
+            if message['type'] == 'stop':
+                return
+            if message['type'] == 'wait':
+                time.sleep(WAIT_INTERVAL)
+                send_message(f, {'type': 'request'})
+                continue
+            decisions, percentages = run_unit(message, sims)
+            send_message(f, {'type': 'result', 'id': message['id'],
+                      'decisions': decisions.tolist(), 'percentages': percentages.tolist()})
+
+def coordinate(port, protocol, key_length, num_iter, points, attack, unit_size, seed, local_workers=0):
+    '''
+    Run a sweep, optionally spawning local worker processes, and save one CSV per noise point.
+    '''
+    units = make_units(protocol, key_length, num_iter, points, attack, unit_size, seed)
+    coordinator = Coordinator(units, progress=Progress(num_iter * len(points), key_length))
+    server = serve(coordinator, '0.0.0.0' if not local_workers else '127.0.0.1', port)
+    port = server.server_address[1]
+    print(f'Coordinator listening on port {port}: {len(units)} units')
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker', '127.0.0.1', str(port)])
+                 for _ in range(local_workers)]
+    try:
+        coordinator.finished.wait()
+    finally:
+        server.shutdown()
+        server.server_close()
+        for process in processes:
+            process.wait()
+    for point, table in coordinator.tables().items():
+        if protocol == 'attack_ideal':
+            table = table.drop(columns='Decision')
+        name = output_name(protocol, key_length, num_iter, points[point], attack)
+        table.to_csv(name, index=False)
+        histogram = MatchHistogram(key_length, run_description(protocol, attack, points[point]))
+        histogram.add(table['Decision'] if 'Decision' in table else 1, table['Percentages'])
+        histogram.save(name)
+        print(f'Saved {name}')
+
+#----------------------------------------
+# Execution
+#----------------------------------------
+if __name__=='__main__':
+
+    role = sys.argv[1]
+    if role == 'worker':
+        worker(sys.argv[2], int(sys.argv[3]))
+        sys.exit()
+
+    # coordinator <port> ... or local <workers> ...
+    if role not in ('coordinator', 'local'):
+        raise SystemExit(f'Unknown role {role!r}. Expected coordinator, worker or local.')
+    protocol = sys.argv[3]
+    if protocol not in PROTOCOLS:
+        raise SystemExit(f'Unknown protocol {protocol!r}. Expected one of: {", ".join(PROTOCOLS)}')
+    key_length = int(sys.argv[4])
+    num_iter = int(sys.argv[5])
+    points = parse_points(sys.argv[6] if len(sys.argv) > 6 else '-')
+    attack = (sys.argv[7] if len(sys.argv) > 7 else 'True') == 'True'
+    unit_size = int(sys.argv[8]) if len(sys.argv) > 8 else 1000
+    seed = int(sys.argv[9]) if len(sys.argv) > 9 else int(np.random.SeedSequence().entropy % 2**32)
+    if role == 'coordinator':
+        coordinate(int(sys.argv[2]), protocol, key_length, num_iter, points, attack, unit_size, seed)
+    else:
+        coordinate(0, protocol, key_length, num_iter, points, attack, unit_size, seed, local_workers=int(sys.argv[2]))
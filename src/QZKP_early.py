@@ -0,0 +1,78 @@
+from QZKP_engine import cached_simulator, quantum_random_bits, early_rounds, required_matches
+from QZKP_results import PROTOCOLS, MatchHistogram, parse_points, run_description
+from QZKP_progress import Progress
+import numpy as np
+import pandas as pd
+import time
+import sys
+
+#----------------------------------------
+# Early decision
+#----------------------------------------
+# Rounds of an iterative script verified with early decision (see early_rounds
+# in QZKP_engine): Bob stops measuring a round once it has enough matches to
+# be accepted or too many mismatches to ever be, and the qubits he measured
+# are recorded. Against a high threshold a dishonest prover is rejected after
+# a few blocks, so adversarial workloads simulate a small part of every key.
+
+def summarize(results, key_length):
+    '''
+    Rounds, acceptance rate and mean qubits measured (also as a fraction of
+    the key) of the honest and dishonest rounds.
+    '''
+    rows = []
+    for decision, label in ((0, 'Honest'), (1, 'Dishonest')):
+        group = results[results['Decision'] == decision]
+        if len(group):
+            rows.append({'Prover': label, 'Rounds': len(group), 'Accepted': group['Accepted'].mean() * 100,
+                         'Mean qubits': group['Qubits'].mean(), 'Key fraction': group['Qubits'].mean() / key_length})
+    return pd.DataFrame(rows)
+
+#----------------------------------------
+# Execution
+#----------------------------------------
+if __name__=='__main__':
+
+    # <script> <key_length> <num_iterations> <noise_point> <threshold> <attacker> [block]
+    protocol = sys.argv[1]
+    if protocol not in PROTOCOLS:
+        raise SystemExit(f'Unknown script {protocol!r}. Expected one of: {", ".join(PROTOCOLS)}')
+    key_length = int(sys.argv[2])
+    num_iter = int(sys.argv[3])
+    noise = parse_points(sys.argv[4])[0]
+    threshold = float(sys.argv[5]) if len(sys.argv) > 5 else 100.0
+    attack = (sys.argv[6] if len(sys.argv) > 6 else 'True') == 'True'
+    block = int(sys.argv[7]) if len(sys.argv) > 7 else 32
+    if not 0 <= threshold <= 100:
+        raise SystemExit('The threshold must be a match percentage between 0 and 100.')
+
+    sim = cached_simulator(protocol, noise)
+    b = quantum_random_bits(sim, key_length)
+    a = quantum_random_bits(sim, key_length)
+    progress = Progress(num_iter, key_length)
+    start = time.perf_counter()
+    decisions, accepted, measured, percentages = early_rounds(protocol, a, b, num_iter, threshold, noise, attack, sim,
+                                                              block, progress=progress.update)
+    seconds = time.perf_counter() - start
+
+    #----------------------------------------
+    # Data
+    #----------------------------------------
+    results = pd.DataFrame({'Iteration': np.arange(1, num_iter + 1), 'Decision': decisions,
+                            'Accepted': accepted.astype(int), 'Qubits': measured, 'Percentages': percentages})
+    print(f'\nThreshold: {threshold}% ({required_matches(threshold, key_length)} of {key_length} matches), '
+          f'blocks of {block} qubits\n')
+    print(summarize(results, key_length).to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+    total = measured.sum()
+    print(f'\nMeasured {total} of {num_iter * key_length} qubits ({num_iter * key_length / max(total, 1):.1f}x fewer) '
+          f'in {seconds:.2f}s')
+    histogram = MatchHistogram(key_length, run_description(protocol, attack, noise,
+                                                           f'early threshold={threshold} block={block}'))
+    measured_any = measured > 0 # A threshold of 0 accepts before measuring anything
+    histogram.add(decisions[measured_any], percentages[measured_any])
+    if protocol == 'attack_ideal':
+        results = results.drop(columns='Decision')
+    csv_file = f'iter_early_data_{protocol}_attack={attack}_{key_length}_{num_iter}_{noise[0]}_{noise[1]}_{threshold}.csv'
+    results.to_csv(csv_file, index=False)
+    histogram.save(csv_file)
+    print(f'\nSaved {csv_file}')
@@ -0,0 +1,1007 @@
+from qiskit import QuantumCircuit, transpile
+from qiskit.circuit import ParameterVector
+from qiskit_aer import AerSimulator
+from qiskit_aer.noise import NoiseModel, phase_amplitude_damping_error
+from QZKP_results import PROTOCOLS
+from QZKP_metrics import KEY_SESSIONS, QUBITS, SIMULATOR_CALLS, STAGE_SECONDS, TRANSPILE_CACHE
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import threading
+import queue
+
+#----------------------------------------
+# Auxiliary functions
+#----------------------------------------
+def _seed(rng=np.random):
+    '''
+    Simulator seed drawn from numpy's global generator (or rng), so that seeding
+    numpy makes every simulator call below reproducible.
+    '''
+    return int(rng.randint(2**31 - 1))
+
+def quantum_random_bits(sim, shape, rng=np.random):
+    '''
+    Bulk version of quantum_random_binary_string: one coin circuit, one shot per bit.
+    '''
+    size = int(np.prod(shape))
+    qcoin = QuantumCircuit(1, 1)
+    qcoin.h(0)
+    qcoin.measure(0, 0)
+    with STAGE_SECONDS.time(stage='random_bits'):
+        result = sim.run(qcoin, shots=size, memory=True, seed_simulator=_seed(rng)).result()
+    SIMULATOR_CALLS.inc()
+    QUBITS.inc(size)
+    return single_bit_memory(result, 0).reshape(shape)
+
+def memory_to_bits(memory, width):
+    '''
+    Aer memory strings to a (shots, width) bit array, clbit 0 first.
+    '''
+    raw = np.frombuffer(''.join(memory).encode(), dtype=np.uint8).reshape(len(memory), -1)
+    return raw[:, ::-1][:, :width] - ord('0')
+
+def single_bit_memory(result, experiment):
+    '''
+    Shots of a one-clbit experiment as a bit array. Reads the raw hex memory,
+    much faster than get_memory for millions of shots.
+    '''
+    return (np.asarray(result.data(experiment)['memory']) == '0x1').astype(np.uint8)
+
+def match_percentages(c, c_aprox):
+    '''
+    Row-wise equal_entries_percentage.
+    '''
+    c = np.asarray(c)
+    return (np.asarray(c_aprox) == c).sum(axis=1) / c.shape[1] * 100
+
+#----------------------------------------
+# Parameterized templates
+#----------------------------------------
+def _h(qc, i):
+    '''
+    Hadamard written as a u gate. The per-qubit path transpiles every circuit,
+    which folds the honest H gates into rz/sx, so the damping error attached to
+    'h' never fires there; writing H as u keeps the template equivalent.
+    '''
+    qc.u(np.pi / 2, 0, np.pi, i)
+
+def honest_template(a, b, pbit=0.0, pphase=0.0):
+    '''
+    Parameterized circuit of a whole honest round for the key (a, b).
+
+    Only the challenge changes between iterations, so it is left as the
+    parameters c: X^c is written as rx(pi*c) and Z^c as rz(pi*c), equal up to a
+    global phase. If pbit or pphase are given, the flips of QZKP_noise_flip.py
+    are added as rx/rz slots after the same gates (see flip_binds).
+    Returns the circuit, the challenge parameters and the flip slots.
+    '''
+    if len(a) != len(b):
+        raise ValueError('Same number of b and bits expected.')
+    n = len(a)
+    c = ParameterVector('c', n)
+    sites = []
+    fx = fz = None
+    if pbit > 0 or pphase > 0:
+        m = sum(3 * a[i] + b[i] + (a[i] ^ b[i]) + 1 for i in range(n))
+        fx = ParameterVector('fx', m) if pbit > 0 else None
+        fz = ParameterVector('fz', m) if pphase > 0 else None
+    qc = QuantumCircuit(n, n)
+
+    def flip(i, on_challenge=False):
+        if fx is None and fz is None:
+            return
+        k = len(sites)
+        sites.append((i, on_challenge))
+        if fx is not None:
+            qc.rx(np.pi * fx[k], i)
+        if fz is not None:
+            qc.rz(np.pi * fz[k], i)
+
+    for i in range(n):
+        # |psi> state
+        if a[i] == 1:
+            qc.x(i)
+            flip(i)
+        if b[i] == 1:
+            _h(qc, i)
+        # Challenge
+        if b[i] == 0:
+            qc.rx(np.pi * c[i], i)
+        else:
+            qc.rz(np.pi * c[i], i)
+        flip(i, on_challenge=True)
+        # Alice modifications
+        if b[i] == 1:
+            qc.z(i)
+            flip(i)
+        if a[i] ^ b[i] == 1:
+            _h(qc, i)
+            flip(i)
+        if a[i] == 1:
+            qc.z(i)
+            flip(i)
+        # Bob measures with a
+        if a[i] == 1:
+            _h(qc, i)
+            flip(i)
+    qc.measure(range(n), range(n))
+    flips = {'sites': sites, 'fx': (fx, pbit), 'fz': (fz, pphase)}
+    return qc, c, flips
+
+def attack_template(a, b):
+    '''
+    Parameterized circuit of a whole round against Eve (who knows a XOR b).
+
+    Parameters are the challenge c and Eve's two random bases r (measurement)
+    and s (re-encoding). H^r before a measurement is written as ry(-pi/2*r) and
+    H^s on a computational state as ry(pi/2*s): both give the same outcome
+    statistics. Eve's outcome is kept in the qubit itself, so the re-encoded
+    estimation is a XOR b XOR outcome. Clbits n..2n-1 hold Eve's results.
+    '''
+    if len(a) != len(b):
+        raise ValueError('Same number of b and bits expected.')
+    n = len(a)
+    c = ParameterVector('c', n)
+    r = ParameterVector('r', n)
+    s = ParameterVector('s', n)
+    qc = QuantumCircuit(n, 2 * n)
+    for i in range(n):
+        if a[i] == 1:
+            qc.x(i)
+        if b[i] == 1:
+            qc.h(i)
+        if b[i] == 0:
+            qc.rx(np.pi * c[i], i)
+        else:
+            qc.rz(np.pi * c[i], i)
+        qc.ry(-np.pi / 2 * r[i], i)
+        qc.measure(i, n + i)
+        if a[i] ^ b[i] == 1:
+            qc.x(i)
+        qc.ry(np.pi / 2 * s[i], i)
+        if a[i] == 1:
+            qc.h(i)
+    qc.measure(range(n), range(n))
+    return qc, (c, r, s)
+
+def flip_binds(flips, c_rows, rng=np.random):
+    '''
+    Random flip values for the noise slots of an honest template.
+    Slots after a challenge gate only fire when that challenge bit is 1.
+    '''
+    binds = {}
+    sites = flips['sites']
+    if not sites:
+        return binds
+    rows = len(c_rows)
+    qubits = np.array([i for i, _ in sites])
+    gated = np.array([on_challenge for _, on_challenge in sites])
+    active = np.where(gated, c_rows[:, qubits], 1)
+    for params, p in (flips['fx'], flips['fz']):
+        if params is None:
+            continue
+        draws = (rng.random((rows, len(sites))) < p) * active
+        binds.update({params[k]: draws[:, k].astype(float).tolist() for k in range(len(sites))})
+    return binds
+
+def run_template(sim, template, binds, width, batch=1024, progress=None):
+    '''
+    Execute a template once per row of the bound values as a single Aer job
+    per batch and return Bob's results as a (rows, width) bit array.
+    progress, if given, is called with the number of rows done after each job.
+    '''
+    rows = len(next(iter(binds.values())))
+    if rows == 0:
+        return np.zeros((0, width), dtype=np.uint8)
+    results = []
+    for start in range(0, rows, batch):
+        chunk = {p: v[start:start + batch] for p, v in binds.items()}
+        with STAGE_SECONDS.time(stage='template'):
+            job = sim.run(template, parameter_binds=[chunk], shots=1, memory=True, seed_simulator=_seed()).result()
+        memory = [job.get_memory(k)[0] for k in range(min(batch, rows - start))]
+        SIMULATOR_CALLS.inc()
+        QUBITS.inc(len(memory) * template.num_qubits)
+        results.append(memory_to_bits(memory, width))
+        if progress:
+            progress(start + len(memory))
+    return np.concatenate(results)
+
+def honest_template_rounds(sim, a, b, c_rows, pbit=0.0, pphase=0.0, batch=1024, progress=None):
+    '''
+    Match percentages of honest rounds for every challenge row in c_rows.
+    '''
+    template, c, flips = honest_template(a, b, pbit, pphase)
+    c_rows = np.asarray(c_rows, dtype=np.uint8)
+    binds = {c[i]: c_rows[:, i].astype(float).tolist() for i in range(len(a))}
+    binds.update(flip_binds(flips, c_rows))
+    b_xor_c = run_template(sim, template, binds, len(a), batch, progress)
+    return match_percentages(c_rows, np.asarray(b, dtype=np.uint8) ^ b_xor_c)
+
+def attack_template_rounds(sim, a, b, c_rows, batch=1024, progress=None):
+    '''
+    Match percentages of Eve's rounds for every challenge row in c_rows.
+    '''
+    template, (c, r, s) = attack_template(a, b)
+    c_rows = np.asarray(c_rows, dtype=np.uint8)
+    rows, n = c_rows.shape
+    r_rows = np.random.randint(0, 2, (rows, n))
+    s_rows = np.random.randint(0, 2, (rows, n))
+    binds = {}
+    for params, values in ((c, c_rows), (r, r_rows), (s, s_rows)):
+        binds.update({params[i]: values[:, i].astype(float).tolist() for i in range(n)})
+    results = run_template(sim, template, binds, n, batch, progress)
+    return match_percentages(c_rows, np.asarray(b, dtype=np.uint8) ^ results)
+
+#----------------------------------------
+# Multiplicity-grouped sampling
+#----------------------------------------
+def measure_in_basis(qubit, basis):
+    '''
+    Basis change and measurement of measurements(), without running the circuit.
+    '''
+    if basis == 1:
+        qubit.h(0)
+    qubit.measure(0, 0)
+    return qubit
+
+def group_codes(codes, radix, build):
+    '''
+    Distinct circuits of signatures given as codes, codes[k] being the digits
+    of signature k in the mixed radix `radix` (first column most significant):
+    (circuits, inverse, counts), each circuit built once with build(signature).
+    Small radices are counted with np.bincount, in linear time.
+    '''
+    size = int(np.prod(radix))
+    if size <= max(1 << 16, len(codes)):
+        counts = np.bincount(codes, minlength=size)
+        keys = np.flatnonzero(counts)
+        rank = np.zeros(size, dtype=np.int64)
+        rank[keys] = np.arange(len(keys))
+        inverse, counts = rank[codes], counts[keys]
+    else:
+        keys, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+    circuits = [build(tuple(int(d) for d in np.unravel_index(k, radix))) for k in keys]
+    return circuits, inverse.ravel(), counts
+
+def group_signatures(signatures, build):
+    '''
+    Distinct circuits of the rows of signatures, built once each with
+    build(signature): (circuits, inverse, counts) as returned by np.unique.
+    '''
+    signatures = np.asarray(signatures, dtype=np.int64)
+    if signatures.ndim == 1:
+        signatures = signatures[:, None]
+    radix = tuple(int(r) for r in signatures.max(axis=0) + 1)
+    codes = np.zeros(len(signatures), dtype=np.int64)
+    for column, base in zip(signatures.T, radix):
+        codes = codes * base + column
+    return group_codes(codes, radix, build)
+
+def run_groups(sim, groups, rng=np.random):
+    '''
+    Outcomes of grouped circuits (see group_signatures), one per signature row.
+    Every circuit runs with shots equal to its multiplicity, in one simulator
+    call per distinct multiplicity, so no shot is simulated to be thrown away.
+    '''
+    circuits, inverse, counts = groups
+    QUBITS.inc(len(inverse))
+    # Few groups: a 16-bit key lets numpy use its linear-time radix sort
+    order = np.argsort(inverse.astype(np.uint16) if len(circuits) <= 1 << 16 else inverse, kind='stable')
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    outcomes = np.empty(len(inverse), dtype=np.uint8)
+    for shots in np.unique(counts):
+        members = np.flatnonzero(counts == shots)
+        with STAGE_SECONDS.time(stage='grouped_run'):
+            result = sim.run([circuits[g] for g in members], shots=int(shots), seed_simulator=_seed(rng)).result()
+        SIMULATOR_CALLS.inc()
+        for k, g in enumerate(members):
+            bits = np.zeros(shots, dtype=np.uint8)
+            bits[:result.get_counts(k).get('1', 0)] = 1
+            rng.shuffle(bits)
+            outcomes[order[bounds[g]:bounds[g + 1]]] = bits
+    return outcomes
+
+def grouped_run(sim, signatures, build, rng=np.random):
+    '''
+    One measurement outcome per row of signatures, a (qubits, k) array of
+    small non-negative integers that fully determines each single-qubit circuit.
+
+    Every distinct circuit is built once with build(signature) and run with
+    as many shots as qubits share its signature; the shots are scattered back
+    to those qubits. Shots are independent and exchangeable, so the outcome
+    counts of a circuit shuffled over its qubits are statistically the same as
+    one run per qubit while avoiding per-shot memory strings.
+    '''
+    return run_groups(sim, group_signatures(signatures, build), rng)
+
+#----------------------------------------
+# Grouped rounds of the iterative protocols
+#----------------------------------------
+# Per-qubit circuits mirror psi_gen, challenge_gen, alice_mod and measurements
+# of the scripts gate for gate. Every gate is Clifford, so the bit/phase flips
+# QZKP_noise_flip.py inserts after them can be pushed to the measurement: a
+# flip behind an even number of h gates stays what it is, behind an odd number
+# X and Z swap, and only the resulting X changes the outcome. Each qubit then
+# carries one net flip bit and a signature fully determines its circuit.
+def _measure(qubit, flip):
+    if flip == 1:
+        qubit.x(0)
+    qubit.measure(0, 0)
+    return qubit
+
+def honest_qubit(signature):
+    '''
+    Honest round of one qubit measured by Bob with a. Signature: (a_i, b_i, c_i[, flip]).
+    '''
+    a_i, b_i, c_i, *flip = signature
+    qubit = QuantumCircuit(1, 1)
+    if a_i == 1:
+        qubit.x(0)
+    if b_i == 1:
+        qubit.h(0)
+    if c_i == 1:
+        if b_i == 0:
+            qubit.x(0)
+        else:
+            qubit.z(0)
+    if b_i == 1:
+        qubit.z(0)
+    if a_i ^ b_i == 1:
+        qubit.h(0)
+    if a_i == 1:
+        qubit.z(0)
+        qubit.h(0)
+    return _measure(qubit, *flip or [0])
+
+def intercept_qubit(signature):
+    '''
+    Eve measures a challenge qubit in the random basis r_i. Signature: (a_i, b_i, c_i, r_i[, flip]).
+    '''
+    a_i, b_i, c_i, r_i, *flip = signature
+    qubit = QuantumCircuit(1, 1)
+    if a_i == 1:
+        qubit.x(0)
+    if b_i == 1:
+        qubit.h(0)
+    if c_i == 1:
+        if b_i == 0:
+            qubit.x(0)
+        else:
+            qubit.z(0)
+    if r_i == 1:
+        qubit.h(0)
+    return _measure(qubit, *flip or [0])
+
+def resend_qubit(signature):
+    '''
+    Eve's estimation e_i encoded in the random basis s_i, measured by Bob with a.
+    Signature: (e_i, s_i, a_i[, flip]).
+    '''
+    e_i, s_i, a_i, *flip = signature
+    qubit = QuantumCircuit(1, 1)
+    if e_i == 1:
+        qubit.x(0)
+    if s_i == 1:
+        qubit.h(0)
+    if a_i == 1:
+        qubit.h(0)
+    return _measure(qubit, *flip or [0])
+
+# Flip slots of the per-qubit circuits: for every gate QZKP_noise_flip.py
+# follows with a flip, whether the gate is applied and how many h gates come
+# after it (see _net_flip), from signature digits given as scalars or arrays.
+def honest_flip_slots(a, b, c):
+    '''
+    (present, h_after) of honest_qubit: psi_gen x, challenge gate, alice_mod z, h, z and Bob's h.
+    '''
+    x = a ^ b
+    return np.stack([a, c, b, x, a, a], axis=-1).astype(bool), np.stack([b + x + a, x + a, x + a, a, a, 0 * a], axis=-1)
+
+def intercept_flip_slots(a, b, c, r):
+    '''
+    (present, h_after) of intercept_qubit: psi_gen x, challenge gate and Eve's h.
+    '''
+    return np.stack([a, c, r], axis=-1).astype(bool), np.stack([b + r, r, 0 * r], axis=-1)
+
+def resend_flip_slots(e, s, a):
+    '''
+    (present, h_after) of resend_qubit: psi_gen x and Bob's h.
+    '''
+    return np.stack([e, a], axis=-1).astype(bool), np.stack([s + a, 0 * s], axis=-1)
+
+FLIP_SLOTS = {honest_qubit: honest_flip_slots, intercept_qubit: intercept_flip_slots, resend_qubit: resend_flip_slots}
+
+def _net_flip(present, h_after, pbit, pphase, rng=np.random):
+    '''
+    Net outcome flip of each qubit, as an extra signature column (none if noiseless).
+    present[:, k] tells whether flip slot k exists (its gate was applied) and
+    h_after[:, k] how many h gates follow it. pbit and pphase are scalars or
+    (qubits, 1) columns.
+    '''
+    if np.all(np.asarray(pbit) <= 0) and np.all(np.asarray(pphase) <= 0):
+        return np.zeros((len(present), 0), dtype=np.uint8)
+    fx = (rng.random_sample(present.shape) < pbit) & present
+    fz = (rng.random_sample(present.shape) < pphase) & present
+    reaching = np.where(h_after % 2 == 0, fx, fz)
+    return (np.bitwise_xor.reduce(reaching, axis=1)[:, None]).astype(np.uint8)
+
+def _per_qubit(p, selected):
+    '''
+    Flip probability of every selected qubit (a (rows, n) mask), from a scalar or a per-row array.
+    '''
+    p = np.asarray(p, dtype=float)
+    return p if p.ndim == 0 else np.broadcast_to(p[:, None], selected.shape)[selected][:, None]
+
+_transpiled = {}   # (target operations, builder, signature) -> transpiled circuit
+
+def transpiled_builder(sim, build):
+    '''
+    build followed by transpile(qubit, sim), cached by signature for every
+    simulator with the same target (the noise parameters do not change it), so
+    long-lived processes transpile each distinct per-qubit circuit once.
+    '''
+    target = tuple(sorted(sim.target.operation_names))
+    def finish(signature):
+        key = (target, build.__name__, tuple(int(x) for x in signature))
+        if key in _transpiled:
+            TRANSPILE_CACHE.inc(result='hit')
+        else:
+            TRANSPILE_CACHE.inc(result='miss')
+            with STAGE_SECONDS.time(stage='transpile'):
+                _transpiled[key] = transpile(build(signature), sim)
+        return _transpiled[key]
+    return finish
+
+#----------------------------------------
+# Key sessions
+#----------------------------------------
+# A key pair (a, b) is usually verified over many rounds. Everything the rounds
+# derive from the key alone (a XOR b, the key digits of every signature code and
+# the flip slots the key fixes) is computed once per key in a KeySession, kept
+# in a small LRU keyed by a fingerprint of the key, so a round only pays for
+# its challenge, noise and simulation. Distinct circuits are transpiled once
+# per process anyway (transpiled_builder). The block backends build the
+# sessions of their key blocks directly: a long key has more blocks than the
+# LRU holds, visited in order, so through it every block would miss.
+SESSIONS = 32   # Key sessions kept
+
+class KeySession:
+    '''
+    Precomputed key-dependent parts of the grouped rounds of a key pair (a, b).
+    '''
+    def __init__(self, a, b):
+        self.a = np.asarray(a, dtype=np.uint8)
+        self.b = np.asarray(b, dtype=np.uint8)
+        self.x = self.a ^ self.b
+        self.key_code = (self.a.astype(np.int64) << 1) | self.b   # Signature digits (a_i, b_i)
+        # Honest flip slots, the challenge gate being set per round
+        self.honest_present, self.honest_h_after = honest_flip_slots(self.a, self.b, 0 * self.a)
+
+def key_fingerprint(a, b):
+    a, b = np.asarray(a, dtype=np.uint8), np.asarray(b, dtype=np.uint8)
+    digest = hashlib.sha256(len(a).to_bytes(8, 'little'))
+    digest.update(np.packbits(a).tobytes())
+    digest.update(np.packbits(b).tobytes())
+    return digest.hexdigest()
+
+_sessions = OrderedDict()   # fingerprint -> KeySession, least recently used first
+_sessions_lock = threading.Lock()
+
+def key_session(a, b):
+    '''
+    KeySession of the key pair (a, b), from the LRU when it was seen recently.
+    '''
+    fingerprint = key_fingerprint(a, b)
+    with _sessions_lock:
+        session = _sessions.get(fingerprint)
+        if session is not None:
+            _sessions.move_to_end(fingerprint)
+            KEY_SESSIONS.inc(result='hit')
+            return session
+    KEY_SESSIONS.inc(result='miss')
+    session = KeySession(a, b)
+    with _sessions_lock:
+        _sessions[fingerprint] = session
+        while len(_sessions) > SESSIONS:
+            _sessions.popitem(last=False)
+    return session
+
+def _is_noisy(pbit, pphase):
+    return not (np.all(np.asarray(pbit) <= 0) and np.all(np.asarray(pphase) <= 0))
+
+def _with_flip(codes, radix, flip):
+    '''
+    Append the net flip column (if any, see _net_flip) to signature codes.
+    '''
+    if flip is None or flip.shape[1] == 0:
+        return codes, radix
+    return codes * 2 + flip[:, 0], radix + (2,)
+
+def plan_matches(sim, a, b, c, decisions, attack=True, pbit=0.0, pphase=0.0, transpiled=False, rng=np.random,
+                 detected=None, session=None):
+    '''
+    First half of simulate_matches: draws the noise and Eve's bases and builds
+    the distinct circuits of the honest and interception stages, without
+    running anything. The plan is completed by finish_matches. session, the
+    KeySession of (a, b), is taken from the LRU if not given.
+    '''
+    session = session or key_session(a, b)
+    c = np.asarray(c, dtype=np.uint8)
+    decisions = np.asarray(decisions)
+    finish = (lambda build: transpiled_builder(sim, build)) if transpiled else (lambda build: build)
+    noisy = _is_noisy(pbit, pphase)
+    # Lost qubits (see survival_mask) are left out of every stage
+    detected = np.ones(c.shape, dtype=bool) if detected is None else np.asarray(detected, dtype=bool)
+    plan = {'sim': sim, 'session': session, 'c': c, 'finish': finish, 'detected': detected}
+
+    honest = (decisions == 0)[:, None] & detected
+    if honest.any():
+        c_h = c[honest]
+        flip = None
+        if noisy:
+            present = np.broadcast_to(session.honest_present, c.shape + (6,))[honest]
+            present[:, 1] = c_h
+            h_after = np.broadcast_to(session.honest_h_after, c.shape + (6,))[honest]
+            flip = _net_flip(present, h_after, _per_qubit(pbit, honest), _per_qubit(pphase, honest), rng)
+        # Signature (a_i, b_i, c_i[, flip])
+        codes = np.broadcast_to(session.key_code, c.shape)[honest] * 2 + c_h
+        codes, radix = _with_flip(codes, (2, 2, 2), flip)
+        plan['honest'] = (honest, group_codes(codes, radix, finish(honest_qubit)))
+
+    eve = ((decisions == 1) & attack)[:, None] & detected
+    if eve.any():
+        a_e, b_e = np.broadcast_to(session.a, c.shape)[eve], np.broadcast_to(session.b, c.shape)[eve]
+        c_e = c[eve]
+        pbit_e, pphase_e = _per_qubit(pbit, eve), _per_qubit(pphase, eve)
+        r = rng.randint(0, 2, a_e.shape).astype(np.uint8)
+        flip = None
+        if noisy:
+            present, h_after = intercept_flip_slots(a_e, b_e, c_e, r)
+            flip = _net_flip(present, h_after, pbit_e, pphase_e, rng)
+        # Signature (a_i, b_i, c_i, r_i[, flip])
+        codes = (np.broadcast_to(session.key_code, c.shape)[eve] * 2 + c_e) * 2 + r
+        codes, radix = _with_flip(codes, (2, 2, 2, 2), flip)
+        plan['eve'] = (eve, a_e, a_e ^ b_e, pbit_e, pphase_e, noisy, group_codes(codes, radix, finish(intercept_qubit)))
+
+    plan['guess'] = (decisions == 1) & (not attack)
+    return plan
+
+def finish_matches(plan, rng=np.random):
+    '''
+    Second half of simulate_matches: runs the stages of a plan and counts the
+    matches among the detected qubits.
+    '''
+    sim, session, c, finish = plan['sim'], plan['session'], plan['c'], plan['finish']
+    rows, n = c.shape
+    b = session.b
+    outcomes = np.zeros((rows, n), dtype=np.uint8)
+    if 'honest' in plan:
+        honest, groups = plan['honest']
+        outcomes[honest] = run_groups(sim, groups, rng)
+    if 'eve' in plan:
+        eve, a_e, x_e, pbit_e, pphase_e, noisy, groups = plan['eve']
+        estimation = x_e ^ run_groups(sim, groups, rng)
+        s = rng.randint(0, 2, a_e.shape).astype(np.uint8)
+        flip = None
+        if noisy:
+            present, h_after = resend_flip_slots(estimation, s, a_e)
+            flip = _net_flip(present, h_after, pbit_e, pphase_e, rng)
+        # Signature (e_i, s_i, a_i[, flip])
+        codes = (estimation.astype(np.int64) * 2 + s) * 2 + a_e
+        codes, radix = _with_flip(codes, (2, 2, 2), flip)
+        outcomes[eve] = run_groups(sim, group_codes(codes, radix, finish(resend_qubit)), rng)
+    guess = plan['guess']
+    if guess.any():
+        outcomes[guess] = b ^ rng.randint(0, 2, (int(guess.sum()), n), dtype=np.uint8)
+    return ((c == b ^ outcomes) & plan['detected']).sum(axis=1)
+
+def simulate_matches(sim, a, b, c, decisions, attack=True, pbit=0.0, pphase=0.0, transpiled=False, rng=np.random,
+                     detected=None):
+    '''
+    Number of challenge bits Bob recovers in a batch of rounds, one per row of c.
+
+    decisions[k] == 0 is an honest round; otherwise Eve answers, either with the
+    a XOR b intercept-resend attack (attack=True) or by random guessing. Every
+    measurement stage of the batch is one grouped_run call. pbit and pphase are
+    the flip probabilities of QZKP_noise_flip.py, fixed or one per row of c
+    (drifting noise, see noise_schedule); with transpiled=True each
+    distinct circuit is transpiled for sim (once, see transpiled_builder), as
+    measurements() does in the damping script. detected, a boolean array shaped
+    like c, marks the qubits that reach Bob's detector; only those are
+    simulated and counted (all of them by default).
+    '''
+    return finish_matches(plan_matches(sim, a, b, c, decisions, attack, pbit, pphase, transpiled, rng, detected), rng)
+
+def simulate_rounds(sim, a, b, c, decisions, attack=True, pbit=0.0, pphase=0.0, transpiled=False):
+    '''
+    Match percentages of a batch of rounds, as simulate_matches.
+    '''
+    n = np.shape(c)[1]
+    return simulate_matches(sim, a, b, c, decisions, attack, pbit, pphase, transpiled) / n * 100
+
+def protocol_simulator(protocol, noise=(0.0, 0.0), **options):
+    '''
+    AerSimulator used by a script: with the damping noise model for 'damping'.
+    '''
+    if protocol == 'damping':
+        gamma, lam = noise
+        noise_model = NoiseModel()
+        noise_model.add_all_qubit_quantum_error(phase_amplitude_damping_error(gamma, lam), ['h', 'measure'])
+        return AerSimulator(noise_model=noise_model, **options)
+    return AerSimulator(**options)
+
+_simulators = {}   # (protocol, noise) -> simulator
+
+def cached_simulator(protocol, noise=(0.0, 0.0)):
+    '''
+    protocol_simulator built once per distinct noise value. Only the damping
+    simulator depends on it; the flips are drawn outside the simulator.
+    '''
+    key = (protocol, tuple(float(p) for p in noise) if protocol == 'damping' else None)
+    if key not in _simulators:
+        _simulators[key] = protocol_simulator(protocol, noise)
+    return _simulators[key]
+
+#----------------------------------------
+# Photon loss
+#----------------------------------------
+# Lost photons are erasures: a qubit either reaches Bob's detector, untouched by
+# the loss, or is not detected at all, and Bob knows which. Every qubit crosses
+# the channel twice (to the prover and back) and is then detected, so it is
+# detected with probability transmission**2 * efficiency whoever the prover is.
+# The erasures of a batch are drawn as one mask; lost qubits are neither
+# simulated nor counted, and match percentages are over the detected qubits
+# (NaN for a round that loses them all).
+def detection_probability(loss):
+    transmission, efficiency = loss
+    return transmission ** 2 * efficiency
+
+def survival_mask(shape, loss=None, rng=np.random):
+    '''
+    Boolean array of the qubits Bob detects, for loss = (transmission,
+    efficiency); None (every qubit detected) without loss.
+    '''
+    if loss is None:
+        return None
+    return rng.random_sample(shape) < detection_probability(loss)
+
+def detected_percentages(matches, detected):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return matches / detected * 100
+
+#----------------------------------------
+# Noise schedules
+#----------------------------------------
+# The noise of a run may drift: each parameter is a number, an array with one
+# value per iteration or per block of consecutive iterations, or a function of
+# the time t in [0, 1) of the run (iteration / num_iter). Drifting values are
+# rounded to NOISE_DECIMALS, so a drifting damping run needs one simulator per distinct
+# value (cached_simulator) and costs about the same as a fixed one; flip
+# probabilities are applied per row inside the batch.
+NOISE_DECIMALS = 3
+
+def noise_schedule(noise, num_iter):
+    '''
+    (num_iter, 2) array of the noise parameters of every iteration. noise is a
+    pair of parameters (numbers, arrays or functions of t), a (k, 2) array, or
+    a function of t returning the pair.
+    '''
+    t = np.arange(num_iter) / max(num_iter, 1)
+    if callable(noise):
+        noise = noise(t)
+    if isinstance(noise, np.ndarray) and noise.ndim == 2:
+        noise = noise.T
+    columns = []
+    for p in noise:
+        p = np.asarray(p(t) if callable(p) else p, dtype=float)
+        if p.ndim == 0:
+            p = np.full(num_iter, float(p))
+        elif len(p) != num_iter:
+            p = p[np.arange(num_iter) * len(p) // num_iter]   # One value per block
+        # Only drifting parameters are rounded; a fixed one keeps its exact value
+        columns.append(np.round(p, NOISE_DECIMALS) if len(p) and (p != p[0]).any() else p)
+    return np.column_stack(columns)
+
+def is_fixed(schedule):
+    return len(schedule) == 0 or bool((schedule == schedule[0]).all())
+
+def plan_scheduled(protocol, a, b, dec, noise, attack=True, sim=None, rng=np.random, loss=None, session=None):
+    '''
+    Challenges, erasures and plans (see plan_matches) of a batch of rounds, as
+    scheduled_matches: a list of (rows, plan), one per simulator.
+    '''
+    width = len(a)
+    if protocol == 'damping' and sim is None:
+        values, inverse = np.unique(noise, axis=0, return_inverse=True)
+        groups = [(tuple(values[g]), np.flatnonzero(inverse.ravel() == g)) for g in range(len(values))]
+    else:
+        groups = [(tuple(noise[0]), np.arange(len(dec)))]
+    parts = []
+    for value, rows in groups:
+        group_sim = sim or cached_simulator(protocol, value)
+        c = quantum_random_bits(group_sim, (len(rows), width), rng)
+        detected = survival_mask(c.shape, loss, rng)
+        pbit, pphase = (noise[rows, 0], noise[rows, 1]) if protocol == 'flip' else (0.0, 0.0)
+        parts.append((rows, plan_matches(group_sim, a, b, c, dec[rows], attack, pbit, pphase,
+                                         transpiled=protocol == 'damping', rng=rng, detected=detected,
+                                         session=session)))
+    return parts
+
+def finish_scheduled(parts, count, rng=np.random):
+    matches = np.zeros(count, dtype=np.int64)
+    detected = np.zeros(count, dtype=np.int64)
+    for rows, plan in parts:
+        matches[rows] = finish_matches(plan, rng)
+        detected[rows] = plan['detected'].sum(axis=1)
+    return matches, detected
+
+def scheduled_matches(protocol, a, b, dec, noise, attack=True, sim=None, rng=np.random, loss=None, session=None):
+    '''
+    Matches and detected qubits of a batch of rounds for the key (a, b), one
+    per decision, with the noise of each round given as a row of noise. The
+    challenges and erasures (loss) are drawn here. Damping rounds are split by
+    distinct value, each on its cached simulator; flip rounds run together with
+    per-row probabilities. sim, if given, is used for every round (fixed noise),
+    and session, if given, is the KeySession of (a, b).
+    '''
+    return finish_scheduled(plan_scheduled(protocol, a, b, dec, noise, attack, sim, rng, loss, session), len(dec), rng)
+
+def run_protocol(protocol, a, b, num_iter, noise=(0.0, 0.0), attack=True, sim=None, batch=None, loss=None):
+    '''
+    Decisions and match percentages of num_iter rounds of an iterative script
+    ('attack_ideal', 'damping' or 'flip') for the key (a, b), grouped backend.
+    noise is (gamma, lam) for damping and (pbit, pphase) for flip, fixed or
+    drifting (see noise_schedule); sim is only used with fixed noise. loss, if
+    given, is (transmission, efficiency) (see survival_mask).
+    '''
+    if protocol not in PROTOCOLS:
+        raise ValueError(f'Unknown protocol {protocol!r}. Expected one of: {", ".join(PROTOCOLS)}')
+    schedule = noise_schedule(noise, num_iter)
+    if not is_fixed(schedule):
+        sim = None
+    elif sim is None and num_iter:
+        sim = protocol_simulator(protocol, tuple(schedule[0]))
+    n = len(a)
+    batch = batch or max(1, (1 << 18) // n)
+    decisions, percentages = [], []
+    for start in range(0, num_iter, batch):
+        rows = min(batch, num_iter - start)
+        if protocol == 'attack_ideal':
+            dec = np.ones(rows, dtype=int)
+        else:
+            dec = np.random.randint(0, 2, rows)
+        decisions.append(dec)
+        matches, detected = scheduled_matches(protocol, a, b, dec, schedule[start:start + rows], attack, sim, loss=loss)
+        percentages.append(detected_percentages(matches, detected))
+    return np.concatenate(decisions), np.concatenate(percentages)
+
+def _key_block(key_seed, k, width):
+    rng = np.random.default_rng([key_seed, k])
+    return rng.integers(0, 2, width, dtype=np.uint8), rng.integers(0, 2, width, dtype=np.uint8)
+
+def _block_session(key_seed, k, width):
+    return KeySession(*_key_block(key_seed, k, width))
+
+def block_rounds(protocol, key_length, num_iter, noise=(0.0, 0.0), attack=True, block=4096, sim=None, progress=None,
+                 loss=None, batch=None):
+    '''
+    Decisions and match percentages of num_iter rounds of an iterative script
+    with keys too long to hold as circuits (10^5-10^6 qubits).
+
+    The key is streamed through every stage in blocks of `block` positions and
+    the matches of each block are added up, so peak memory depends on the block
+    size and not on key_length, and time grows linearly with it. Block k of the
+    keys (a, b) comes from a generator seeded with (key seed, k) and is drawn
+    again whenever it is needed, so the keys are never materialized either.
+    noise may drift and qubits may be lost, as in run_protocol. batch is the
+    number of rounds simulated together (2^18 qubits per block by default).
+    '''
+    if protocol not in PROTOCOLS:
+        raise ValueError(f'Unknown protocol {protocol!r}. Expected one of: {", ".join(PROTOCOLS)}')
+    schedule = noise_schedule(noise, num_iter)
+    if not is_fixed(schedule):
+        sim = None
+    elif sim is None and num_iter:
+        sim = protocol_simulator(protocol, tuple(schedule[0]))
+    key_seed = _seed()
+    blocks = range(0, key_length, block)
+    widths = [min(block, key_length - first) for first in blocks]
+    # Few blocks: their sessions are kept for the whole run, otherwise drawn again per batch
+    kept = [_block_session(key_seed, k, width) for k, width in enumerate(widths)] if len(widths) <= SESSIONS else None
+    rows = batch or max(1, (1 << 18) // min(block, key_length))
+    decisions, percentages = [], []
+    for start in range(0, num_iter, rows):
+        count = min(rows, num_iter - start)
+        if protocol == 'attack_ideal':
+            dec = np.ones(count, dtype=int)
+        else:
+            dec = np.random.randint(0, 2, count)
+        matches = np.zeros(count, dtype=np.int64)
+        detected = np.zeros(count, dtype=np.int64)
+        for k, width in enumerate(widths):
+            session = kept[k] if kept else _block_session(key_seed, k, width)
+            block_matches, block_detected = scheduled_matches(protocol, session.a, session.b, dec,
+                                                              schedule[start:start + count], attack, sim, loss=loss,
+                                                              session=session)
+            matches += block_matches
+            detected += block_detected
+        decisions.append(dec)
+        percentages.append(detected_percentages(matches, detected))
+        if progress:
+            progress(start + count)
+    return np.concatenate(decisions), np.concatenate(percentages)
+
+#----------------------------------------
+# Pipelined rounds
+#----------------------------------------
+# run_protocol runs its batches strictly one after another: challenges, noise
+# and distinct circuits are prepared, then simulated, then handed back to be
+# written. pipelined_rounds overlaps the three stages with a producer thread
+# (plan_scheduled), the simulator (finish_scheduled, in the calling thread) and
+# a writer thread (consume), connected by queues of at most `depth` batches:
+# with depth 2, one batch is prepared and one written while the current one
+# runs. Aer and numpy release the GIL while they work, so this pays even on one
+# worker. Every batch draws its random numbers from its own generator, seeded
+# in order by the producer from numpy's global one, so a seeded run gives the
+# same results whatever the timing of the threads.
+_DONE = object()
+
+def _put(stage_queue, item, stop):
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def _get(stage_queue, stop):
+    while not stop.is_set():
+        try:
+            return stage_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+def pipelined_rounds(protocol, a, b, num_iter, noise=(0.0, 0.0), attack=True, sim=None, batch=None,
+                     consume=None, depth=2, loss=None):
+    '''
+    Decisions and match percentages of num_iter rounds, as run_protocol, with
+    preparation, simulation and consume(start, decisions, percentages) of
+    consecutive batches overlapped. consume runs on the writer thread, once
+    per batch and in order; if it is given nothing is kept and None is
+    returned. An error in any stage stops the others and is raised here.
+    '''
+    if protocol not in PROTOCOLS:
+        raise ValueError(f'Unknown protocol {protocol!r}. Expected one of: {", ".join(PROTOCOLS)}')
+    schedule = noise_schedule(noise, num_iter)
+    if not is_fixed(schedule):
+        sim = None
+    elif sim is None and num_iter:
+        sim = protocol_simulator(protocol, tuple(schedule[0]))
+    n = len(a)
+    batch = batch or max(1, (1 << 18) // n)
+    planned, simulated = queue.Queue(depth), queue.Queue(depth)
+    stop = threading.Event()
+    errors = []
+    decisions, percentages = [], []
+
+    def produce():
+        try:
+            for start in range(0, num_iter, batch):
+                rows = min(batch, num_iter - start)
+                rng = np.random.RandomState(_seed())
+                if protocol == 'attack_ideal':
+                    dec = np.ones(rows, dtype=int)
+                else:
+                    dec = rng.randint(0, 2, rows)
+                with STAGE_SECONDS.time(stage='pipeline_plan'):
+                    parts = plan_scheduled(protocol, a, b, dec, schedule[start:start + rows], attack, sim, rng, loss)
+                _put(planned, (start, dec, parts, rng), stop)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        _put(planned, _DONE, stop)
+
+    def write():
+        try:
+            while (item := _get(simulated, stop)) is not _DONE:
+                start, dec, perc = item
+                with STAGE_SECONDS.time(stage='pipeline_write'):
+                    if consume:
+                        consume(start, dec, perc)
+                    else:
+                        decisions.append(dec)
+                        percentages.append(perc)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=produce, daemon=True), threading.Thread(target=write, daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        while (item := _get(planned, stop)) is not _DONE:
+            start, dec, parts, rng = item
+            matches, detected = finish_scheduled(parts, len(dec), rng)
+            _put(simulated, (start, dec, detected_percentages(matches, detected)), stop)
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    _put(simulated, _DONE, stop)
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    if consume:
+        return None
+    if not percentages:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    return np.concatenate(decisions), np.concatenate(percentages)
+
+#----------------------------------------
+# Early decision
+#----------------------------------------
+# Bob accepts a round if its match percentage reaches a threshold, that is if
+# it has at least required = ceil(threshold * n / 100) matches out of n. The
+# outcome is settled as soon as a round has `required` matches (accept) or more
+# than n - required mismatches (reject), whatever the remaining qubits give.
+# early_rounds measures the key in blocks of positions and only simulates the
+# rounds still undecided, so the decisions are those of measuring every qubit
+# while a prover who mismatches early (a dishonest one against a high
+# threshold) costs a few blocks instead of the whole key.
+
+def required_matches(threshold, n):
+    return max(0, int(np.ceil(threshold * n / 100 - 1e-9)))
+
+def early_rounds(protocol, a, b, num_iter, threshold, noise=(0.0, 0.0), attack=True, sim=None, block=32, batch=None,
+                 progress=None):
+    '''
+    Decisions, acceptances, qubits measured and match percentages (over the
+    measured qubits) of num_iter rounds for the key (a, b), each measured block
+    by block until its outcome against threshold (a match percentage) is
+    settled. noise may drift, as in run_protocol. progress, if given, is called
+    with the rounds done.
+    '''
+    if protocol not in PROTOCOLS:
+        raise ValueError(f'Unknown protocol {protocol!r}. Expected one of: {", ".join(PROTOCOLS)}')
+    schedule = noise_schedule(noise, num_iter)
+    if not is_fixed(schedule):
+        sim = None
+    elif sim is None and num_iter:
+        sim = protocol_simulator(protocol, tuple(schedule[0]))
+    a, b = np.asarray(a), np.asarray(b)
+    n = len(a)
+    required = required_matches(threshold, n)
+    sessions = [KeySession(a[first:first + block], b[first:first + block]) for first in range(0, n, block)]
+    batch = batch or max(1, (1 << 18) // n)
+    decisions, matches, measured = [], [], []
+    for start in range(0, num_iter, batch):
+        rows = min(batch, num_iter - start)
+        if protocol == 'attack_ideal':
+            dec = np.ones(rows, dtype=int)
+        else:
+            dec = np.random.randint(0, 2, rows)
+        noise_rows = schedule[start:start + rows]
+        batch_matches = np.zeros(rows, dtype=np.int64)
+        batch_measured = np.zeros(rows, dtype=np.int64)
+        active = np.arange(rows)
+        for session, first in zip(sessions, range(0, n, block)):
+            # Rounds still short of `required` matches and within the mismatch budget
+            active = active[(batch_matches[active] < required)
+                            & (batch_measured[active] - batch_matches[active] <= n - required)]
+            if not len(active):
+                break
+            block_matches, _ = scheduled_matches(protocol, session.a, session.b, dec[active], noise_rows[active],
+                                                 attack, sim, session=session)
+            batch_matches[active] += block_matches
+            batch_measured[active] = first + len(session.a)
+        decisions.append(dec)
+        matches.append(batch_matches)
+        measured.append(batch_measured)
+        if progress:
+            progress(start + rows)
+    if not decisions:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64), np.zeros(0)
+    matches, measured = np.concatenate(matches), np.concatenate(measured)
+    return np.concatenate(decisions), matches >= required, measured, detected_percentages(matches, measured)
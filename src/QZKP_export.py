@@ -0,0 +1,146 @@
+import pandas as pd
+import gzip
+import os
+
+#----------------------------------------
+# Streaming export of result files
+#----------------------------------------
+FORMATS = ('csv', 'csv.gz', 'json', 'xlsx', 'parquet')
+EXCEL_ROWS = 1048576   # Rows per worksheet in Excel, the header included
+
+class ExportCancelled(Exception):
+    pass
+
+def count_rows(csv_file, block_size=1 << 20):
+    '''
+    Data rows of a CSV file, counted in constant memory.
+    '''
+    lines = 0
+    last = b'\n'
+    with open(csv_file, 'rb') as f:
+        while block := f.read(block_size):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
+class _CsvWriter:
+    def __init__(self, pathname, compressed=False):
+        self.f = gzip.open(pathname, 'wt', newline='') if compressed else open(pathname, 'w', newline='')
+        self.header = True
+
+    def write(self, chunk):
+        chunk.to_csv(self.f, index=False, header=self.header)
+        self.header = False
+
+    def close(self):
+        self.f.close()
+
+class _JsonWriter:
+    '''
+    Same output as df.to_json(orient='records', indent=4), one chunk at a time.
+    '''
+    def __init__(self, pathname):
+        self.f = open(pathname, 'w', encoding='utf-8')
+        self.first = True
+        self.f.write('[')
+
+    def write(self, chunk):
+        body = chunk.to_json(orient='records', indent=4)[1:-2]
+        self.f.write(body if self.first else ',' + body)
+        self.first = False
+
+    def close(self):
+        self.f.write(']' if self.first else '\n]')
+        self.f.close()
+
+class _ExcelWriter:
+    '''
+    openpyxl write-only workbook: rows are flushed to disk as they are appended.
+    Rows past Excel's limit continue on Sheet2, Sheet3, ..., each with the header.
+    '''
+    def __init__(self, pathname, sheet_rows=EXCEL_ROWS):
+        from openpyxl import Workbook
+        self.pathname = pathname
+        self.wb = Workbook(write_only=True)
+        self.sheet_rows = sheet_rows
+        self.ws = None
+        self.rows = 0
+
+    def write(self, chunk):
+        for row in chunk.itertuples(index=False):
+            if self.ws is None or self.rows == self.sheet_rows:
+                self.ws = self.wb.create_sheet(f'Sheet{len(self.wb.worksheets) + 1}')
+                self.ws.append(list(chunk.columns))
+                self.rows = 1
+            self.ws.append([value.item() if hasattr(value, 'item') else value for value in row])
+            self.rows += 1
+
+    def close(self):
+        if self.ws is None:
+            self.wb.create_sheet('Sheet1')
+        self.wb.save(self.pathname)
+
+class _ParquetWriter:
+    def __init__(self, pathname):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Parquet export needs pyarrow (pip install pyarrow).')
+        self.pa, self.pq = pa, pq
+        self.pathname = pathname
+        self.writer = None
+
+    def write(self, chunk):
+        table = self.pa.Table.from_pandas(chunk, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.pathname, table.schema, compression='snappy')
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def _writer(pathname, file_ext):
+    if file_ext == 'csv':
+        return _CsvWriter(pathname)
+    if file_ext == 'csv.gz':
+        return _CsvWriter(pathname, compressed=True)
+    if file_ext == 'json':
+        return _JsonWriter(pathname)
+    if file_ext == 'xlsx':
+        return _ExcelWriter(pathname)
+    if file_ext == 'parquet':
+        return _ParquetWriter(pathname)
+    raise ValueError(f'Unknown data format: {file_ext}')
+
+def stream_export(csv_file, pathname, file_ext, progress=None, cancelled=None, chunksize=50000):
+    '''
+    Copy a results CSV to pathname in the given format, chunk by chunk, so
+    memory does not grow with the number of rows.
+
+    progress(done, total) is called after every chunk; if cancelled() returns
+    True the partial file is removed and ExportCancelled is raised.
+    '''
+    total = count_rows(csv_file)
+    writer = _writer(pathname, file_ext)
+    done = 0
+    try:
+        for chunk in pd.read_csv(csv_file, chunksize=chunksize):
+            if cancelled and cancelled():
+                raise ExportCancelled()
+            writer.write(chunk)
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+        writer.close()
+    except BaseException:
+        try:
+            writer.close()
+        finally:
+            if os.path.exists(pathname):
+                os.remove(pathname)
+        raise
+    return done
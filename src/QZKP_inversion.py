@@ -0,0 +1,244 @@
+from QZKP_engine import (protocol_simulator, transpiled_builder, honest_qubit, intercept_qubit,
+                         resend_qubit, run_protocol, quantum_random_bits, FLIP_SLOTS)
+from QZKP_analysis import clopper_pearson
+from qiskit.quantum_info import Operator
+from scipy.optimize import brentq, minimize
+from functools import lru_cache
+import itertools
+import numpy as np
+import sys
+
+#----------------------------------------
+# Single-qubit channels
+#----------------------------------------
+# Every per-qubit circuit of the protocol is evolved exactly as a 2x2 density
+# matrix, with noise given as channels per gate type: channels[gate] is a
+# sequence of (kind, params) applied in order after every gate of that type,
+# and channels['measure'] before the measurement. The kinds are damping
+# (gamma, lambda), flip (pbit, pphase: a bit flip, then a phase flip),
+# depolarizing (p) and readout (p01, p10: an error of the classical outcome).
+# The damping script is the channel list {h, measure: damping} on the
+# transpiled circuits; QZKP_noise compiles any list on the circuits as written.
+CHANNELS = {'damping': 2, 'flip': 2, 'depolarizing': 1, 'readout': 2}   # Parameters of each channel
+_PAULI = {'I': np.eye(2), 'X': np.array([[0, 1], [1, 0]]), 'Y': np.array([[0, -1j], [1j, 0]]), 'Z': np.diag([1, -1])}
+
+def channel_kraus(kind, params):
+    '''
+    Kraus operator sets of a channel, applied one after the other. Raises
+    ValueError for damping with gamma + lambda > 1, which is not a channel.
+    '''
+    if kind == 'damping':
+        gamma, lam = params
+        if gamma + lam > 1:
+            raise ValueError(f'Damping needs gamma + lambda <= 1, got {gamma} + {lam}.')
+        return [[np.array([[1, 0], [0, np.sqrt(1 - gamma - lam)]]),
+                 np.array([[0, np.sqrt(gamma)], [0, 0]]),
+                 np.array([[0, 0], [0, np.sqrt(lam)]])]]
+    if kind == 'flip':
+        pbit, pphase = params
+        return [[np.sqrt(1 - pbit) * _PAULI['I'], np.sqrt(pbit) * _PAULI['X']],
+                [np.sqrt(1 - pphase) * _PAULI['I'], np.sqrt(pphase) * _PAULI['Z']]]
+    p, = params
+    return [[np.sqrt(1 - 3 * p / 4) * _PAULI['I']] + [np.sqrt(p / 4) * _PAULI[k] for k in 'XYZ']]
+
+def _apply(rho, channels):
+    for kind, params in channels:
+        if kind != 'readout':
+            for kraus in channel_kraus(kind, params):
+                rho = sum(k @ rho @ k.conj().T for k in kraus)
+    return rho
+
+@lru_cache(maxsize=None)
+def circuit_steps(build, signature, transpiled=True):
+    '''
+    (gate name, unitary) steps of the per-qubit circuit of signature up to
+    its measurement, transpiled as in the damping script or as written.
+    '''
+    circuit = build(signature)
+    if transpiled:
+        circuit = transpiled_builder(protocol_simulator('damping', (0.1, 0.05)), build)(signature)
+    steps = []
+    for instruction in circuit.data:
+        name = instruction.operation.name
+        if name == 'measure':
+            break
+        if name != 'barrier':
+            steps.append((name, Operator(instruction.operation).data))
+    return tuple(steps)
+
+def circuit_probability(steps, channels):
+    '''
+    Probability that a one-qubit circuit given by its steps reads 1 under
+    channels {gate: ((kind, params), ...)}.
+    '''
+    rho = np.array([[1, 0], [0, 0]], dtype=complex)
+    for name, unitary in steps:
+        rho = _apply(unitary @ rho @ unitary.conj().T, channels.get(name, ()))
+    p1 = _apply(rho, channels.get('measure', ()))[1, 1].real
+    for kind, params in channels.get('measure', ()):
+        if kind == 'readout':
+            p01, p10 = params
+            p1 = p1 * (1 - p10) + (1 - p1) * p01
+    return float(np.clip(p1, 0, 1))
+
+#----------------------------------------
+# Expected match rates
+#----------------------------------------
+# Every qubit of a round is one of a few single-qubit circuits fixed by its
+# signature, and a, b, c and Eve's bases are uniform. The expected match rate is
+# therefore an exact average over signatures of outcome probabilities, computed
+# here with 2x2 density matrices instead of shots:
+#   damping: the transpiled circuit of the script, with the phase-amplitude
+#            damping channel after every h and before the measurement;
+#   flip:    the noiseless outcome, flipped with the probability that an odd
+#            number of the flips that reach the measurement occur.
+PARAMETERS = {'damping': ('gamma', 'lambda'), 'flip': ('pbit', 'pphase')}
+BOUNDS = {'damping': (0.0, 1.0), 'flip': (0.0, 0.5)}
+
+@lru_cache(maxsize=None)
+def _p1_ideal(build, signature):
+    from qiskit.quantum_info import Statevector
+    circuit = build(signature).remove_final_measurements(inplace=False)
+    return Statevector(circuit).probabilities()[1]
+
+def _net_flip(qs):
+    return (1 - np.prod([1 - 2 * q for q in qs])) / 2
+
+def outcome_probability(protocol, build, signature, params):
+    '''
+    Probability that the per-qubit circuit of signature measures 1.
+    '''
+    if protocol == 'damping':
+        damping = (('damping', tuple(params)),)
+        return circuit_probability(circuit_steps(build, signature), {'h': damping, 'measure': damping})
+    p1 = _p1_ideal(build, signature)
+    if protocol == 'flip':
+        pbit, pphase = params
+        present, h_after = FLIP_SLOTS[build](*signature)
+        f = _net_flip([pbit if h % 2 == 0 else pphase for h in h_after[present]])
+        p1 = p1 * (1 - f) + (1 - p1) * f
+    return p1
+
+def expected_rates(protocol, params):
+    '''
+    Expected honest and intercept-resend match rates (fractions) for noise params.
+    '''
+    honest = np.mean([1 - outcome_probability(protocol, honest_qubit, (a, b, c), params) if b ^ c == 0
+                      else outcome_probability(protocol, honest_qubit, (a, b, c), params)
+                      for a, b, c in itertools.product((0, 1), repeat=3)])
+    attack = 0.0
+    for a, b, c, r, s in itertools.product((0, 1), repeat=5):
+        m1 = outcome_probability(protocol, intercept_qubit, (a, b, c, r), params)
+        for m, pm in ((0, 1 - m1), (1, m1)):
+            o1 = outcome_probability(protocol, resend_qubit, (a ^ b ^ m, s, a), params)
+            attack += pm * (o1 if b ^ c == 1 else 1 - o1)
+    return honest, attack / 32
+
+#----------------------------------------
+# Inversion
+#----------------------------------------
+def _solve(f, target, low, high):
+    '''
+    Parameter in [low, high] where the decreasing function f equals target, clipped to the bounds.
+    '''
+    if target >= f(low):
+        return low
+    if target <= f(high):
+        return high
+    return brentq(lambda x: f(x) - target, low, high, xtol=1e-10)
+
+def invert_honest(protocol, rate, qubits, free=0, fixed=0.0, confidence=0.95):
+    '''
+    Noise parameter `free` (0 or 1) implied by an honest match rate over `qubits`
+    qubits, with the other parameter fixed. Returns (estimate, low, high), the
+    interval being the Clopper-Pearson interval of the rate mapped through the
+    (monotone) model. Raises ValueError if the rate does not depend on it.
+    '''
+    low, high = BOUNDS[protocol]
+    if protocol == 'damping':
+        high = 1 - fixed
+    def f(x):
+        params = [fixed, fixed]
+        params[free] = x
+        return expected_rates(protocol, params)[0]
+    if abs(f(low) - f(high)) < 1e-12:
+        raise ValueError(f'The honest match rate does not depend on {PARAMETERS[protocol][free]}.')
+    k = round(rate * qubits)
+    rate_low, rate_high = (float(x) for x in clopper_pearson(k, qubits, 1 - confidence))
+    return _solve(f, rate, low, high), _solve(f, rate_high, low, high), _solve(f, rate_low, low, high)
+
+def fit_rates(protocol, honest, honest_qubits, attack, attack_qubits):
+    '''
+    Maximum-likelihood (binomial) fit of both noise parameters to honest and
+    intercept-resend match rates. Returns (params, standard errors), the errors
+    from the inverse Hessian; inf for a parameter the rates do not depend on.
+    '''
+    low, high = BOUNDS[protocol]
+    observed = np.array([honest, attack])
+    qubits = np.array([honest_qubits, attack_qubits])
+    def nll(params):
+        if protocol == 'damping':
+            # The box of the search goes beyond gamma + lambda <= 1: lambda is cut at the edge
+            params = (params[0], min(params[1], 1 - params[0]))
+        p = np.clip(expected_rates(protocol, params), 1e-12, 1 - 1e-12)
+        return -(qubits * (observed * np.log(p) + (1 - observed) * np.log(1 - p))).sum()
+    best = min((minimize(nll, x0, method='L-BFGS-B', bounds=[(low, high)] * 2)
+                for x0 in ([0.01, 0.01], [0.1, 0.1], [0.3, 0.05])), key=lambda r: r.fun)
+    h = 1e-4
+    x = np.clip(best.x, low + h, high - h)
+    hessian = np.empty((2, 2))
+    for i in range(2):
+        for j in range(2):
+            ei, ej = np.eye(2)[i] * h, np.eye(2)[j] * h
+            hessian[i, j] = (nll(x + ei + ej) - nll(x + ei - ej) - nll(x - ei + ej) + nll(x - ei - ej)) / (4 * h * h)
+    errors = np.full(2, np.inf)
+    identified = np.abs(np.diag(hessian)) > 1e-6 * max(np.abs(hessian).max(), 1e-300)
+    if identified.any():
+        sub = hessian[np.ix_(identified, identified)]
+        errors[identified] = np.sqrt(np.clip(np.diag(np.linalg.pinv(sub)), 0, None))
+    return best.x, errors
+
+def confirm(protocol, params, key_length=256, num_iter=2000):
+    '''
+    One Monte Carlo run at the fitted parameters: mean honest and attack match rates (fractions).
+    '''
+    sim = protocol_simulator(protocol, tuple(params))
+    b = quantum_random_bits(sim, key_length)
+    a = quantum_random_bits(sim, key_length)
+    decisions, percentages = run_protocol(protocol, a, b, num_iter, tuple(params), True, sim)
+    return percentages[decisions == 0].mean() / 100, percentages[decisions == 1].mean() / 100
+
+#----------------------------------------
+# Execution
+#----------------------------------------
+if __name__=='__main__':
+
+    # <script> <honest_rate> <qubits> [<attack_rate> <qubits> | <free> <fixed>] [confirm]
+    protocol = sys.argv[1]
+    if protocol not in PARAMETERS:
+        raise SystemExit(f'Unknown script {protocol!r}. Expected damping or flip.')
+    names = PARAMETERS[protocol]
+    rate, qubits = float(sys.argv[2]), int(sys.argv[3])
+    args = [arg for arg in sys.argv[4:] if arg != 'confirm']
+    if len(args) == 2 and args[0] in names:
+        free = names.index(args[0])
+        try:
+            estimate, low, high = invert_honest(protocol, rate, qubits, free, float(args[1]))
+        except ValueError as e:
+            raise SystemExit(str(e))
+        params = [float(args[1])] * 2
+        params[free] = estimate
+        print(f'{names[free]} = {estimate:.6f}  (95% interval {low:.6f} - {high:.6f}), {names[1 - free]} fixed at {args[1]}')
+    elif len(args) == 2:
+        params, errors = fit_rates(protocol, rate, qubits, float(args[0]), int(args[1]))
+        for name, value, error in zip(names, params, errors):
+            print(f'{name} = {value:.6f} +- {error:.6f}' if np.isfinite(error) else f'{name} = {value:.6f} (not identifiable from these rates)')
+    else:
+        estimate, low, high = invert_honest(protocol, rate, qubits)
+        params = [estimate, 0.0]
+        print(f'{names[0]} = {estimate:.6f}  (95% interval {low:.6f} - {high:.6f}), {names[1]} fixed at 0')
+    honest, attack = expected_rates(protocol, params)
+    print(f'Model at the estimate: honest {honest:.6f}, attack {attack:.6f}')
+    if 'confirm' in sys.argv:
+        honest, attack = confirm(protocol, params)
+        print(f'Monte Carlo at the estimate: honest {honest:.6f}, attack {attack:.6f}')
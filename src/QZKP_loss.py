@@ -0,0 +1,97 @@
+from QZKP_engine import cached_simulator, quantum_random_bits, run_protocol, block_rounds, detection_probability
+from QZKP_results import PROTOCOLS, MatchHistogram, parse_points, run_description
+from QZKP_progress import Progress
+import numpy as np
+import pandas as pd
+import sys
+
+#----------------------------------------
+# Loss sweeps
+#----------------------------------------
+# Rounds of an iterative script over a lossy channel (see survival_mask in
+# QZKP_engine), for several transmissions of the channel and one detector
+# efficiency. The erasures are sampled as masks over whole batches of rounds
+# and lost qubits are never simulated, so lower transmissions run faster.
+
+def loss_sweep(protocol, key_length, num_iter, noise, transmissions, efficiency, attack=True, mode='grouped',
+               progress=None):
+    '''
+    Per-round results of every transmission: a DataFrame with Transmission,
+    Iteration, Decision and Percentages (over the detected qubits, NaN for a
+    round that loses them all). progress, if given, is called with the rounds done.
+    '''
+    sim = cached_simulator(protocol, noise)
+    if mode != 'block':
+        b = quantum_random_bits(sim, key_length)
+        a = quantum_random_bits(sim, key_length)
+    parts = []
+    for k, transmission in enumerate(transmissions):
+        loss = (transmission, efficiency)
+        if mode == 'block':
+            decisions, percentages = block_rounds(protocol, key_length, num_iter, noise, attack, sim=sim, loss=loss)
+        else:
+            decisions, percentages = run_protocol(protocol, a, b, num_iter, noise, attack, sim, loss=loss)
+        parts.append(pd.DataFrame({'Transmission': transmission, 'Iteration': np.arange(1, num_iter + 1),
+                                   'Decision': decisions, 'Percentages': percentages}))
+        if progress:
+            progress((k + 1) * num_iter)
+    return pd.concat(parts, ignore_index=True)
+
+def summarize(results, key_length, efficiency):
+    '''
+    Detection probability, expected detected qubits and match statistics of
+    the honest and dishonest rounds, per transmission.
+    '''
+    rows = []
+    for transmission, group in results.groupby('Transmission', sort=False):
+        p = detection_probability((transmission, efficiency))
+        row = {'Transmission': transmission, 'Detection': p, 'Detected qubits': p * key_length,
+               'Lost rounds': int(group['Percentages'].isna().sum())}
+        for decision, label in ((0, 'Honest'), (1, 'Dishonest')):
+            values = group.loc[group['Decision'] == decision, 'Percentages'].dropna()
+            row[f'{label} mean'] = values.mean() if len(values) else np.nan
+            row[f'{label} std'] = values.std() if len(values) > 1 else np.nan
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+#----------------------------------------
+# Execution
+#----------------------------------------
+if __name__=='__main__':
+
+    # <script> <key_length> <num_iterations> <noise_point> <transmissions> <efficiency> <attacker> [mode]
+    protocol = sys.argv[1]
+    if protocol not in PROTOCOLS:
+        raise SystemExit(f'Unknown script {protocol!r}. Expected one of: {", ".join(PROTOCOLS)}')
+    key_length = int(sys.argv[2])
+    num_iter = int(sys.argv[3])
+    noise = parse_points(sys.argv[4])[0]
+    transmissions = [float(t) for t in sys.argv[5].split(',')]
+    efficiency = float(sys.argv[6]) if len(sys.argv) > 6 else 1.0
+    attack = (sys.argv[7] if len(sys.argv) > 7 else 'True') == 'True'
+    mode = sys.argv[8] if len(sys.argv) > 8 else 'grouped'
+    if mode not in ('grouped', 'block'):
+        raise SystemExit(f'Unknown mode {mode!r}. Expected one of: grouped, block')
+    if not all(0 <= t <= 1 for t in transmissions) or not 0 <= efficiency <= 1:
+        raise SystemExit('Transmissions and efficiency must be between 0 and 1.')
+
+    progress = Progress(num_iter * len(transmissions), key_length)
+    results = loss_sweep(protocol, key_length, num_iter, noise, transmissions, efficiency, attack, mode,
+                         progress=progress.update)
+
+    #----------------------------------------
+    # Data
+    #----------------------------------------
+    summary = summarize(results, key_length, efficiency)
+    variant = f'loss transmissions={",".join(str(t) for t in transmissions)} efficiency={efficiency}'
+    histogram = MatchHistogram(key_length, run_description(protocol, attack, noise, variant))
+    detected = results['Percentages'].notna() # Rounds that lost every qubit have no percentage
+    histogram.add(results.loc[detected, 'Decision'].to_numpy(), results.loc[detected, 'Percentages'].to_numpy())
+    if protocol == 'attack_ideal':
+        results = results.drop(columns='Decision')
+    print(f'\nDetector efficiency: {efficiency}\n')
+    print(summary.dropna(axis=1, how='all').to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+    csv_file = f'iter_loss_data_{protocol}_attack={attack}_{key_length}_{num_iter}_{noise[0]}_{noise[1]}_{efficiency}.csv'
+    results.to_csv(csv_file, index=False)
+    histogram.save(csv_file)
+    print(f'\nSaved {csv_file}')
@@ -0,0 +1,162 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+import threading
+import time
+import os
+
+#----------------------------------------
+# Live metrics
+#----------------------------------------
+# Counters, gauges and histograms updated by the engine and the scripts, served
+# in the Prometheus text format on http://<host>:<port>/metrics when the
+# QZKP_METRICS_PORT environment variable is set. The endpoint only listens on
+# the loopback interface unless QZKP_METRICS_HOST names another address (e.g.
+# 0.0.0.0 for a scraper on another machine). Updates are a lock and an
+# addition, so they stay negligible next to a simulator call.
+
+_lock = threading.Lock()
+_metrics = []
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+class Counter:
+    def __init__(self, name, help):
+        self.name, self.help, self.kind = name, help, 'counter'
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        return [(self.name, dict(key), value) for key, value in self.values.items()]
+
+class Gauge(Counter):
+    '''
+    Value set by the code, or computed at scrape time by function() -> {labels tuple: value}.
+    '''
+    def __init__(self, name, help, function=None):
+        super().__init__(name, help)
+        self.kind = 'gauge'
+        self.function = function
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def samples(self):
+        values = self.function() if self.function else self.values
+        return [(self.name, dict(key), value) for key, value in values.items()]
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name, self.help, self.kind = name, help, 'histogram'
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.values = {}
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for k, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[k] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        for key, (counts, total) in self.values.items():
+            labels = dict(key)
+            for bound, count in zip(self.buckets, counts):
+                samples.append((self.name + '_bucket', dict(labels, le='+Inf' if bound == float('inf') else repr(bound)), count))
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, counts[-1]))
+        return samples
+
+def _rss():
+    try:
+        import psutil
+        return {(): psutil.Process().memory_info().rss}
+    except ImportError:
+        import resource
+        return {(): resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+def _hit_ratio():
+    hits = TRANSPILE_CACHE.values.get((('result', 'hit'),), 0)
+    misses = TRANSPILE_CACHE.values.get((('result', 'miss'),), 0)
+    return {(): hits / (hits + misses)} if hits + misses else {}
+
+ITERATIONS = Counter('qzkp_iterations_total', 'Protocol iterations completed')
+QUBITS = Counter('qzkp_qubits_simulated_total', 'Qubits (shots) simulated')
+SIMULATOR_CALLS = Counter('qzkp_simulator_calls_total', 'Calls to sim.run')
+TRANSPILE_CACHE = Counter('qzkp_transpile_cache_total', 'Transpile cache lookups by result')
+KEY_SESSIONS = Counter('qzkp_key_session_total', 'Key session lookups by result')
+TRANSPILE_HIT_RATIO = Gauge('qzkp_transpile_cache_hit_ratio', 'Fraction of transpile cache lookups that hit', _hit_ratio)
+STAGE_SECONDS = Histogram('qzkp_stage_seconds', 'Latency of engine stages',
+                          (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60))
+MATCH_RATE = Gauge('qzkp_match_rate_mean', 'Mean match percentage so far by group')
+RSS = Gauge('process_resident_memory_bytes', 'Resident memory of the process', _rss)
+
+def render():
+    lines = []
+    with _lock:
+        for metric in _metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+
+def start_server(port, host='127.0.0.1'):
+    '''
+    Serve /metrics on a background thread (once per process); returns the server.
+    '''
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+def start_from_environment():
+    '''
+    Start the endpoint if QZKP_METRICS_PORT is set, on QZKP_METRICS_HOST
+    (127.0.0.1 by default). A port already in use (e.g. several local
+    workers) only disables the endpoint of this process.
+    '''
+    port = os.environ.get('QZKP_METRICS_PORT')
+    if port and _server is None:
+        try:
+            start_server(int(port), os.environ.get('QZKP_METRICS_HOST', '127.0.0.1'))
+        except OSError as e:
+            print(f'Metrics endpoint not started on port {port}: {e}')
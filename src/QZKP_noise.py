@@ -0,0 +1,226 @@
+from QZKP_engine import (honest_qubit, intercept_qubit, resend_qubit, key_session, survival_mask,
+                         detected_percentages, quantum_random_bits)
+from QZKP_inversion import CHANNELS, circuit_steps, circuit_probability
+from QZKP_results import MatchHistogram, run_description
+from QZKP_progress import Progress
+from QZKP_metrics import QUBITS, STAGE_SECONDS
+from qiskit_aer import AerSimulator
+from functools import lru_cache
+import itertools
+import numpy as np
+import pandas as pd
+import json
+import sys
+import os
+import re
+
+#----------------------------------------
+# Noise specifications
+#----------------------------------------
+# A noise specification composes channels per gate type: after every x, z or h
+# gate of the protocol (psi_gen, challenge_gen, alice_mod and the basis changes
+# of measurements, as written, before any transpilation) and before every
+# measurement, the channels listed for that gate type are applied in order.
+#   damping=gamma/lambda   phase-amplitude damping (phase_amplitude_damping_error)
+#   flip=pbit/pphase       bit flip, then phase flip
+#   depolarizing=p         depolarizing (depolarizing_error)
+#   readout=p01/p10        classical readout error, on measure only
+# On the command line: 'gates:channel=params+channel=params;gates:...', e.g.
+#   h:damping=0.1/0.05+depolarizing=0.01;x,z:flip=0.01/0.01;measure:readout=0.02/0.02
+# or a .json file {"h": {"damping": [0.1, 0.05], ...}, ...}.
+GATES = ('x', 'z', 'h', 'measure')
+
+def _channel(gate, kind, params):
+    if kind not in CHANNELS:
+        raise ValueError(f'Unknown channel {kind!r}. Expected one of: {", ".join(CHANNELS)}')
+    params = tuple(float(p) for p in np.atleast_1d(params))
+    if len(params) != CHANNELS[kind]:
+        raise ValueError(f'Channel {kind} takes {CHANNELS[kind]} parameters, got {len(params)}.')
+    if not all(0 <= p <= 1 for p in params):
+        raise ValueError(f'Parameters of {kind} must be probabilities, got {params}.')
+    if kind == 'readout' and gate != 'measure':
+        raise ValueError('Readout error only applies to measure.')
+    if kind == 'damping' and sum(params) > 1:
+        raise ValueError(f'Damping needs gamma + lambda <= 1, got {params[0]} + {params[1]}.')
+    return kind, params
+
+def parse_noise(spec):
+    '''
+    Canonical noise specification, ((gate, ((channel, params), ...)), ...) in
+    GATES order, from a string, a .json file or a dict {gate: {channel: params}}.
+    '''
+    if isinstance(spec, tuple):
+        return spec
+    if isinstance(spec, str) and os.path.isfile(spec):
+        with open(spec) as f:
+            spec = json.load(f)
+    if isinstance(spec, str):
+        text, spec = spec, {}
+        for part in filter(None, text.split(';')):
+            gates, _, channels = part.partition(':')
+            for gate in gates.split(','):
+                for channel in filter(None, channels.split('+')):
+                    kind, _, params = channel.partition('=')
+                    spec.setdefault(gate.strip(), {})[kind.strip()] = [float(p) for p in params.split('/')]
+    noise = {}
+    for gate, channels in spec.items():
+        if gate not in GATES:
+            raise ValueError(f'Unknown gate {gate!r}. Expected one of: {", ".join(GATES)}')
+        noise[gate] = tuple(_channel(gate, kind, params) for kind, params in channels.items())
+    return tuple((gate, noise[gate]) for gate in GATES if noise.get(gate))
+
+def noise_label(noise):
+    '''
+    Text of a canonical specification in result file names.
+    '''
+    parts = []
+    for gate, channels in noise:
+        parts.append(gate + '-' + '+'.join(kind + '=' + '-'.join(f'{p:g}' for p in params) for kind, params in channels))
+    return '_'.join(parts) or 'noiseless'
+
+#----------------------------------------
+# Outcome tables
+#----------------------------------------
+# Every qubit follows one of a few gate paths, fixed by its signature (see
+# honest_qubit, intercept_qubit and resend_qubit). A specification is compiled
+# once into the exact probability that each path reads 1, evolving a 2x2
+# density matrix through the gates and channels with the single-qubit model of
+# QZKP_inversion, so sampling a batch is one table lookup and one uniform draw
+# per qubit, whatever the channels.
+PATHS = {'honest': (honest_qubit, 3), 'intercept': (intercept_qubit, 4), 'resend': (resend_qubit, 3)}
+
+@lru_cache(maxsize=64)
+def compile_noise(noise):
+    '''
+    Outcome tables of a canonical specification: for each path, an array
+    indexed by the signature bits with the probability of reading 1.
+    '''
+    with STAGE_SECONDS.time(stage='compile_noise'):
+        tables = {}
+        for path, (build, width) in PATHS.items():
+            table = np.empty((2,) * width)
+            for signature in itertools.product((0, 1), repeat=width):
+                table[signature] = circuit_probability(circuit_steps(build, signature, transpiled=False), dict(noise))
+            tables[path] = table.ravel()
+    return tables
+
+def noise_model(noise):
+    '''
+    Aer NoiseModel equivalent to a specification, for circuits run untranspiled.
+    '''
+    from qiskit_aer.noise import NoiseModel, ReadoutError, depolarizing_error, pauli_error, phase_amplitude_damping_error
+    model = NoiseModel(basis_gates=['x', 'z', 'h'])
+    for gate, channels in noise:
+        error = None
+        for kind, params in channels:
+            if kind == 'readout':
+                p01, p10 = params
+                model.add_all_qubit_readout_error(ReadoutError([[1 - p01, p01], [p10, 1 - p10]]))
+                continue
+            if kind == 'damping':
+                step = phase_amplitude_damping_error(*params)
+            elif kind == 'flip':
+                step = pauli_error([('X', params[0]), ('I', 1 - params[0])]).compose(
+                    pauli_error([('Z', params[1]), ('I', 1 - params[1])]))
+            else:
+                step = depolarizing_error(params[0], 1)
+            error = step if error is None else error.compose(step)
+        if error is not None:
+            model.add_all_qubit_quantum_error(error, [gate])
+    return model
+
+#----------------------------------------
+# Sampled rounds
+#----------------------------------------
+def composite_matches(noise, a, b, c, decisions, attack=True, rng=np.random, detected=None):
+    '''
+    Matches of a batch of rounds under a composite specification, as
+    simulate_matches: every qubit reads 1 with the tabulated probability of its path.
+    '''
+    tables = compile_noise(parse_noise(noise))
+    session = key_session(a, b)
+    c = np.asarray(c, dtype=np.uint8)
+    decisions = np.asarray(decisions)
+    rows, n = c.shape
+    detected = np.ones(c.shape, dtype=bool) if detected is None else np.asarray(detected, dtype=bool)
+    key_code = np.broadcast_to(session.key_code, c.shape)
+    outcomes = np.zeros(c.shape, dtype=np.uint8)
+
+    honest = (decisions == 0)[:, None] & detected
+    if honest.any():
+        p1 = tables['honest'][key_code[honest] * 2 + c[honest]]
+        outcomes[honest] = rng.random_sample(p1.shape) < p1
+
+    eve = ((decisions == 1) & attack)[:, None] & detected
+    if eve.any():
+        a_e = np.broadcast_to(session.a, c.shape)[eve]
+        r = rng.randint(0, 2, a_e.shape)
+        p1 = tables['intercept'][(key_code[eve] * 2 + c[eve]) * 2 + r]
+        estimation = np.broadcast_to(session.x, c.shape)[eve] ^ (rng.random_sample(p1.shape) < p1)
+        s = rng.randint(0, 2, a_e.shape)
+        p1 = tables['resend'][(estimation.astype(np.int64) * 2 + s) * 2 + a_e]
+        outcomes[eve] = rng.random_sample(p1.shape) < p1
+
+    guess = (decisions == 1) & (not attack)
+    if guess.any():
+        outcomes[guess] = session.b ^ rng.randint(0, 2, (int(guess.sum()), n), dtype=np.uint8)
+    QUBITS.inc(int(detected.sum()))
+    return ((c == session.b ^ outcomes) & detected).sum(axis=1)
+
+def composite_rounds(noise, a, b, num_iter, attack=True, batch=None, loss=None, progress=None):
+    '''
+    Decisions and match percentages of num_iter rounds for the key (a, b)
+    under a composite specification, as run_protocol. The challenges are
+    quantum random bits; the rounds themselves need no simulator call.
+    '''
+    noise = parse_noise(noise)
+    coin = AerSimulator()
+    n = len(a)
+    batch = batch or max(1, (1 << 20) // n)
+    decisions, percentages = [], []
+    for start in range(0, num_iter, batch):
+        rows = min(batch, num_iter - start)
+        dec = np.random.randint(0, 2, rows)
+        c = quantum_random_bits(coin, (rows, n))
+        detected = survival_mask(c.shape, loss)
+        matches = composite_matches(noise, a, b, c, dec, attack, detected=detected)
+        decisions.append(dec)
+        percentages.append(detected_percentages(matches, n if detected is None else detected.sum(axis=1)))
+        if progress:
+            progress(start + rows)
+    return np.concatenate(decisions), np.concatenate(percentages)
+
+#----------------------------------------
+# Execution
+#----------------------------------------
+if __name__=='__main__':
+
+    # <key_length> <num_iterations> <noise_spec> <attacker>
+    key_length = int(sys.argv[1])
+    num_iter = int(sys.argv[2])
+    spec = sys.argv[3] if len(sys.argv) > 3 else ''
+    try:
+        noise = parse_noise(spec)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    attack = (sys.argv[4] if len(sys.argv) > 4 else 'True') == 'True'
+
+    sim = AerSimulator()
+    b = quantum_random_bits(sim, key_length)
+    a = quantum_random_bits(sim, key_length)
+    progress = Progress(num_iter, key_length)
+    if attack:
+        print('--- Simulations with attacker ---\n')
+    decisions, percentages = composite_rounds(noise, a, b, num_iter, attack, progress=progress.update)
+
+    #----------------------------------------
+    # Data
+    #----------------------------------------
+    results = pd.DataFrame({'Iteration': range(1, num_iter + 1), 'Decision': decisions, 'Percentages': percentages})
+    label = os.path.splitext(os.path.basename(spec))[0] if os.path.isfile(spec) else noise_label(noise)
+    label = re.sub(r'[^\w.=+-]', '_', label)
+    csv_file = f'iter_composite_error_data_attack={attack}_{key_length}_{num_iter}_{label}.csv'
+    results.to_csv(csv_file, index=False)
+    histogram = MatchHistogram(key_length, run_description('composite', attack, noise_label(noise)))
+    histogram.add(decisions, percentages)
+    histogram.save(csv_file)
@@ -5,9 +5,13 @@ import random
 import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sns
-import time
 import sys
 import pandas as pd
+from QZKP_progress import Progress
+from QZKP_metrics import QUBITS, SIMULATOR_CALLS
+from QZKP_engine import quantum_random_bits, block_rounds, pipelined_rounds, honest_template_rounds, noise_schedule, is_fixed, cached_simulator
+from QZKP_tune import tuned_settings
+from QZKP_results import MatchHistogram, RowWriter, parse_schedule, schedule_label, run_description
 
 #----------------------------------------
 # Auxiliary functions
@@ -23,6 +27,8 @@ def quantum_random_binary_string(length):
         qcoin.measure(0,0)
         exec = sim.run(qcoin, shots=1).result()
         string.append(int(list(exec.get_counts(qcoin).keys())[0]))
+    SIMULATOR_CALLS.inc(length)
+    QUBITS.inc(length)
     return string
 
 
@@ -84,6 +90,8 @@ def measurements(psi, b):
         exec = sim.run(psi[i], shots=1).result()
         result = int(list(exec.get_counts(psi[i]).keys())[0])
         results.append(result)
+    SIMULATOR_CALLS.inc(len(psi))
+    QUBITS.inc(len(psi))
     return results
 
 def equal_entries_percentage(list1, list2):
@@ -103,18 +111,6 @@ def random_binary_string(length):
     '''
     return [random.choice([0, 1]) for _ in range(length)]
 
-def loading_bar(iteration, total, start_time, prefix='Progress:', length=50, fill='█', print_end='\r'):
-    """
-    Progress bar.
-    """
-    percent = 100 * (iteration / total)
-    filled_length = int(length * iteration // total)
-    bar = fill * filled_length + '-' * (length - filled_length)
-    elapsed_time = time.time() - start_time
-    print(f'\r{prefix} |{bar}| {percent:.1f}% Elapsed: {elapsed_time:.1f}s', end=print_end)
-    if iteration == total:
-        print()
-
 #----------------------------------------
 # Protocol execution
 #----------------------------------------
@@ -122,9 +118,17 @@ if __name__=='__main__':
 
     key_length = int(sys.argv[1])
     num_iter = int(sys.argv[2])
-    gamma = float(sys.argv[3]) # Probabilidad of amplitude damping
-    lam = float(sys.argv[4]) # Probability of phase damping
+    gamma = parse_schedule(sys.argv[3]) # Probabilidad of amplitude damping (number, 'start~end' drift or file)
+    lam = parse_schedule(sys.argv[4]) # Probability of phase damping
     attack = bool(sys.argv[5])
+    mode, batch = tuned_settings('damping', key_length, sys.argv[6] if len(sys.argv) > 6 else None) # Tuned profile without a mode
+
+    schedule = noise_schedule((gamma, lam), num_iter) # Noise of every iteration
+    drifting = not is_fixed(schedule)
+    if drifting and mode == 'template':
+        raise SystemExit('Template mode needs fixed noise.')
+    csv_file = f'iter_damping_error_data_attack={attack}_{key_length}_{num_iter}_{schedule_label(sys.argv[3])}_{schedule_label(sys.argv[4])}.csv'
+    gamma, lam = schedule[0]
     
     
     noise_model = NoiseModel()
@@ -133,73 +137,128 @@ if __name__=='__main__':
     sim = AerSimulator(noise_model=noise_model)
     percentages = []
 
-    start_time = time.time()
+    progress = Progress(num_iter, key_length)
+    histogram = MatchHistogram(key_length, run_description('damping', attack, f'{schedule_label(sys.argv[3])}:{schedule_label(sys.argv[4])}'))
 
-    b = quantum_random_binary_string(key_length)
-    a = quantum_random_binary_string(key_length)
+    if mode == 'block':
+        # Keys streamed in blocks through every stage: memory independent of key_length
+        if attack:
+            print('--- Simulations with attacker ---\n')
+        decisions, equal_percentages = block_rounds('damping', key_length, num_iter, schedule, attack, progress=progress.update, batch=batch)
+        percentages = list(zip(equal_percentages.tolist(), decisions.tolist()))
+        histogram.add(decisions, equal_percentages)
+    elif mode == 'pipeline':
+        # Batches prepared, simulated and written by overlapping threads; rows reach the CSV as they finish
+        if attack:
+            print('--- Simulations with attacker ---\n')
+        b = quantum_random_bits(sim, key_length)
+        a = quantum_random_bits(sim, key_length)
+        writer = RowWriter(csv_file)
+        def write_batch(start, decisions, equal_percentages):
+            end = start + len(decisions)
+            rows = {'Iteration': range(start + 1, end + 1), 'Decision': decisions, 'Percentages': equal_percentages}
+            if drifting:
+                rows['Gamma'], rows['Lambda'] = schedule[start:end, 0], schedule[start:end, 1]
+            writer.write(rows)
+            histogram.add(decisions, equal_percentages)
+            progress.update(end)
+        try:
+            pipelined_rounds('damping', a, b, num_iter, schedule, attack, None if drifting else sim, consume=write_batch, batch=batch)
+        finally:
+            writer.close()
+    else:
+        b = quantum_random_binary_string(key_length)
+        a = quantum_random_binary_string(key_length)
 
-    if attack:
-        print('--- Simulations with attacker ---\n')
-        a_xor_b = tuple(i ^ j for i, j in zip(a, b))
+        if attack:
+            print('--- Simulations with attacker ---\n')
+            a_xor_b = tuple(i ^ j for i, j in zip(a, b))
     
-    iter=1
-    for i in range(num_iter):
-        dec = random.choice([0, 1])
-        # 1. Keys generation (this keys could be shared through QKD)
+        if mode == 'template':
+            # Honest rounds share one parameterized circuit for the key, run as batched Aer jobs
+            tsim = AerSimulator(method='matrix_product_state', noise_model=noise_model)
+            decisions = [random.choice([0, 1]) for _ in range(num_iter)]
+            challenges = quantum_random_bits(sim, (num_iter, key_length))
+            honest = [i for i in range(num_iter) if decisions[i] == 0]
+            honest_percentages = dict(zip(honest, honest_template_rounds(tsim, a, b, challenges[honest]).tolist()))
 
-        # 2. Preparation of the challenge (Bob)
-        psi = psi_gen(a, b) # |psi> state generation from a and b
+        iter=1
+        for i in range(num_iter):
+            if mode == 'template':
+                dec = decisions[i]
+                if dec == 0:
+                    percentages.append((honest_percentages[i], dec))
+                    histogram.add(dec, honest_percentages[i])
+                    progress.update(iter)
+                    iter +=1
+                    continue
+            else:
+                dec = random.choice([0, 1])
+            if drifting:
+                sim = cached_simulator('damping', schedule[i])
+            # 1. Keys generation (this keys could be shared through QKD)
 
-        c = quantum_random_binary_string(key_length) # Random generation for c
-        challenge_state = challenge_gen(psi, c, b) # Challenge setup
+            # 2. Preparation of the challenge (Bob)
+            psi = psi_gen(a, b) # |psi> state generation from a and b
 
-        # After this, Bob sends the modified qubits to Alice 
+            if mode == 'template':
+                c = challenges[i].tolist()
+            else:
+                c = quantum_random_binary_string(key_length) # Random generation for c
+            challenge_state = challenge_gen(psi, c, b) # Challenge setup
 
+            # After this, Bob sends the modified qubits to Alice 
 
-        if dec == 0:
-            # Honest prover Alice
 
-            # 3.  Alice modification's
+            if dec == 0:
+                # Honest prover Alice
 
-            proof_state = alice_mod(challenge_state, a, b)
+                # 3.  Alice modification's
 
-            # Alice send the proof state to Bob.
+                proof_state = alice_mod(challenge_state, a, b)
 
-            # 6. Bob retrieves c.
-            b_xor_c = measurements(proof_state, a)
-            c_aprox = tuple(i ^j for i,j in zip(b, b_xor_c))
-            equal_percentage = equal_entries_percentage(c, c_aprox)
-            percentages.append((equal_percentage, dec))
+                # Alice send the proof state to Bob.
 
-        else:
-            if attack == True:
-                # 3. Eve (which has access to a XOR b) meassures the challenge state randomly and generates the attakc estimation
-                r = random_binary_string(key_length)
-                measure_results = measurements(challenge_state, r)
-                attack_estimation = tuple(i ^ j for i,j in zip(a_xor_b, measure_results))
-        
-                # 4. Eve generates the attack state encoding the attack estimaiton with ranodm bassis
-                r = random_binary_string(key_length)
-                attack_state = psi_gen(attack_estimation, r)
-                # 5. Eve sends the attack state to Bob and he measures and count matches
-                results = measurements(attack_state, a)
-                c_aprox = tuple(i ^j for i,j in zip(b, results))
+                # 6. Bob retrieves c.
+                b_xor_c = measurements(proof_state, a)
+                c_aprox = tuple(i ^j for i,j in zip(b, b_xor_c))
                 equal_percentage = equal_entries_percentage(c, c_aprox)
                 percentages.append((equal_percentage, dec))
+
             else:
-                # Dishonest prover Eve
-                c_aprox = random_binary_string(key_length)
-                equal_percentage = equal_entries_percentage(c, c_aprox)
-                percentages.append((equal_percentage, dec))
-        loading_bar(iter, num_iter, start_time)
-        iter +=1
+                if attack == True:
+                    # 3. Eve (which has access to a XOR b) meassures the challenge state randomly and generates the attakc estimation
+                    r = random_binary_string(key_length)
+                    measure_results = measurements(challenge_state, r)
+                    attack_estimation = tuple(i ^ j for i,j in zip(a_xor_b, measure_results))
+        
+                    # 4. Eve generates the attack state encoding the attack estimaiton with ranodm bassis
+                    r = random_binary_string(key_length)
+                    attack_state = psi_gen(attack_estimation, r)
+                    # 5. Eve sends the attack state to Bob and he measures and count matches
+                    results = measurements(attack_state, a)
+                    c_aprox = tuple(i ^j for i,j in zip(b, results))
+                    equal_percentage = equal_entries_percentage(c, c_aprox)
+                    percentages.append((equal_percentage, dec))
+                else:
+                    # Dishonest prover Eve
+                    c_aprox = random_binary_string(key_length)
+                    equal_percentage = equal_entries_percentage(c, c_aprox)
+                    percentages.append((equal_percentage, dec))
+            histogram.add(dec, percentages[-1][0])
+            progress.update(iter)
+            iter +=1
 
     #----------------------------------------
     # Data
     #----------------------------------------
-    equal_percentages = [x[0] for x in percentages]
-    decisions = [x[1] for x in percentages]
+    if mode != 'pipeline': # Already written batch by batch
+        equal_percentages = [x[0] for x in percentages]
+        decisions = [x[1] for x in percentages]
 
-    iters = range(1,num_iter + 1)
-    results = pd.DataFrame({'Iteration': iters, 'Decision': decisions, 'Percentages': equal_percentages})
-    results.to_csv(f'iter_damping_error_data_attack={attack}_{key_length}_{num_iter}_{gamma}_{lam}.csv', index=False)
+        iters = range(1,num_iter + 1)
+        results = pd.DataFrame({'Iteration': iters, 'Decision': decisions, 'Percentages': equal_percentages})
+        if drifting:
+            results['Gamma'], results['Lambda'] = schedule[:, 0], schedule[:, 1]
+        results.to_csv(csv_file, index=False)
+    histogram.save(csv_file)
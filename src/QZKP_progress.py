@@ -0,0 +1,94 @@
+import json
+import os
+import sys
+import time
+from QZKP_metrics import ITERATIONS, start_from_environment
+
+#----------------------------------------
+# Progress reporting
+#----------------------------------------
+MODES = ('terminal', 'json', 'silent')
+
+def _duration(seconds):
+    if seconds is None:
+        return '--'
+    if seconds < 60:
+        return f'{seconds:.1f}s'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h{minutes:02d}m{seconds:02d}s' if hours else f'{minutes}m{seconds:02d}s'
+
+def _rate(value):
+    for unit in ('', 'k', 'M', 'G'):
+        if value < 1000:
+            return f'{value:.1f}{unit}'
+        value /= 1000
+    return f'{value:.1f}T'
+
+class Progress:
+    """
+    Progress reporter for the iterative scripts, replacing loading_bar.
+
+    update(done) may be called every iteration: output is produced at most
+    `rate` times per second (and always for the last iteration). The mode is
+    'terminal' (redrawn bar with throughput and ETA), 'json' (one JSON object
+    per line, for the GUI and batch tools) or 'silent'; by default it is read
+    from the QZKP_PROGRESS environment variable. Completed iterations are also
+    counted in the live metrics (see QZKP_metrics).
+    """
+    def __init__(self, total, qubits_per_iter=0, mode=None, rate=4, prefix='Progress:', length=50, fill='█', stream=None):
+        self.total = total
+        self.qubits_per_iter = qubits_per_iter
+        self.mode = mode or os.environ.get('QZKP_PROGRESS', 'terminal')
+        if self.mode not in MODES:
+            raise ValueError(f'Unknown progress mode {self.mode!r}. Expected one of: {", ".join(MODES)}')
+        self.interval = 1 / rate if rate else 0
+        self.prefix = prefix
+        self.length = length
+        self.fill = fill
+        self.stream = stream or sys.stdout
+        self.start_time = time.time()
+        self.last_report = 0.0
+        self.line_width = 0
+        self.done = 0
+        start_from_environment()
+
+    def stats(self):
+        elapsed = time.time() - self.start_time
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else None
+        return {
+            'done': self.done,
+            'total': self.total,
+            'percent': 100 * self.done / self.total if self.total else 100.0,
+            'elapsed': elapsed,
+            'iter_per_s': rate,
+            'qubits_per_s': rate * self.qubits_per_iter,
+            'eta': eta,
+        }
+
+    def update(self, done):
+        ITERATIONS.inc(done - self.done)
+        self.done = done
+        now = time.time()
+        last = done >= self.total
+        if self.mode == 'silent' or (not last and now - self.last_report < self.interval):
+            return
+        self.last_report = now
+        stats = self.stats()
+        if self.mode == 'json':
+            stats['event'] = 'done' if last else 'progress'
+            self.stream.write(json.dumps(stats) + '\n')
+        else:
+            filled_length = int(self.length * done // self.total) if self.total else self.length
+            bar = self.fill * filled_length + '-' * (self.length - filled_length)
+            throughput = f'{_rate(stats["iter_per_s"])} it/s'
+            if self.qubits_per_iter:
+                throughput += f' {_rate(stats["qubits_per_s"])} qubits/s'
+            line = (f'{self.prefix} |{bar}| {stats["percent"]:.1f}% {throughput} '
+                    f'Elapsed: {_duration(stats["elapsed"])} ETA: {_duration(stats["eta"])}')
+            self.stream.write('\r' + line.ljust(self.line_width))
+            self.line_width = len(line)
+            if last:
+                self.stream.write('\n')
+        self.stream.flush()
@@ -0,0 +1,198 @@
+from QZKP_metrics import MATCH_RATE
+import numpy as np
+import pandas as pd
+import json
+import os
+
+#----------------------------------------
+# Result files and streams
+#----------------------------------------
+PROTOCOLS = ('attack_ideal', 'damping', 'flip')   # Iterative scripts, by their noise
+MODES = ('reference', 'template', 'grouped', 'block', 'pipeline')   # Backends of the iterative scripts
+
+def send_message(f, message):
+    f.write((json.dumps(message) + '\n').encode())
+    f.flush()
+
+def receive_message(f):
+    line = f.readline()
+    if not line:
+        raise ConnectionError('Connection closed')
+    return json.loads(line)
+
+def output_name(protocol, key_length, num_iter, noise, attack):
+    '''
+    CSV name used by the corresponding script.
+    '''
+    if protocol == 'damping':
+        return f'iter_damping_error_data_attack={attack}_{key_length}_{num_iter}_{noise[0]}_{noise[1]}.csv'
+    if protocol == 'flip':
+        return f'iter_flip_error_data_attack={attack}_{key_length}_{num_iter}_{noise[0]}_{noise[1]}.csv'
+    return f'iter_attack_data_{key_length}_{num_iter}.csv'
+
+def parse_points(spec):
+    '''
+    Noise points from 'p1:p2,p1:p2,...'; '-' for the noiseless attack_ideal.
+    '''
+    if spec == '-':
+        return [(0.0, 0.0)]
+    return [tuple(float(p) for p in point.split(':')) for point in spec.split(',')]
+
+def parse_schedule(spec):
+    '''
+    One noise parameter from the command line: a number, 'p0~p1[~p2...]' for a
+    piecewise-linear drift through evenly spaced points of the run, or a .npy,
+    .csv or .txt file with one value per iteration or per block of iterations.
+    '''
+    if os.path.isfile(spec):
+        return np.load(spec) if spec.endswith('.npy') else np.loadtxt(spec, delimiter=',', ndmin=1)
+    if '~' in spec:
+        points = [float(p) for p in spec.split('~')]
+        return lambda t: np.interp(t, np.linspace(0, 1, len(points)), points)
+    return float(spec)
+
+def schedule_label(spec):
+    '''
+    Text of a noise parameter in result file names.
+    '''
+    if os.path.isfile(spec):
+        return os.path.splitext(os.path.basename(spec))[0]
+    return spec if '~' in spec else str(float(spec))
+
+class RowWriter:
+    '''
+    Results CSV written batch by batch, header first, for runs whose rows
+    arrive in order while the simulation goes on (pipelined_rounds).
+    '''
+    def __init__(self, csv_file):
+        self.f = open(csv_file, 'w', newline='')
+        self.header = True
+
+    def write(self, columns):
+        pd.DataFrame(columns).to_csv(self.f, index=False, header=self.header)
+        self.header = False
+
+    def close(self):
+        self.f.close()
+
+#----------------------------------------
+# Histogram sidecar
+#----------------------------------------
+def sidecar_path(csv_file):
+    return os.path.splitext(csv_file)[0] + '.hist.json'
+
+def run_description(script, attack, noise, variant=''):
+    '''
+    Configuration of a run, recorded in its sidecar so that runs of the same
+    configuration can be found and merged (QZKP_roc): noise is a point
+    (p1, p2) or its text, variant any further setting that changes the rounds.
+    '''
+    if script == 'attack_ideal':
+        noise = '-'
+    elif not isinstance(noise, str):
+        noise = ':'.join(str(float(p)) for p in noise)
+    return {'script': script, 'attack': bool(attack), 'noise': noise, 'variant': variant}
+
+class MatchHistogram:
+    '''
+    Histogram of match counts (0..key_length) per group (decision or strategy),
+    updated as rounds finish and saved as a small JSON sidecar next to the
+    results CSV, so plots and summaries need not read every row. config, if
+    given, is the run_description of the run.
+
+    Rounds scored over fewer qubits than the key (lost or unmeasured qubits)
+    have percentages off the k / key_length grid; they are counted apart by
+    exact value, since m / q * 100 is the same float for every equal fraction.
+    '''
+    def __init__(self, key_length, config=None):
+        self.key_length = key_length
+        self.config = config
+        self.groups = {}    # {group: rounds with 0..key_length matches of the whole key}
+        self.partial = {}   # {group: {percentage: rounds}} of the other rounds
+
+    def add(self, group, percentages):
+        '''
+        Count one or more percentages; group is a label or an array of labels.
+        '''
+        percentages = np.atleast_1d(np.asarray(percentages, dtype=float))
+        matches = np.rint(percentages * self.key_length / 100).astype(np.int64)
+        on_grid = matches / self.key_length * 100 == percentages
+        labels = np.broadcast_to(np.asarray(group), matches.shape)
+        for label in np.unique(labels):
+            rows = labels == label
+            label = label.item()
+            counts = self.groups.setdefault(label, np.zeros(self.key_length + 1, dtype=np.int64))
+            counts += np.bincount(matches[rows & on_grid], minlength=self.key_length + 1)
+            if not on_grid[rows].all():
+                partial = self.partial.setdefault(label, {})
+                for value, count in zip(*np.unique(percentages[rows & ~on_grid], return_counts=True)):
+                    partial[value.item()] = partial.get(value.item(), 0) + count.item()
+            values, counts = self.histogram(label)
+            MATCH_RATE.set(values @ counts / counts.sum(), group=label)
+
+    def values(self):
+        return np.arange(self.key_length + 1) / self.key_length * 100
+
+    def histogram(self, group):
+        '''
+        (values, counts) of a group: its distinct match percentages, sorted, and their counts.
+        '''
+        counts = self.groups[group]
+        values, counts = self.values()[counts > 0], counts[counts > 0]
+        partial = self.partial.get(group)
+        if partial:
+            values, inverse = np.unique(np.concatenate([values, list(partial)]), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate([counts, list(partial.values())])).astype(np.int64)
+        return values, counts
+
+    def table(self):
+        '''
+        (values, {group: counts}) of every group over the distinct match
+        percentages of all of them.
+        '''
+        histograms = {group: self.histogram(group) for group in self.groups}
+        values = np.unique(np.concatenate([self.values()] + [v for v, _ in histograms.values()]))
+        table = {}
+        for group, (v, c) in histograms.items():
+            table[group] = np.zeros(len(values), dtype=np.int64)
+            table[group][np.searchsorted(values, v)] = c
+        return values, table
+
+    def summary(self, group):
+        values, counts = self.histogram(group)
+        n = int(counts.sum())
+        mean = values @ counts / n
+        return {
+            'iterations': n,
+            'mean': mean,
+            'std': float(np.sqrt(((values - mean) ** 2) @ counts / (n - 1))) if n > 1 else 0.0,
+            'min': values[0],
+            'max': values[-1],
+        }
+
+    def save(self, csv_file):
+        groups = []
+        for group, counts in self.groups.items():
+            entry = dict(group=group, counts=counts.tolist(), **self.summary(group))
+            if self.partial.get(group):
+                entry['partial'] = sorted([value, count] for value, count in self.partial[group].items())
+            groups.append(entry)
+        with open(sidecar_path(csv_file), 'w') as f:
+            json.dump({'key_length': self.key_length, 'config': self.config, 'groups': groups}, f)
+
+    @classmethod
+    def load(cls, csv_file):
+        '''
+        Sidecar of csv_file, or None if it is missing or older than the CSV.
+        '''
+        path = sidecar_path(csv_file)
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(csv_file):
+            return None
+        with open(path) as f:
+            data = json.load(f)
+        histogram = cls(data['key_length'], data.get('config'))
+        for group in data['groups']:
+            histogram.groups[group['group']] = np.array(group['counts'], dtype=np.int64)
+            if group.get('partial'):
+                histogram.partial[group['group']] = {value: count for value, count in group['partial']}
+        return histogram
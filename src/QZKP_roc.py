@@ -0,0 +1,136 @@
+from QZKP_analysis import load_histograms, HONEST, DISHONEST
+from QZKP_results import MatchHistogram
+import numpy as np
+import pandas as pd
+import glob
+import sys
+import os
+import re
+
+#----------------------------------------
+# Configurations
+#----------------------------------------
+# Result files are grouped by configuration (script, attacker, key length,
+# noise and variant such as loss or early decision), as recorded by the scripts
+# in the histogram sidecar (see run_description), so repeated runs of the same
+# configuration are merged whatever their file names. Each configuration needs
+# honest and dishonest rounds; files with only one of them are skipped.
+
+def configuration(path):
+    '''
+    (script, attack, key_length, noise, variant) of a results file, from its
+    sidecar, or its name if it has no up-to-date sidecar with a configuration.
+    '''
+    sidecar = None if path.endswith('.npy') else MatchHistogram.load(path)
+    if sidecar is not None and sidecar.config:
+        config = sidecar.config
+        return (config['script'], str(config['attack']), sidecar.key_length, config['noise'], config.get('variant', ''))
+    stem = re.sub(r'\.(csv|csv\.gz|json|xlsx|parquet|npy)$', '', os.path.basename(path))
+    return (stem, '', 0, '', '')
+
+#----------------------------------------
+# ROC curves
+#----------------------------------------
+def histogram_matrix(configurations):
+    '''
+    Honest and dishonest counts of every configuration on a common grid of
+    match percentages: (grid, honest (configs, grid), dishonest (configs, grid)).
+    '''
+    grid = np.unique(np.concatenate([values for histograms in configurations for values, _ in histograms.values()]))
+    honest = np.zeros((len(configurations), len(grid)), dtype=np.int64)
+    dishonest = np.zeros_like(honest)
+    for k, histograms in enumerate(configurations):
+        for group, target in ((HONEST, honest), (DISHONEST, dishonest)):
+            values, counts = histograms[group]
+            np.add.at(target[k], np.searchsorted(grid, values), counts)
+    return grid, honest, dishonest
+
+def roc(grid, honest, dishonest):
+    '''
+    False accept and false reject rates of every configuration (rows) when Bob
+    accepts match percentages >= each grid value (columns), from cumulative
+    histograms. A last column with threshold above 100 rejects everything.
+    '''
+    accepted_honest = np.cumsum(honest[:, ::-1], axis=1)[:, ::-1]
+    accepted_dishonest = np.cumsum(dishonest[:, ::-1], axis=1)[:, ::-1]
+    zeros = np.zeros((len(honest), 1))
+    far = np.hstack([accepted_dishonest / dishonest.sum(axis=1, keepdims=True), zeros])
+    frr = np.hstack([1 - accepted_honest / honest.sum(axis=1, keepdims=True), zeros + 1])
+    thresholds = np.append(grid, np.inf)
+    return thresholds, far, frr
+
+def optimize(thresholds, far, frr, max_far=None):
+    '''
+    Best threshold per configuration: minimum FAR + FRR, or, with max_far, the
+    minimum FRR among thresholds whose FAR does not exceed max_far.
+    '''
+    cost = far + frr
+    if max_far is not None:
+        cost = np.where(far <= max_far, frr, np.inf)
+    best = np.argmin(cost, axis=1)
+    rows = np.arange(len(far))
+    # Area under the ROC curve (true accept vs false accept) and equal error rate
+    tar = 1 - frr
+    auc = -np.trapezoid(tar, far, axis=1)
+    eer_index = np.argmin(np.abs(far - frr), axis=1)
+    eer = (far[rows, eer_index] + frr[rows, eer_index]) / 2
+    return thresholds[best], far[rows, best], frr[rows, best], auc, eer
+
+#----------------------------------------
+# Execution
+#----------------------------------------
+if __name__=='__main__':
+
+    # <results files or patterns...> [far=<max false accept rate>] [out=<roc csv>]
+    options = dict(arg.split('=', 1) for arg in sys.argv[1:] if arg.startswith(('far=', 'out=')))
+    paths = sorted({path for arg in sys.argv[1:] if not arg.startswith(('far=', 'out='))
+                    for path in (glob.glob(arg) or [arg])})
+    paths = [path for path in paths if not path.endswith('.hist.json')]
+    max_far = float(options['far']) if 'far' in options else None
+
+    merged = {}
+    for path in paths:
+        key = configuration(path)
+        for group, (values, counts) in load_histograms(path).items():
+            parts = merged.setdefault(key, {}).setdefault(group, [])
+            parts.append((values, counts))
+    labels, configurations = [], []
+    for key, groups in sorted(merged.items()):
+        if HONEST not in groups or DISHONEST not in groups:
+            print(f'Skipping {" ".join(str(x) for x in key if x != "")}: needs honest and dishonest rounds')
+            continue
+        histograms = {}
+        for group in (HONEST, DISHONEST):
+            values = np.concatenate([v for v, _ in groups[group]])
+            counts = np.concatenate([c for _, c in groups[group]])
+            values, inverse = np.unique(values, return_inverse=True)
+            histograms[group] = (values, np.bincount(inverse, weights=counts).astype(np.int64))
+        labels.append(key)
+        configurations.append(histograms)
+    if not configurations:
+        raise SystemExit('No result sets with honest and dishonest rounds.')
+
+    grid, honest, dishonest = histogram_matrix(configurations)
+    thresholds, far, frr = roc(grid, honest, dishonest)
+    best, best_far, best_frr, auc, eer = optimize(thresholds, far, frr, max_far)
+
+    summary = pd.DataFrame(labels, columns=['Script', 'Attack', 'Key length', 'Noise', 'Variant'])
+    summary['Honest'] = honest.sum(axis=1)
+    summary['Dishonest'] = dishonest.sum(axis=1)
+    summary['Threshold'] = best
+    summary['FAR'] = best_far
+    summary['FRR'] = best_frr
+    summary['AUC'] = auc
+    summary['EER'] = eer
+    criterion = f'minimum FRR with FAR <= {max_far}' if max_far is not None else 'minimum FAR + FRR'
+    print(f'Optimal acceptance thresholds ({criterion}):\n')
+    print(summary.to_string(index=False, float_format=lambda x: f'{x:.6g}'))
+    if 'out' in options:
+        curves = pd.DataFrame({
+            'Configuration': np.repeat([' '.join(str(x) for x in label if x != '') for label in labels], len(thresholds)),
+            'Threshold': np.tile(thresholds, len(labels)),
+            'FAR': far.ravel(),
+            'FRR': frr.ravel(),
+        })
+        curves.to_csv(options['out'], index=False)
+        print(f'\nROC curves saved to {options["out"]}')
@@ -0,0 +1,275 @@
+from QZKP_results import PROTOCOLS, MODES, parse_points
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import threading
+import math
+import json
+import time
+import sys
+import os
+
+#----------------------------------------
+# Auto-tuning
+#----------------------------------------
+# The fastest way to run an iterative script depends on the machine (cores,
+# memory, Aer build) and on the key length: small batches leave the simulator
+# waiting on Python, large ones cost memory. calibrate() times short probes of
+# every backend that takes a batch size (pipeline and block, plus template for
+# the ideal attack) over a few batch sizes, discards those whose peak resident
+# memory exceeds the budget, and then runs the fastest one in 2, 4, ...
+# processes at once while that keeps paying. The winners are saved per script
+# and key length in a profile (QZKP_PROFILE or ~/.config/qzkp/profile.json)
+# that the iterative scripts read when no mode is given and the GUI reads for
+# its number of concurrent jobs. A profile made on a machine with another
+# number of cores is ignored.
+
+PROFILE = os.environ.get('QZKP_PROFILE', os.path.join(os.path.expanduser('~'), '.config', 'qzkp', 'profile.json'))
+BATCH_QUBITS = (1 << 16, 1 << 18, 1 << 20)   # Candidate batch sizes, in qubits per batch
+TEMPLATE_BINDS = (256, 1024)                 # Candidate parameter binds per Aer job of the template backend
+BLOCK = 4096                                 # Key positions per block of block_rounds
+PROBE_BATCHES = 3                            # Batches timed per probe
+GAIN = 1.05                                  # Speed-up needed to add processes
+NOISE = {'attack_ideal': (0.0, 0.0), 'damping': (0.1, 0.05), 'flip': (0.05, 0.05)}   # Default probe noise
+
+#----------------------------------------
+# Memory
+#----------------------------------------
+def _rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def total_memory_mb():
+    try:
+        import psutil
+        return psutil.virtual_memory().total / 2**20
+    except ImportError:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2**20
+
+class PeakMemory:
+    '''
+    Peak resident memory of the process (MB) while the block runs, sampled
+    every `interval` seconds (the lifetime peak without psutil).
+    '''
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0.0
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak, _rss_mb())
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_mb())
+
+#----------------------------------------
+# Probes
+#----------------------------------------
+def candidates(protocol, key_length):
+    '''
+    (mode, batch) pairs probed for a script and key length, batch being the
+    rounds per batch (parameter binds per Aer job for template).
+    '''
+    pairs = [('pipeline', max(1, qubits // key_length)) for qubits in BATCH_QUBITS]
+    pairs += [('block', max(1, qubits // min(BLOCK, key_length))) for qubits in BATCH_QUBITS]
+    if protocol == 'attack_ideal':
+        pairs += [('template', binds) for binds in TEMPLATE_BINDS]
+    return list(dict.fromkeys(pairs))
+
+def probe(protocol, key_length, mode, batch, noise, attack=True, barrier=None):
+    '''
+    (iterations per second, peak resident memory in MB) of PROBE_BATCHES
+    batches of a backend, after a short warm-up that fills the simulator and
+    circuit caches. barrier, if given, is waited on after the warm-up, so that
+    probes in parallel processes are timed together.
+    '''
+    from QZKP_engine import cached_simulator, quantum_random_bits, pipelined_rounds, block_rounds, attack_template_rounds
+    sim = cached_simulator(protocol, noise)
+    if mode == 'block':
+        run = lambda rows: block_rounds(protocol, key_length, rows, noise, attack, block=BLOCK, sim=sim, batch=batch)
+    else:
+        b = quantum_random_bits(sim, key_length)
+        a = quantum_random_bits(sim, key_length)
+        if mode == 'pipeline':
+            run = lambda rows: pipelined_rounds(protocol, a, b, rows, noise, attack, sim, batch=batch)
+        elif mode == 'template':
+            from qiskit_aer import AerSimulator
+            tsim = AerSimulator(method='matrix_product_state')
+            run = lambda rows: attack_template_rounds(tsim, a, b, quantum_random_bits(sim, (rows, key_length)), batch=batch)
+        else:
+            raise ValueError(f'Unknown mode {mode!r}. Expected pipeline, block or template.')
+    run(min(batch, 16))
+    if barrier is not None:
+        barrier.wait()
+    rows = PROBE_BATCHES * batch
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        run(rows)
+        seconds = time.perf_counter() - start
+    return rows / seconds, memory.peak
+
+def parallel_probe(protocol, key_length, mode, batch, noise, attack, workers):
+    '''
+    Combined iterations per second and summed peak memory (MB) of `workers`
+    processes running the same probe at once.
+    '''
+    context = mp.get_context('spawn')
+    with context.Manager() as manager, ProcessPoolExecutor(workers, mp_context=context) as pool:
+        barrier = manager.Barrier(workers)
+        futures = [pool.submit(probe, protocol, key_length, mode, batch, noise, attack, barrier) for _ in range(workers)]
+        results = [future.result() for future in futures]
+    return sum(rate for rate, _ in results), sum(peak for _, peak in results)
+
+def calibrate(protocol, key_length, noise=None, memory_mb=None, attack=True, report=print):
+    '''
+    Profile entry of the fastest configuration of a script and key length
+    that fits in memory_mb (half the machine's memory by default): mode, batch,
+    workers, iterations per second (of all workers) and peak memory. report is
+    called with one line per probe.
+    '''
+    noise = tuple(noise or NOISE[protocol])
+    memory_mb = memory_mb or total_memory_mb() / 2
+    best = None
+    for mode, batch in candidates(protocol, key_length):
+        rate, peak = probe(protocol, key_length, mode, batch, noise, attack)
+        fits = peak <= memory_mb
+        report(f'{protocol:<12} {key_length:>8} {mode:<9} {batch:>7} {1:>7} {rate:>12.1f} {peak:>9.0f}'
+               + ('' if fits else '  over budget'))
+        if fits and (best is None or rate > best['iterations_per_second']):
+            best = {'mode': mode, 'batch': batch, 'workers': 1, 'iterations_per_second': rate, 'peak_mb': peak}
+    if best is None:
+        raise ValueError(f'No configuration of {protocol} with key length {key_length} fits in {memory_mb:.0f} MB.')
+    workers = 2
+    while workers <= (os.cpu_count() or 1):
+        rate, peak = parallel_probe(protocol, key_length, best['mode'], best['batch'], noise, attack, workers)
+        fits = peak <= memory_mb
+        report(f'{protocol:<12} {key_length:>8} {best["mode"]:<9} {best["batch"]:>7} {workers:>7} {rate:>12.1f} {peak:>9.0f}'
+               + ('' if fits else '  over budget'))
+        if not fits or rate < best['iterations_per_second'] * GAIN:
+            break
+        best.update(workers=workers, iterations_per_second=rate, peak_mb=peak)
+        workers *= 2
+    return best
+
+#----------------------------------------
+# Profile
+#----------------------------------------
+def machine():
+    return {'cores': os.cpu_count() or 1, 'memory_mb': round(total_memory_mb())}
+
+def load_profile(path=None):
+    '''
+    The saved profile, or None if there is none or it was made on a machine
+    with another number of cores.
+    '''
+    try:
+        with open(path or PROFILE) as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return profile if profile.get('machine', {}).get('cores') == machine()['cores'] else None
+
+def save_profile(protocol, entries, memory_mb, path=None):
+    '''
+    Merge the entries of a script ({key_length: entry}) into the saved profile.
+    '''
+    path = path or PROFILE
+    profile = load_profile(path) or {}
+    profile.update(machine=machine(), memory_mb=round(memory_mb))
+    profile.setdefault('scripts', {}).setdefault(protocol, {}).update({str(k): v for k, v in entries.items()})
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Written to a temporary file and renamed, so a script starting meanwhile never reads half a profile
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(profile, f, indent=2)
+    os.replace(temporary, path)
+
+def tuned(protocol, key_length, profile=None):
+    '''
+    Profile entry of a script for the calibrated key length closest to
+    key_length (on a log scale), or None.
+    '''
+    profile = profile if profile is not None else load_profile()
+    entries = (profile or {}).get('scripts', {}).get(protocol)
+    if not entries:
+        return None
+    return entries[min(entries, key=lambda k: abs(math.log2(int(k) / key_length)))]
+
+def tuned_settings(protocol, key_length, mode=None):
+    '''
+    (mode, batch) of a run of an iterative script: with no mode, the tuned
+    backend and batch size ('reference' and None without a profile); with a
+    mode, the tuned batch size if the profile chose that mode, else None.
+    An unknown mode stops the script instead of running the reference backend.
+    '''
+    if mode is not None and mode not in MODES:
+        raise SystemExit(f'Unknown mode {mode!r}. Expected one of: {", ".join(MODES)}')
+    entry = tuned(protocol, key_length)
+    if mode is None:
+        if entry is None:
+            return 'reference', None
+        print(f'Tuned profile: {entry["mode"]} mode, batches of {entry["batch"]}')
+        return entry['mode'], entry['batch']
+    return mode, entry['batch'] if entry and entry['mode'] == mode else None
+
+def tuned_workers(profile=None):
+    '''
+    Concurrent runs recommended by the profile (the fewest over its entries), or None.
+    '''
+    profile = profile if profile is not None else load_profile()
+    workers = [entry['workers'] for entries in (profile or {}).get('scripts', {}).values() for entry in entries.values()]
+    return min(workers) if workers else None
+
+#----------------------------------------
+# Execution
+#----------------------------------------
+if __name__=='__main__':
+
+    command = sys.argv[1]
+    if command == 'calibrate':
+        # calibrate <script> <key_lengths> [noise_point] [memory_mb]
+        protocol = sys.argv[2]
+        if protocol not in PROTOCOLS:
+            raise SystemExit(f'Unknown script {protocol!r}. Expected one of: {", ".join(PROTOCOLS)}')
+        key_lengths = [int(k) for k in sys.argv[3].split(',')]
+        noise = parse_points(sys.argv[4])[0] if len(sys.argv) > 4 else None
+        memory_mb = float(sys.argv[5]) if len(sys.argv) > 5 else total_memory_mb() / 2
+        print(f'{"Script":<12} {"Key":>8} {"Mode":<9} {"Batch":>7} {"Workers":>7} {"Iter/s":>12} {"Peak MB":>9}')
+        try:
+            entries = {k: calibrate(protocol, k, noise, memory_mb) for k in key_lengths}
+        except ValueError as e:
+            raise SystemExit(str(e))
+        save_profile(protocol, entries, memory_mb)
+        for k, entry in entries.items():
+            print(f'\n{protocol}, key length {k}: {entry["mode"]} mode, batches of {entry["batch"]}, '
+                  f'{entry["workers"]} worker(s), {entry["iterations_per_second"]:.1f} iterations/s')
+        print(f'\nSaved {PROFILE}')
+    elif command == 'show':
+        profile = load_profile()
+        if profile is None:
+            raise SystemExit(f'No profile for this machine in {PROFILE}.')
+        print(f'{PROFILE}: {profile["machine"]["cores"]} cores, memory budget {profile["memory_mb"]} MB')
+        for protocol, entries in profile['scripts'].items():
+            for k, entry in sorted(entries.items(), key=lambda item: int(item[0])):
+                print(f'{protocol:<12} {k:>8} {entry["mode"]:<9} {entry["batch"]:>7} {entry["workers"]:>7} '
+                      f'{entry["iterations_per_second"]:>12.1f} {entry["peak_mb"]:>9.0f}')
+    elif command == 'clear':
+        try:
+            os.remove(PROFILE)
+        except FileNotFoundError:
+            pass
+    else:
+        raise SystemExit(f'Unknown command {command!r}. Expected calibrate, show or clear.')
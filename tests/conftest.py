@@ -0,0 +1,7 @@
+import sys
+import os
+
+# The modules are scripts in src/, imported by name as the scripts import each other
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+os.environ.setdefault('QZKP_PROGRESS', 'silent')
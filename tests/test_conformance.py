@@ -0,0 +1,13 @@
+from QZKP_conformance import QUICK_CASES, run_suite
+
+#----------------------------------------
+# Quick conformance
+#----------------------------------------
+# The cheap cases of QZKP_conformance.py with fewer rounds, so every change
+# checks the fast backends against the exact distribution and the reference
+# path. Run the script itself for the full suite.
+
+def test_quick_conformance():
+    table = run_suite(rounds=20, repeat=50, alpha=1e-4, cases=QUICK_CASES, workers=1)
+    failed = table[table['Result'] == 'FAIL']
+    assert failed.empty, failed.to_string(index=False)
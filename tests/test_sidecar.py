@@ -0,0 +1,36 @@
+from QZKP_analysis import load_histograms
+from QZKP_results import sidecar_path
+import numpy as np
+import subprocess
+import glob
+import sys
+import os
+import pytest
+
+from conftest import SRC
+
+#----------------------------------------
+# Histogram sidecars of partial rounds
+#----------------------------------------
+# Loss and early-decision rounds are scored over the detected or measured
+# qubits; the statistics read from their sidecar must be those of the CSV.
+
+RUNS = {
+    'loss': ['QZKP_loss.py', 'damping', '16', '400', '0.1:0.05', '0.8,0.5', '0.9', 'True'],
+    'early': ['QZKP_early.py', 'damping', '16', '400', '0.1:0.05', '90', 'True', '4'],
+}
+
+@pytest.mark.parametrize('run', RUNS)
+def test_sidecar_matches_csv(run, tmp_path):
+    script, *args = RUNS[run]
+    env = dict(os.environ, PYTHONPATH=SRC)
+    subprocess.run([sys.executable, os.path.join(SRC, script), *args], cwd=tmp_path, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    csv_file, = glob.glob(str(tmp_path / f'iter_{run}_data_*.csv'))
+    from_sidecar = load_histograms(csv_file)
+    os.remove(sidecar_path(csv_file))
+    from_csv = load_histograms(csv_file)
+    assert from_sidecar.keys() == from_csv.keys()
+    for group, (values, counts) in from_csv.items():
+        np.testing.assert_array_equal(from_sidecar[group][0], values)
+        np.testing.assert_array_equal(from_sidecar[group][1], counts)